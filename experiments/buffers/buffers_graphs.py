@@ -1,10 +1,7 @@
 #!/usr/bin/env python
 
 import collections
-import glob
-import multiprocessing
 from os import path
-import shelve
 import sys
 # Directory containing this program.
 PROGDIR = path.dirname(path.realpath(__file__))
@@ -19,78 +16,63 @@ import numpy as np
 import simpleplotlib
 simpleplotlib.default_options.rcParams["font.family"] = "Tahoma"
 
+import executor
 import parse_logs
+import profiling
 import python_config
 
-# SR_RACKS = (1, 2)
-SR_RACKS = (2, 3)
 
+@profiling.timed("buffers.get_data")
+def get_data(edr, ptn, key_fnc, msg_len=112, sync=False, exe=None):
+    """
+    Loads the latency percentiles and per-rack pair circuit throughput of the
+    files matching the pattern "ptn" and returns them. The files are analyzed
+    using "exe" (an executor.AnalysisExecutor), which analyzes each file only
+    once and stores the results, so that other graphs of the same files do not
+    require reparsing the logs. If "exe" is None, then a new executor is used.
+    The sequence graph data is not computed, but if a sequence graph of the
+    same files uses the same executor, then both graphs share its analysis
+    (see executor.AnalysisExecutor.analyze()).
+    """
+    own_exe = exe is None
+    if own_exe:
+        exe = executor.AnalysisExecutor(sync)
+    flns = executor.find_logs(edr, [ptn])
+    assert flns, "Found no files for pattern: {}".format(ptn)
+    print("Found files for pattern: {}".format(ptn))
+    for fln in flns:
+        print("    {}".format(fln))
 
-class FileReaderArgs(object):
-    def __init__(self, fln, msg_len):
-        self.fln = fln
-        self.msg_len = msg_len
-
-
-class FileReader(object):
-    def __call__(self, args):
-        """
-        Parses a single results file. "args" is a FileReaderArgs object. Returns
-        tuples of the form (filename, results).
-        """
-        return args.fln, parse_logs.parse_packet_log(args.fln, args.msg_len)
-
-
-def get_data(rdb_filepath, edr, key, files, key_fnc, msg_len=112, sync=False):
-    # Open results database file.
-    rdb = shelve.open(rdb_filepath, protocol=2, writeback=True)
-    data = rdb.get(key)
-
-    if data is None:
-        ptn = path.join(edr, files[key])
-        flns = glob.glob(ptn)
-        assert flns, "Found no files for pattern: {}".format(ptn)
-        print("Found files for pattern: {}".format(ptn))
-        for fln in flns:
-            print("    {}".format(fln))
-
-        args = [FileReaderArgs(fln, msg_len) for fln in flns]
-        if sync:
-            # Single-threaded mode.
-            raw_data = [FileReader()(arg) for arg in args]
-        else:
-            # Multithreaded mode.
-            pool = multiprocessing.Pool()
-            raw_data = pool.map(FileReader(), args)
-            # Clean up pool.
-            pool.close()
-            pool.join()
-
-        data = collections.defaultdict(lambda: collections.defaultdict(dict))
-        for fln, results in raw_data:
-            lbl = key_fnc[key](path.basename(fln))
-            lats, (_, tpt_c, _), _, _ = results
-            data["tpt_c"][lbl] = tpt_c[SR_RACKS]
-            # First, convert from grouping based on combined, circuit, and
-            # packet latency to grouping backed on percentile. Then, extract the
-            # values for a certain percentile. Finally, drop the percentile.
-            data["lat"][50][lbl] = [
-                lt for _, lt in zip(*lats)[parse_logs.PERCENTILES.index(50)]]
-            data["lat"][99][lbl] = [
-                lt for _, lt in zip(*lats)[parse_logs.PERCENTILES.index(99)]]
+    params = executor.get_analysis_params(msg_len)
+    futures = [exe.analyze(fln, params) for fln in flns]
+    with profiling.stage("buffers.parse"):
+        results = {fln: fut.get() for fln, fut in zip(flns, futures)}
+    if own_exe:
+        exe.close()
 
-        # Convert from dictionary to key-value pairs, then sort by the key, then
-        # extract the keys only.
-        data["keys"] = list(zip(*sorted(data["tpt_c"].items()))[0])
-        # Convert from dictionary to key-value pairs, then sort by the key, then
-        # extract the values only.
-        data["lat"][50] = list(zip(*sorted(data["lat"][50].items()))[1])
-        data["lat"][99] = list(zip(*sorted(data["lat"][99].items()))[1])
-        data["tpt_c"] = list(zip(*sorted(data["tpt_c"].items()))[1])
-        # Store the new data in the database.
-        rdb[key] = dict(data)
+    data = collections.defaultdict(lambda: collections.defaultdict(dict))
+    for fln in flns:
+        lbl = key_fnc(path.basename(fln))
+        lats = results[fln]["lats"]
+        tpt_c = results[fln]["tpts_Gbps"][1]
+        # Circuit throughput, indexed by [sender rack, receiver rack].
+        data["tpt_c_pairs"][lbl] = tpt_c
+        # First, convert from grouping based on combined, circuit, and packet
+        # latency to grouping backed on percentile. Then, extract the values
+        # for a certain percentile. Finally, drop the percentile.
+        data["lat"][50][lbl] = [
+            lt for _, lt in zip(*lats)[parse_logs.PERCENTILES.index(50)]]
+        data["lat"][99][lbl] = [
+            lt for _, lt in zip(*lats)[parse_logs.PERCENTILES.index(99)]]
 
-    rdb.close()
+    # Convert from dictionary to key-value pairs, then sort by the key, then
+    # extract the keys only.
+    data["keys"] = list(zip(*sorted(data["tpt_c_pairs"].items()))[0])
+    # Convert from dictionary to key-value pairs, then sort by the key, then
+    # extract the values only.
+    data["lat"][50] = list(zip(*sorted(data["lat"][50].items()))[1])
+    data["lat"][99] = list(zip(*sorted(data["lat"][99].items()))[1])
+    data["tpt_c_pairs"] = list(zip(*sorted(data["tpt_c_pairs"].items()))[1])
     return data
 
 
@@ -140,7 +122,8 @@ def plot_lat(keys, latencies, fln, ylb, ylm=None, xlr=0,
     options.y.label.ylabel = "{} latency ($\mu$s)".format(ylb)
     ylm = ylm if ylm is not None else 1.2 * max([max(line) for line in y])
     options.y.limits = [0, ylm]
-    simpleplotlib.plot(x, y, options)
+    with profiling.stage("buffers.render"):
+        simpleplotlib.plot(x, y, options)
 
 
 def plot_circuit_util(keys, tpts_Gbps_c, fln, xlb, num_racks,
@@ -218,7 +201,8 @@ def plot_circuit_util(keys, tpts_Gbps_c, fln, xlb, num_racks,
         "center" if xlr == 0 else "right"
     options.y.ticks.major.show = True
     options.x.ticks.major.show = False
-    simpleplotlib.plot([np.arange(len(utls))], [utls], options)
+    with profiling.stage("buffers.render"):
+        simpleplotlib.plot([np.arange(len(utls))], [utls], options)
 
 
 def plot_util_vs_latency(tpts, latencies, fln):
@@ -255,39 +239,49 @@ def plot_util_vs_latency(tpts, latencies, fln):
         dotmap.DotMap(locations=[0, 200, 400, 600, 800, 1000]) \
         if "99" in fln else \
         dotmap.DotMap(locations=[0, 100, 200, 300, 400, 500, 600])
-    simpleplotlib.plot(x, y, options)
+    with profiling.stage("buffers.render"):
+        simpleplotlib.plot(x, y, options)
 
 
 def lat(name, edr, odr, ptn, key_fnc, prc, ylb, ylm=None, xlr=0,
-        flt=lambda key: True, msg_len=112, sync=False):
+        flt=lambda key: True, msg_len=112, sync=False, exe=None):
+    """
+    exe: the executor.AnalysisExecutor to parse the data with, or None to use a
+         new one
+    """
     print("Plotting: {}".format(name))
-    # Names are of the form "<number>_<details>_<specific options>". Experiments
-    # where <details> are the same should be based on the same data. Therefore,
-    # use <details> as the database key.
-    basename = name.split("_")[1] if "_" in name else name
-    data = get_data(path.join(edr, "{}.db".format(basename)), edr, basename,
-                    files={basename: ptn}, key_fnc={basename: key_fnc},
-                    msg_len=msg_len, sync=sync)
+    data = get_data(edr, ptn, key_fnc, msg_len, sync, exe)
     plot_lat(data["keys"], data["lat"][prc], name, ylb, ylm, xlr, odr, flt)
     pyplot.close()
 
 
 def util(name, edr, odr, ptn, key_fnc, xlb, num_racks, srt=True, xlr=0, lbs=23,
-         flt=lambda key: True, order=None, msg_len=112, sync=False):
+         flt=lambda key: True, order=None, msg_len=112, sync=False,
+         sr_racks=parse_logs.SR_RACKS, exe=None):
     """
     srt: sort
     xlr: x label rotation (degrees)
     lbs: bar label fontsize
     flt: filter function that takes in a key
+    sr_racks: the (src, dst) rack pair whose circuit utilization to plot
+    exe: the executor.AnalysisExecutor to parse the data with, or None to use a
+         new one
     """
     print("Plotting: {}".format(name))
-    # Names are of the form "<number>_<details>_<specific options>". Experiments
-    # where <details> are the same should be based on the same data. Therefore,
-    # use <details> as the database key.
-    basename = name.split("_")[1] if "_" in name else name
-    data = get_data(path.join(edr, "{}.db".format(basename)), edr, basename,
-                    files={basename: ptn}, key_fnc={basename: key_fnc},
-                    msg_len=msg_len, sync=sync)
-    plot_circuit_util(data["keys"], data["tpt_c"], name, xlb, num_racks, odr,
-                      srt, xlr, lbs, flt, order)
+    data = get_data(edr, ptn, key_fnc, msg_len, sync, exe)
+    # Select the circuit throughput of the requested rack pair.
+    tpt_c = [tpt_c_pairs[sr_racks] for tpt_c_pairs in data["tpt_c_pairs"]]
+    plot_circuit_util(data["keys"], tpt_c, name, xlb, num_racks, odr, srt, xlr,
+                      lbs, flt, order)
     pyplot.close()
+
+
+def get_inputs(edr, ptn, msg_len=112, **kwargs):
+    """
+    Returns the inputs of the graph that lat() or util() creates with the same
+    arguments, as a list of tuples of the form:
+        (filename, analysis parameters)
+    (see executor.AnalysisExecutor.analyze()). Used by build.Figure.
+    """
+    params = executor.get_analysis_params(msg_len)
+    return [(fln, params) for fln in executor.find_logs(edr, [ptn])]
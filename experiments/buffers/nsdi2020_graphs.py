@@ -12,6 +12,8 @@ from os import path
 import sys
 # Directory containing this program.
 PROGDIR = path.dirname(path.realpath(__file__))
+# For build and profiling.
+sys.path.insert(0, path.join(PROGDIR, ".."))
 # For python_config.
 sys.path.insert(0, path.join(PROGDIR, "..", "..", "etc"))
 # For sg.
@@ -22,11 +24,13 @@ import matplotlib
 matplotlib.use("Agg")
 
 import buffers_graphs
+import build
+import profiling
 import python_config
 import sg
 
-# True and False mean that the data parsing will be executed using a single
-# thread and multiple threads, respectively.
+# True and False mean that the data parsing and rendering will be executed
+# using a single thread and multiple threads, respectively.
 SYNC = False
 
 # Experiment parameters.
@@ -125,10 +129,17 @@ YLM_ZOOM_RETCP = YLM_ZOOM_STATIC
 
 
 def main():
+    # "--profile" enables per-stage profiling, and "--profile=<dir>" also
+    # stores a cProfile dump for each parsed file in <dir>.
+    profile_args = [arg for arg in sys.argv if arg.startswith("--profile")]
+    sys.argv = [arg for arg in sys.argv if not arg.startswith("--profile")]
+    if profile_args:
+        profiling.enable(profile_args[-1].split("=", 1)[1]
+                         if "=" in profile_args[-1] else None)
     num_args = len(sys.argv)
     assert num_args == 2 or num_args == 3, \
         ("Expected either one or two arguments: experiment data directory "
-         "[log message size (bytes)]")
+         "[log message size (bytes)] [--profile[=<cProfile dir>]]")
     edr = sys.argv[1]
     if not path.isdir(edr):
         print("The first argument must be a directory, but is: {}".format(edr))
@@ -154,12 +165,25 @@ def main():
              "{}").format(msg_len)
     else:
         msg_len = DEFAULT_MSG_LEN
+    # The graphs to build. Each function below declares one or more graphs,
+    # which are built at the end (see build.run()).
+    figs = []
+
+    def seq(**kwargs):
+        figs.append(build.Figure(sg.seq, sg.seq_inputs, kwargs))
+
+    def lat(**kwargs):
+        figs.append(build.Figure(buffers_graphs.lat, buffers_graphs.get_inputs,
+                                 kwargs))
+
+    def util(**kwargs):
+        figs.append(build.Figure(buffers_graphs.util,
+                                 buffers_graphs.get_inputs, kwargs))
 
     def _1():
         rcf_us = 1000
         day_len_us = 9 * rcf_us
-        sg.seq(
-            sync=SYNC,
+        seq(
             name="1_seq-old-{}".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -178,8 +202,7 @@ def main():
             voq_agg=True)
 
     def _2():
-        sg.seq(
-            sync=SYNC,
+        seq(
             name="2_seq-current-{}".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -194,8 +217,7 @@ def main():
     def _3():
         rcf_us = 1
         day_len_us = 9 * rcf_us
-        sg.seq(
-            sync=SYNC,
+        seq(
             name="3_seq-future-{}".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -214,8 +236,7 @@ def main():
             voq_agg=True)
 
     def _4_1():
-        sg.seq(
-            sync=SYNC,
+        seq(
             name="4-1_seq-current-all",
             edr=edr,
             odr=odr,
@@ -231,8 +252,7 @@ def main():
             ylm=YLM_ZOOM_STATIC)
 
     def _4_2():
-        buffers_graphs.util(
-            sync=SYNC,
+        util(
             name="4-2_util-lat-current-all_util",
             edr=edr,
             odr=odr,
@@ -247,8 +267,7 @@ def main():
             msg_len=msg_len)
 
     def _5_1():
-        sg.seq(
-            sync=SYNC,
+        seq(
             name="5-1_seq-static-{}".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -264,8 +283,7 @@ def main():
             ylm=YLM_ZOOM_STATIC)
 
     def _5_2():
-        buffers_graphs.util(
-            sync=SYNC,
+        util(
             name="5-2_util-lat-static-{}_util".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -277,8 +295,7 @@ def main():
             msg_len=msg_len)
 
     def _5_3():
-        buffers_graphs.lat(
-            sync=SYNC,
+        lat(
             name="5-3_util-lat-static-{}_lat50".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -289,8 +306,7 @@ def main():
             msg_len=msg_len)
 
     def _5_4():
-        buffers_graphs.lat(
-            sync=SYNC,
+        lat(
             name="5-4_util-lat-static-{}_lat99".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -303,8 +319,7 @@ def main():
     def _6_1_1():
         # With and without inset.
         for ins in [None]:
-            sg.seq(
-                sync=SYNC,
+            seq(
                 name="6-1-1_seq-dyn-{}{}".format(
                     CHOSEN_TCP,
                     "_inset" if ins is not None else ""),
@@ -329,8 +344,7 @@ def main():
         for dyn_us in DYNS_TO_EXAMINE:
             # With and without zooming in.
             for xlm_zoom, ylm_zoom in [(XLM_ZOOM, YLM_ZOOM), (None, None)]:
-                sg.seq(
-                    sync=SYNC,
+                seq(
                     name="6-1-3_seq-dyn-{}_{}_chunk{}".format(
                         CHOSEN_TCP, dyn_us, "" \
                         if xlm_zoom is None else "_zoom"),
@@ -350,8 +364,7 @@ def main():
                     log_pos=LOG_POS)
 
     def _6_2():
-        buffers_graphs.util(
-            sync=SYNC,
+        util(
             name="6-2_util-lat-dyn-{}_util".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -365,8 +378,7 @@ def main():
             msg_len=msg_len)
 
     def _6_3():
-        buffers_graphs.lat(
-            sync=SYNC,
+        lat(
             name="6-3_util-lat-dyn-{}_lat50".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -380,8 +392,7 @@ def main():
             msg_len=msg_len)
 
     def _6_4():
-        buffers_graphs.lat(
-            sync=SYNC,
+        lat(
             name="6-4_util-lat-dyn-{}_lat99".format(CHOSEN_TCP),
             edr=edr,
             odr=odr,
@@ -397,8 +408,7 @@ def main():
     def _7_1_1_and_7_2():
         for us in CHOSEN_DYN_uss:
             us_tdf = int(round(us * python_config.TDF))
-            sg.seq(
-                sync=SYNC,
+            seq(
                 name="7-1-1_seq-dyn-all-{}us".format(us),
                 edr=edr,
                 odr=odr,
@@ -410,8 +420,7 @@ def main():
                 msg_len=msg_len,
                 cir_lat_s=CIR_LAT_s,
                 log_pos=LOG_POS)
-            buffers_graphs.util(
-                sync=SYNC,
+            util(
                 name="7-2_util-lat-dyn-all-{}us_util".format(us),
                 edr=edr,
                 odr=odr,
@@ -427,8 +436,7 @@ def main():
 
     def _7_1_2():
         for cc in python_config.CCS:
-            sg.seq(
-                sync=SYNC,
+            seq(
                 name="7-1-2_seq-dyn-{}".format(cc),
                 edr=edr,
                 odr=odr,
@@ -444,8 +452,7 @@ def main():
                 log_pos=LOG_POS)
 
     def _8_1():
-        sg.seq(
-            sync=SYNC,
+        seq(
             name="8-1_seq-static-retcp",
             edr=edr,
             odr=odr,
@@ -461,8 +468,7 @@ def main():
             ylm=YLM_ZOOM_RETCP)
 
     def _8_2():
-        buffers_graphs.util(
-            sync=SYNC,
+        util(
             name="8-2_util-lat-static-retcp_util",
             edr=edr,
             odr=odr,
@@ -474,8 +480,7 @@ def main():
             msg_len=msg_len)
 
     def _8_3():
-        buffers_graphs.lat(
-            sync=SYNC,
+        lat(
             name="8-3_util-lat-static-retcp_lat50",
             edr=edr,
             odr=odr,
@@ -486,8 +491,7 @@ def main():
             msg_len=msg_len)
 
     def _8_4():
-        buffers_graphs.lat(
-            sync=SYNC,
+        lat(
             name="8-4_util-lat-static-retcp_lat99",
             edr=edr,
             odr=odr,
@@ -498,8 +502,7 @@ def main():
             msg_len=msg_len)
 
     def _9_1():
-        sg.seq(
-            sync=SYNC,
+        seq(
             name="9-1_seq-dyn-retcp",
             edr=edr,
             odr=odr,
@@ -518,8 +521,7 @@ def main():
             ylm=YLM_ZOOM_RETCP)
 
     def _9_2():
-        buffers_graphs.util(
-            sync=SYNC,
+        util(
             name="9-2_util-lat-dyn-retcp_util",
             edr=edr,
             odr=odr,
@@ -535,8 +537,7 @@ def main():
             msg_len=msg_len)
 
     def _9_3():
-        buffers_graphs.lat(
-            sync=SYNC,
+        lat(
             name="9-3_util-lat-dyn-retcp_lat50",
             edr=edr,
             odr=odr,
@@ -549,8 +550,7 @@ def main():
             msg_len=msg_len)
 
     def _9_4():
-        buffers_graphs.lat(
-            sync=SYNC,
+        lat(
             name="9-4_util-lat-dyn-retcp_lat99",
             edr=edr,
             odr=odr,
@@ -644,6 +644,14 @@ def main():
     _8()
     _9()
 
+    # Only rebuild graphs whose inputs or parameters changed since the last
+    # build.
+    failed = build.run(figs, SYNC)
+    profiling.print_summary()
+    if failed:
+        print("Failed to build: {}".format(", ".join(failed)))
+        sys.exit(-1)
+
 
 if __name__ == "__main__":
     main()
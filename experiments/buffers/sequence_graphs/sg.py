@@ -1,10 +1,7 @@
 #!/usr/bin/env python
 
 import collections
-import glob
-import multiprocessing
 from os import path
-import shelve
 import sys
 # Directory containing this program.
 PROGDIR = path.dirname(path.realpath(__file__))
@@ -15,49 +12,93 @@ sys.path.insert(0, path.join(PROGDIR, "..", "..", "..", "etc"))
 
 import dotmap
 from matplotlib import pyplot
+import numpy as np
 import simpleplotlib
 simpleplotlib.default_options.rcParams["font.family"] = "Tahoma"
 
+import executor
 import parse_logs
+import profiling
 import python_config
 
 # Kilo-sequence number
 UNITS = 1000.
+# The number of buckets across the visible part of the x-axis into which lines
+# are downsampled before plotting (see downsample_line()). Each bucket keeps at
+# most four points. None means that every point is plotted.
+PLOT_RESOLUTION = 2000
 
 
-class FileReaderArgs(object):
-    def __init__(self, dur, key, fln, time_offset_s, msg_len=112):
-        self.dur = dur
-        self.key = key
-        self.fln = fln
-        self.time_offset_s = time_offset_s
-        self.msg_len = msg_len
+def get_baselines(bounds, rcf_us, pr_KBpus, cr_KBpus):
+    """
+    Returns the optimal and packet-only baselines for the circuit start and end
+    times "bounds" (of the form [<start>, <end>, <start>, <end>, ...]), in
+    microseconds, as a tuple of the form:
+        (optimal, packet only)
+    Each baseline is a piecewise-linear function, stored as a tuple of NumPy
+    arrays of the form (times, values) that holds its knots (see
+    eval_baseline()). The value at time "t" is the maximum amount of data that
+    could have been sent by the end (optimal) or beginning (packet only) of
+    microsecond "t".
 
+    rcf_us: The circuit network reconfiguration delay, in microseconds.
+    pr_KBpus: The rate of the packet network, in KB/us/host.
+    cr_KBpus: The rate of the circuit network, in KB/us/host.
+    """
+    bounds = np.asarray(bounds, dtype=np.float64)
+    starts = bounds[0::2]
+    ends = bounds[1::2]
+    # The optimal baseline has four segments per circuit: a reconfiguration, a
+    # night (packet network only), another reconfiguration, and a day (circuit
+    # network only). During reconfigurations, both networks are offline.
+    times = np.empty(4 * len(starts) + 1)
+    times[0] = 0
+    # The first night starts at time 0. The others start at the end of the
+    # previous day.
+    times[1::4] = np.r_[0, ends[:-1]] + rcf_us
+    times[2::4] = starts - rcf_us
+    times[3::4] = starts
+    times[4::4] = ends
+    durs = np.diff(times)
+    assert (durs >= 0).all(), \
+        ("Each night must be at least two reconfiguration delays long, but the "
+         "circuit bounds are: {}".format(bounds.tolist()))
+    rates = np.tile([0, pr_KBpus, 0, cr_KBpus], len(starts))
+    vals = np.r_[0, np.cumsum(rates * durs)]
+    # Drop empty segments (e.g., if there are no reconfigurations).
+    keep = np.r_[True, durs > 0]
+    # Shift by one so that the value at time "t" includes microsecond "t", then
+    # start at time 0.
+    times = times[keep] - 1
+    vals = vals[keep]
+    after = times > 0
+    optimal = (np.r_[0, times[after]],
+               np.r_[np.interp(0, times, vals), vals[after]])
+
+    # Bytes sent if we only used the packet network. (Note that, in this case,
+    # there are no reconfigurations.)
+    last_us = bounds[-1] - 1
+    pkt_only = (np.array([0, last_us]), np.array([0, pr_KBpus * last_us]))
+    return optimal, pkt_only
 
-class FileReader(object):
-    def __call__(self, args):
-        """
-        Parses a single results file. "args" is a FileReaderArgs object. Returns
-        tuples of the form (key, results).
-        """
-        print("Parsing: {}".format(args.fln))
 
-        # Results with flow cleaning.
-        results, bounds, _ = parse_logs.get_seq_data(
-            args.fln, args.dur, args.time_offset_s, args.msg_len, clean=True)
-        # Results without flow cleaning.
-        _, _, chunks = parse_logs.get_seq_data(
-            args.fln, args.dur, args.time_offset_s, args.msg_len, clean=False)
-        # Take the aggregate results and circuit bounds from the cleaned version
-        # and the raw chunk data from the uncleaned version.
-        return args.key, (results, bounds, chunks)
+def eval_baseline(baseline, ts):
+    """
+    Evaluates a baseline from get_baselines() at the times "ts", in
+    microseconds, which may be any array of times. Returns a NumPy array. The
+    values at times outside of the baseline are NaN.
+    """
+    times, vals = baseline
+    return np.interp(ts, times, vals, left=np.nan, right=np.nan)
 
 
 def add_optimal(data, rcf_us=python_config.RECONFIG_DELAY_us):
     """
     Adds the calculated baselines (optimal and packet-only) to the provided data
-    dictionary. Recall that sequence numbers are in terms of bytes, and that
-    during reconfigurations, both the packet and circuit networks are offline.
+    dictionary, in data["baselines"] (see get_baselines()), and adds their keys
+    to the front of data["keys"]. Recall that sequence numbers are in terms of
+    bytes, and that during reconfigurations, both the packet and circuit
+    networks are offline.
 
     rcf_us: The circuit network reconfiguration delay, in microseconds.
     """
@@ -83,184 +124,241 @@ def add_optimal(data, rcf_us=python_config.RECONFIG_DELAY_us):
     factor = 10**9 / 8. / 10**6 / python_config.HOSTS_PER_RACK / UNITS
     pr_KBpus = python_config.PACKET_BW_Gbps * factor
     cr_KBpus = python_config.CIRCUIT_BW_Gbps * factor
+    assert pr_KBpus > 0, \
+        "The packet network rate must be positive, but is: {}".format(pr_KBpus)
 
     # Circuit start and end times, of the form:
     #     [<start>, <end>, <start>, <end>, ...]
     bounds = [int(round(q)) for q in data["circuit_bounds"]]
-    assert len(bounds) % 2 == 0, \
+    assert bounds and len(bounds) % 2 == 0, \
         ("Circuit starts and ends must come in pairs, but the list of them "
          "contains an odd number of elements: {}".format(bounds))
     print("circuit bounds: {}".format(bounds))
 
-    # Each entry is the maximum amount of data that could have been sent up to
-    # the beginning of that time unit.
-    optimal = []
-    for state in xrange(0, len(bounds), 2):
-        # Reconfiguration.
-        last = optimal[-1] if optimal else 0
-        optimal += [last] * rcf_us
-        # Circuit night.
-        if state == 0:
-            # 0 to first day start.
-            optimal += [pr_KBpus * us for us in xrange(
-                1, bounds[state] - (2 * rcf_us) + 1)]
-        else:
-            # Previous day end to current day start.
-            optimal += [optimal[-1] + pr_KBpus * us for us in xrange(
-                1, bounds[state] - bounds[state - 1] - (2 * rcf_us) + 1)]
-        # Reconfiguration.
-        optimal += [optimal[-1]] * rcf_us
-        # Circuit day. Current day start to current day end.
-        optimal += [optimal[-1] + cr_KBpus * us for us in xrange(
-            1, bounds[state + 1] - bounds[state] + 1)]
-    # Bytes sent if we only used the packet network. (Note that, in this case,
-    # there are no reconfigurations.)
-    pkt_only = [pr_KBpus * us for us in xrange(0, bounds[-1])]
-
-    # Verify that in pkt_only, no two adjacent elements are equal.
-    for i in xrange(len(pkt_only) - 1):
-        assert pkt_only[i] != pkt_only[i + 1], \
-            "pkt_only[{}] == pkt_only[{}] == {}".format(
-                i, i + 1, pkt_only[i])
-
+    data["baselines"] = list(get_baselines(bounds, rcf_us, pr_KBpus, cr_KBpus))
     data["keys"].insert(0, "packet only")
-    data["seqs"].insert(0, pkt_only)
     data["keys"].insert(0, "optimal")
-    data["seqs"].insert(0, optimal)
 
 
-def get_data(rdb_filepath, edr, key, ptns, dur, key_fnc, time_offset_s,
-             chunk_mode=None, msg_len=112, sync=False):
+@profiling.timed("sg.get_data")
+def get_data(edr, ptns, dur, key_fnc, time_offset_s, chunk_mode=None,
+             msg_len=112, sync=False, sr_racks=parse_logs.SR_RACKS, exe=None):
     """
-    (Optionally) loads the results for the specified key into the provided
-    database and returns them.
+    Loads the results for the specified files and rack pair and returns them.
+    The files are parsed using "exe" (an executor.AnalysisExecutor), which
+    parses each file only once and stores the results, which cover every rack
+    pair. Therefore, graphing another rack pair or another selection of the
+    same files does not require reparsing the logs. If "exe" is None, then a
+    new executor is used.
     """
-    # Open results database file.
-    rdb = shelve.open(rdb_filepath, protocol=2, writeback=True)
-    data = rdb.get(key)
-
-    if data is None:
-        # For each pattern, extract the matches. Then, flatten them into a
-        # single list.
-        flns = [fln for matches in
-                [glob.glob(path.join(edr, ptn)) for ptn in ptns]
-                for fln in matches]
-        assert flns, "Found no files for patterns: {}".format(ptns)
-        print("Found files for patterns: {}\n{}".format(
-            ptns, "\n".join(["    {}".format(fln) for fln in flns])))
-
-        args = [
-            FileReaderArgs(
-                dur, key_fnc(path.basename(fln)), fln, time_offset_s, msg_len)
-            for fln in flns]
-        if sync:
-            # Single-threaded mode.
-            raw_data = [FileReader()(arg) for arg in args]
-        else:
-            # Multithreaded mode.
-            pool = multiprocessing.Pool()
-            raw_data = pool.map(FileReader(), args)
-            # Clean up pool.
-            pool.close()
-            pool.join()
-
-        data = collections.defaultdict(dict)
-        # raw_data is a list of tuples of the form:
-        #   (key, (results, bounds, chunks))
-        # Each entry corresponds to one line/experiment. The sorting is
-        # important so that, in the final graphs, the mapping between lines and
-        # legend is correct.
-        data["raw_data"] = sorted(raw_data)
-        # The first element that results from unzipping the raw data is a list
-        # of the first entries from each line, which is a list of the keys for
-        # the lines.
-        data["keys"] = list(zip(*data["raw_data"])[0])
-        # Extract the bounds of the first line.
-        data["circuit_bounds"] = data["raw_data"][0][1][1]
-        # First, extract all of the second elements (i.e., drop the keys). Then,
-        # extract the results. Finally, extract the seqs and voqs results
-        # themselves. The final result is a list of lists of results, where each
-        # sublist corresponds to one line.
-        seqs, voqs = zip(*zip(*zip(*data["raw_data"])[1])[0])
-        # Convert the seqs to the correct units.
-        data["seqs"] = [[sy / UNITS for sy in seq_ys]
-                        for seq_ys in seqs]
-        data["voqs"] = voqs
-
-        # Convert the results for each set of original chunk data. Look through
-        # each line.
-        for line, (_, _, chunks_origs) in data["raw_data"]:
-            # Check whether all flows have the same number of chunks. Extract
-            # the number of chunks per flow.
-            num_chunks = {flw: len(chunks_orig)
-                          for flw, chunks_orig in chunks_origs.items()}
-            # Use the number of chunks in the first flow as the target.
-            target_num = num_chunks.values()[0]
-            all_same = True
-            # Check if any flows have a different number of chunks than the
-            # target.
-            for num in num_chunks.values():
-                all_same = all_same and (num == target_num)
-            if not all_same:
-                print(("Warning: The flows in line \"{}\" have differing "
-                       "numbers of chunks:\n  {}").format(line, num_chunks))
-
-            data["chunks_orig"][line] = {}
-            # Look through each flow in this line.
-            for flw, chunks_orig in chunks_origs.items():
-                data["chunks_orig"][line][flw] = []
-                # Look through each chunk in this flow.
-                for chunk_orig in chunks_orig:
-                    seq_xs, seq_ys, voq_xs, voq_ys, chunk_idx = chunk_orig
-                    data["chunks_orig"][line][flw].append(
-                        (seq_xs, [sy / UNITS for sy in seq_ys], voq_xs, voq_ys,
-                         chunk_idx))
-
-        # Select the best chunk for each line (i.e., the chunk with the most
-        # datapoints). Look through each line.
-        for line, chunks_origs in data["chunks_orig"].items():
-            data["chunks_best"][line] = ([], [], [])
-            # Look through flow in this line.
-            for chunks_orig in chunks_origs.values():
-                # Look through each chunk in this flow.
-                for chunk_orig in chunks_orig:
-                    if len(chunk_orig[0]) > len(data["chunks_best"][line][0]):
-                        data["chunks_best"][line] = chunk_orig
-
-        # Store the new data in the database.
-        rdb[key] = data
+    own_exe = exe is None
+    if own_exe:
+        exe = executor.AnalysisExecutor(sync)
+    flns = executor.find_logs(edr, ptns)
+    assert flns, "Found no files for patterns: {}".format(ptns)
+    print("Found files for patterns: {}\n{}".format(
+        ptns, "\n".join(["    {}".format(fln) for fln in flns])))
+
+    # Take the aggregate results and circuit bounds from the cleaned version
+    # and the raw chunk data from the uncleaned version. Both come from a
+    # single analysis of the log, which covers every rack pair and is shared
+    # with the latency and utilization graphs of the same files (see
+    # buffers_graphs.get_data()). The results are a dictionary mapping rack
+    # pair to (results, bounds, chunks).
+    params = executor.get_analysis_params(msg_len, True, dur, time_offset_s)
+    futures = [exe.analyze(fln, params) for fln in flns]
+    results = {}
+    with profiling.stage("sg.parse"):
+        for fln, fut in zip(flns, futures):
+            res = fut.get()
+            assert res["circuit_error"] is None, \
+                "Invalid circuits in {}: {}".format(fln, res["circuit_error"])
+            results[fln] = res["seq"]
+    if own_exe:
+        exe.close()
+
+    # Select the results for the requested rack pair.
+    raw_data = []
+    for fln in flns:
+        line = key_fnc(path.basename(fln))
+        assert sr_racks in results[fln], \
+            "Line \"{}\" has no circuits for rack pair: {}".format(
+                line, sr_racks)
+        raw_data.append((line, results[fln][sr_racks]))
+
+    data = collections.defaultdict(dict)
+    # raw_data is a list of tuples of the form:
+    #   (key, (results, bounds, chunks))
+    # Each entry corresponds to one line/experiment. The sorting is important so
+    # that, in the final graphs, the mapping between lines and legend is
+    # correct. Sort by key only, since the results are arrays.
+    data["raw_data"] = sorted(raw_data, key=lambda line: line[0])
+    # The first element that results from unzipping the raw data is a list of
+    # the first entries from each line, which is a list of the keys for the
+    # lines.
+    data["keys"] = list(zip(*data["raw_data"])[0])
+    # Extract the bounds of the first line.
+    data["circuit_bounds"] = data["raw_data"][0][1][1]
+    # First, extract all of the second elements (i.e., drop the keys). Then,
+    # extract the results. Finally, extract the seqs and voqs results
+    # themselves. The final result is a list of lists of results, where each
+    # sublist corresponds to one line.
+    seqs, voqs = zip(*zip(*zip(*data["raw_data"])[1])[0])
+    # Convert the seqs to the correct units.
+    data["seqs"] = [seq_ys / UNITS for seq_ys in seqs]
+    data["voqs"] = voqs
+
+    # Convert the results for each set of original chunk data. Look through each
+    # line.
+    for line, (_, _, chunks_origs) in data["raw_data"]:
+        # Check whether all flows have the same number of chunks. Extract the
+        # number of chunks per flow.
+        num_chunks = {flw: len(chunks_orig)
+                      for flw, chunks_orig in chunks_origs.items()}
+        # Use the number of chunks in the first flow as the target.
+        target_num = num_chunks.values()[0]
+        all_same = True
+        # Check if any flows have a different number of chunks than the target.
+        for num in num_chunks.values():
+            all_same = all_same and (num == target_num)
+        if not all_same:
+            print(("Warning: The flows in line \"{}\" have differing numbers "
+                   "of chunks:\n  {}").format(line, num_chunks))
+
+        data["chunks_orig"][line] = {}
+        # Look through each flow in this line.
+        for flw, chunks_orig in chunks_origs.items():
+            data["chunks_orig"][line][flw] = []
+            # Look through each chunk in this flow.
+            for chunk_orig in chunks_orig:
+                seq_xs, seq_ys, voq_xs, voq_ys, chunk_idx = chunk_orig
+                data["chunks_orig"][line][flw].append(
+                    (seq_xs, seq_ys / UNITS, voq_xs, voq_ys, chunk_idx))
+
+    # Select the best chunk for each line (i.e., the chunk with the most
+    # datapoints). Look through each line.
+    for line, chunks_origs in data["chunks_orig"].items():
+        data["chunks_best"][line] = ([], [], [])
+        # Look through flow in this line.
+        for chunks_orig in chunks_origs.values():
+            # Look through each chunk in this flow.
+            for chunk_orig in chunks_orig:
+                if len(chunk_orig[0]) > len(data["chunks_best"][line][0]):
+                    data["chunks_best"][line] = chunk_orig
 
     if chunk_mode is not None and chunk_mode != "best":
-        # Select a particular chunk for each line. Store the results in the
-        # database under a unique key so that we can change the selected chunk
-        # without reparsing the data.
-        chunks_selected_key = "chunks_selected_chunk{}".format(chunk_mode)
-        if chunks_selected_key not in data:
-            chunks_selected_data = {}
-            # Look through each line.
-            for line, chunks_origs in data["chunks_orig"].items():
-                chunks_selected_data[line] = {}
-                for flw, chunks_orig in chunks_origs.items():
-                    # Note that if the flows have different numbers of chunks,
-                    # then the nth chunk for one flow may not correspond to the
-                    # nth chunk from another flow. I.e., the chunks that we
-                    # extract here may not be the same across flows. This is one
-                    # of the reasons that if we are looking that the raw chunk
-                    # analysis, then we should run the experiments with only a
-                    # single flow.
-                    chunks_selected_data[line][flw] = chunks_orig[chunk_mode]
-            # Minimize writing to the database by updating "data" and the
-            # database separately.
-            data[chunks_selected_key] = chunks_selected_data
-            rdb[key][chunks_selected_key] = chunks_selected_data
-
-    rdb.close()
+        # Select a particular chunk for each line.
+        chunks_selected_data = {}
+        # Look through each line.
+        for line, chunks_origs in data["chunks_orig"].items():
+            chunks_selected_data[line] = {}
+            for flw, chunks_orig in chunks_origs.items():
+                # Note that if the flows have different numbers of chunks, then
+                # the nth chunk for one flow may not correspond to the nth chunk
+                # from another flow. I.e., the chunks that we extract here may
+                # not be the same across flows. This is one of the reasons that
+                # if we are looking that the raw chunk analysis, then we should
+                # run the experiments with only a single flow.
+                chunks_selected_data[line][flw] = chunks_orig[chunk_mode]
+        data["chunks_selected_chunk{}".format(chunk_mode)] = \
+            chunks_selected_data
     return data
 
 
+def get_bucket_edges(lims, res, ins_lims=None):
+    """
+    Returns the edges of "res" equal-width buckets that span the range "lims",
+    which is a tuple of the form (min, max). If "ins_lims" is not None, then
+    the range that it specifies (e.g., an inset) is split into another "res"
+    buckets. Returns None if "lims" is empty.
+    """
+    lo, hi = lims
+    if not hi > lo:
+        return None
+    edges = np.linspace(lo, hi, res + 1)
+    if ins_lims is not None and ins_lims[1] > ins_lims[0]:
+        edges = np.union1d(edges, np.linspace(ins_lims[0], ins_lims[1],
+                                              res + 1))
+    return edges
+
+
+def downsample_line(xs, ys, edges):
+    """
+    Downsamples a line for plotting, preserving its shape. "edges" are bucket
+    edges along the x-axis (see get_bucket_edges()). Only the first, last,
+    minimum, and maximum points in each bucket are kept, so every peak and
+    trough that would be visible remains. Points outside of the buckets are
+    dropped, except for the one on each side that connects the line to the
+    edge of the plot. Returns a tuple of the form (xs, ys), as NumPy arrays.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if edges is None or len(xs) <= 4 * (len(edges) - 1):
+        return xs, ys
+    if (np.diff(xs) < 0).any():
+        order = np.argsort(xs, kind="mergesort")
+        xs = xs[order]
+        ys = ys[order]
+    # Drop the points outside of the buckets, except for their neighbors.
+    start = max(np.searchsorted(xs, edges[0], "left") - 1, 0)
+    stop = min(np.searchsorted(xs, edges[-1], "right") + 1, len(xs))
+    xs = xs[start:stop]
+    ys = ys[start:stop]
+    if not len(xs):
+        return xs, ys
+    # Since xs is sorted, each bucket is a contiguous run of points.
+    bkts = np.searchsorted(edges, xs, "right")
+    firsts = np.flatnonzero(np.r_[True, bkts[1:] != bkts[:-1]])
+    lasts = np.r_[firsts[1:], len(xs)] - 1
+    # Sorting by bucket and then by y leaves each bucket's points in the same
+    # positions, with its minimum first and its maximum last.
+    by_y = np.lexsort((ys, bkts))
+    keep = np.unique(np.concatenate(
+        [firsts, lasts, by_y[firsts], by_y[lasts]]))
+    return xs[keep], ys[keep]
+
+
+def aggregate_scatter(xs, ys, x_edges, y_edges):
+    """
+    Reduces the points of a scatter plot to at most one per cell of the grid
+    defined by the bucket edges "x_edges" and "y_edges" (see
+    get_bucket_edges()), keeping the first point in each cell. Points in the
+    same cell would overlap when plotted. Returns a tuple of the form
+    (xs, ys), as NumPy arrays.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if x_edges is None or y_edges is None or not len(xs):
+        return xs, ys
+    cells = (np.searchsorted(x_edges, xs, "right") * (len(y_edges) + 1) +
+             np.searchsorted(y_edges, ys, "right"))
+    _, firsts = np.unique(cells, return_index=True)
+    keep = np.sort(firsts)
+    return xs[keep], ys[keep]
+
+
+def _get_lims(lines):
+    """
+    Returns the range, as a tuple of the form (min, max), of the finite values
+    in a list of lists of values.
+    """
+    lims = [(np.nanmin(vals), np.nanmax(vals))
+            for vals in [np.asarray(line, dtype=np.float64) for line in lines]
+            if len(vals) and np.isfinite(vals).any()]
+    if not lims:
+        return 0, 0
+    los, his = zip(*lims)
+    return min(los), max(his)
+
+
 def plot_seq(data, fln, odr=path.join(PROGDIR, "..", "graphs"),
              ins=None, flt=lambda idx, label: True, order=None, xlm=None,
-             ylm=None, chunk_mode=None, voq_agg=False):
+             ylm=None, chunk_mode=None, voq_agg=False, res=PLOT_RESOLUTION):
+    """
+    res: The number of buckets into which to downsample the lines across the
+         visible part of the x-axis (see downsample_line() and
+         aggregate_scatter()), or None to plot every point.
+    """
     assert not voq_agg or chunk_mode is None, \
         "voq_agg=True requires chunk_mode=None!"
     assert not voq_agg or ins is None, "voq_agg=True requires ins=None!"
@@ -269,8 +367,10 @@ def plot_seq(data, fln, odr=path.join(PROGDIR, "..", "graphs"),
     if chunk_mode is None:
         # Plot aggregate metrics for all chunks from all flows in each
         # experiment.
-        seq_ys = data["seqs"]
-        seq_xs = [xrange(len(seq_ys[idx])) for idx in xrange(len(seq_ys))]
+        # The baselines are piecewise linear, so plotting their knots is exact.
+        seq_xs, seq_ys = zip(*data["baselines"])
+        seq_xs = list(seq_xs) + [xrange(len(ys)) for ys in data["seqs"]]
+        seq_ys = list(seq_ys) + data["seqs"]
         keys = data["keys"]
 
         if voq_agg:
@@ -280,9 +380,12 @@ def plot_seq(data, fln, odr=path.join(PROGDIR, "..", "graphs"),
                 *[(xrange(len(voq_ys)), voq_ys) for voq_ys in data["voqs"]])
             plot_voqs = True
     else:
-        # Include the "optimal" and "packet only" lines.
-        lines = [([x for x in xrange(len(seq_ys))], seq_ys)
-                 for seq_ys in data["seqs"][0:2]]
+        # Include the "optimal" and "packet only" lines. Since this is a scatter
+        # plot, evaluate them at every microsecond.
+        lines = []
+        for baseline in data["baselines"]:
+            xs = np.arange(baseline[0][-1] + 1)
+            lines.append((xs, eval_baseline(baseline, xs)))
         if chunk_mode == "best":
             # Plot the best chunk from any flow in each experiment.
             lines.extend(data["chunks_best"].values())
@@ -430,6 +533,29 @@ def plot_seq(data, fln, odr=path.join(PROGDIR, "..", "graphs"),
         voq_ys = real_voq_ys
         options.legend.options.labels = real_ls
 
+    if res is not None and seq_xs:
+        # Downsample the lines before plotting. Rendering every point is slow
+        # and creates huge PDFs, but the points in the same bucket are
+        # indistinguishable.
+        with profiling.stage("sg.downsample"):
+            x_edges = get_bucket_edges(
+                _get_lims(seq_xs) if xlm is None else xlm, res,
+                None if ins is None else ins[0])
+            if chunk_mode is None:
+                seq_xs, seq_ys = zip(*[
+                    downsample_line(sx, sy, x_edges)
+                    for sx, sy in zip(seq_xs, seq_ys)])
+            else:
+                y_edges = get_bucket_edges(
+                    _get_lims(seq_ys) if ylm is None else ylm, res,
+                    None if ins is None else ins[1])
+                seq_xs, seq_ys = zip(*[
+                    aggregate_scatter(sx, sy, x_edges, y_edges)
+                    for sx, sy in zip(seq_xs, seq_ys)])
+            voq_xs, voq_ys = zip(*[
+                (None, None) if vx is None else downsample_line(vx, vy, x_edges)
+                for vx, vy in zip(voq_xs, voq_ys)])
+
     # Set series options. Do this after filtering so that we have an accurate
     # count of the number of series.
     if chunk_mode is None:
@@ -450,7 +576,8 @@ def plot_seq(data, fln, odr=path.join(PROGDIR, "..", "graphs"),
         offset_x, offset_y = options.legend.options.bbox_to_anchor
         options.legend.options.bbox_to_anchor = (offset_x + 0.1, offset_y)
 
-    simpleplotlib.plot(seq_xs, seq_ys, options)
+    with profiling.stage("sg.render"):
+        simpleplotlib.plot(seq_xs, seq_ys, options)
 
     if plot_voqs:
         # Plot the VOQ length on a second y-axis. Modify the active figure
@@ -507,7 +634,8 @@ def plot_seq(data, fln, odr=path.join(PROGDIR, "..", "graphs"),
 def seq(name, edr, odr, ptn, key_fnc, dur, cir_lat_s, ins=None, flt=None, order=None,
         xlm=None, ylm=None, chunk_mode=None, voq_agg=False,
         rcf_us=python_config.RECONFIG_DELAY_us, log_pos="after", msg_len=112,
-        sync=False):
+        sync=False, sr_racks=parse_logs.SR_RACKS, exe=None,
+        res=PLOT_RESOLUTION):
     """ Create a sequence graph.
 
     name: Name of this experiment, which become the output filename.
@@ -536,23 +664,39 @@ def seq(name, edr, odr, ptn, key_fnc, dur, cir_lat_s, ins=None, flt=None, order=
     msg_len: The length of each HSLog message
     sync: True and False mean that the data parsing will be executed using a
           single thread and multiple threads, respectively.
+    sr_racks: The (src, dst) rack pair to plot.
+    exe: The executor.AnalysisExecutor to parse the data with, or None to use a
+         new one.
+    res: The number of buckets into which to downsample the lines across the
+         visible part of the x-axis, or None to plot every point (see
+         plot_seq()).
     """
     print("Plotting: {}".format(name))
-    # Names are of the form "<number>_<details>_<specific options>". Experiments
-    # where <details> are the same should be based on the same data. Therefore,
-    # use <details> as the database key.
-    basename = name.split("_")[1] if "_" in name else name
     data = get_data(
-        rdb_filepath=path.join(edr, "{}.db".format(basename)),
         edr=edr,
-        key=basename,
         ptns=[ptn],
         dur=dur,
         key_fnc=key_fnc,
         time_offset_s=cir_lat_s if log_pos == "after" else 0,
         chunk_mode=chunk_mode,
         msg_len=msg_len,
-        sync=sync)
+        sync=sync,
+        sr_racks=sr_racks,
+        exe=exe)
     add_optimal(data, rcf_us)
-    plot_seq(data, name, odr, ins, flt, order, xlm, ylm, chunk_mode, voq_agg)
+    plot_seq(data, name, odr, ins, flt, order, xlm, ylm, chunk_mode, voq_agg,
+             res)
     pyplot.close()
+
+
+def seq_inputs(edr, ptn, dur, cir_lat_s, log_pos="after", msg_len=112,
+               **kwargs):
+    """
+    Returns the inputs of the graph that seq() creates with the same arguments,
+    as a list of tuples of the form:
+        (filename, analysis parameters)
+    (see executor.AnalysisExecutor.analyze()). Used by build.Figure.
+    """
+    params = executor.get_analysis_params(
+        msg_len, True, dur, cir_lat_s if log_pos == "after" else 0)
+    return [(fln, params) for fln in executor.find_logs(edr, [ptn])]
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+#
+# A make-style build of the figures that a graphing script generates. Each
+# figure is declared as a Figure: a graphing function, its arguments, and a
+# function that returns its inputs (the logs that it reads and how they are
+# analyzed). run() skips the figures whose code, arguments, and inputs hash to
+# the same value as in the last build of their output, analyzes the inputs of
+# the rest once using a shared executor.AnalysisExecutor, and then renders them
+# in parallel processes.
+#
+# A figure's code is identified by the source files of the module that defines
+# its graphing function and of every module that that module uses,
+# transitively, within this repository (e.g., python_config.py). Modules from
+# outside of the repository (e.g., simpleplotlib) are identified by their own
+# files only. Therefore, after editing a submodule of an installed package,
+# delete the output directory's BUILD_STATE file to rebuild everything.
+
+import hashlib
+import json
+import multiprocessing
+import os
+from os import path
+import sys
+import traceback
+import types
+
+import executor
+import parse_logs
+import profiling
+import result_cache
+
+# The number of processes to render figures with. None means one per core.
+BUILD_PROCESSES = None
+# The file in each output directory that records the hash of each figure that
+# was built in that directory.
+BUILD_STATE = ".build_hashes.json"
+# Figure arguments that do not affect the output.
+IGNORED_ARGS = ["exe", "sync"]
+# The root of the repository. See the top of this file.
+REPO_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+
+# The figures being rendered and the executor that they share. Set before the
+# render pool is created, so that its workers inherit them when they are
+# forked. Figures cannot be sent to a pool, since their arguments often
+# include lambdas.
+_FIGURES = []
+_EXE = [None]
+
+
+def _hash_value(sha, val):
+    """
+    Adds "val" to the hash "sha". Functions are hashed by their code, default
+    arguments, and closures, so that equivalent lambdas hash the same. Note
+    that the values of the global variables that a function reads are not
+    included.
+    """
+    if isinstance(val, types.FunctionType):
+        _hash_value(sha, val.func_code)
+        _hash_value(sha, val.func_defaults)
+        _hash_value(sha, [cell.cell_contents
+                          for cell in val.func_closure or []])
+    elif isinstance(val, types.CodeType):
+        sha.update(val.co_code)
+        _hash_value(sha, val.co_consts)
+        _hash_value(sha, val.co_names)
+    elif isinstance(val, dict):
+        sha.update("dict{}".format(len(val)))
+        for key, item in sorted(val.items()):
+            _hash_value(sha, key)
+            _hash_value(sha, item)
+    elif isinstance(val, (list, tuple)):
+        sha.update("{}{}".format(type(val).__name__, len(val)))
+        for item in val:
+            _hash_value(sha, item)
+    else:
+        sha.update(repr(val))
+
+
+def _get_module_file(mod):
+    """
+    Returns the absolute path of the file of the module "mod" (its source file,
+    if there is one), or None if it is built in.
+    """
+    fln = getattr(mod, "__file__", None)
+    if fln is None:
+        return None
+    if fln.endswith((".pyc", ".pyo")) and path.exists(fln[:-1]):
+        fln = fln[:-1]
+    return path.realpath(fln)
+
+
+def get_source_files(fnc):
+    """
+    Returns the sorted files of the module that defines the function "fnc" and
+    of the modules that it uses, which are found through the module-level
+    names of each module: the modules themselves and the modules that define
+    the functions and classes. The modules that are used by modules from
+    outside of REPO_DIR are not included, other than those of "fnc"'s own
+    module.
+    """
+    root = sys.modules[fnc.__module__]
+    todo = [root]
+    seen = set()
+    flns = set()
+    while todo:
+        mod = todo.pop()
+        if mod.__name__ in seen:
+            continue
+        seen.add(mod.__name__)
+        fln = _get_module_file(mod)
+        if fln is None:
+            continue
+        flns.add(fln)
+        if mod is not root and not fln.startswith(REPO_DIR + os.sep):
+            continue
+        for val in vars(mod).values():
+            if isinstance(val, types.ModuleType):
+                todo.append(val)
+            else:
+                name = getattr(val, "__module__", None)
+                if isinstance(name, str) and name in sys.modules:
+                    todo.append(sys.modules[name])
+    return sorted(flns)
+
+
+class Figure(object):
+    """
+    A figure to build. fnc(exe=<executor>, **kwargs) creates the figure's
+    output, "<odr>/<name>.pdf", where "odr" and "name" are arguments in
+    "kwargs". inputs_fnc(**kwargs) returns the figure's inputs, as a list of
+    tuples of the form:
+        (filename, analysis parameters)
+    (see executor.AnalysisExecutor.analyze()).
+    """
+
+    def __init__(self, fnc, inputs_fnc, kwargs):
+        self.fnc = fnc
+        self.inputs_fnc = inputs_fnc
+        self.kwargs = kwargs
+        self.name = kwargs["name"]
+        self.odr = kwargs["odr"]
+        self.output = path.join(self.odr, "{}.pdf".format(self.name))
+
+    def get_inputs(self):
+        return self.inputs_fnc(**self.kwargs)
+
+    def get_hash(self, inputs):
+        """
+        Returns a hash of the figure's code, arguments, and inputs (see
+        get_inputs()). The code is identified by the source files of "fnc" and
+        of the modules that it uses (see get_source_files()) and by the version
+        of parse_logs' results.
+        """
+        sha = hashlib.sha1()
+        _hash_value(sha, (self.fnc.__module__, self.fnc.__name__,
+                          [result_cache.get_file_id(fln)
+                           for fln in get_source_files(self.fnc)],
+                          parse_logs.RESULTS_VERSION))
+        _hash_value(sha, {key: val for key, val in self.kwargs.items()
+                          if key not in IGNORED_ARGS})
+        for fln, params in sorted(inputs, key=lambda inp: inp[0]):
+            _hash_value(sha, (result_cache.get_file_id(fln), params))
+        return sha.hexdigest()
+
+
+def _load_state(odr):
+    """
+    Returns a dictionary mapping the name of each figure last built in "odr" to
+    its hash.
+    """
+    fln = path.join(odr, BUILD_STATE)
+    if not path.exists(fln):
+        return {}
+    try:
+        with open(fln) as fil:
+            return json.load(fil)
+    except (IOError, ValueError) as exc:
+        print("Warning: Unable to read build state {}: {}".format(fln, exc))
+        return {}
+
+
+def _save_state(odr, state):
+    fln = path.join(odr, BUILD_STATE)
+    # Write to a temporary file first so that an interrupted build never leaves
+    # a partially-written state.
+    tmp_fln = "{}.{}.tmp".format(fln, os.getpid())
+    with open(tmp_fln, "w") as fil:
+        json.dump(state, fil, indent=1, sort_keys=True)
+    os.rename(tmp_fln, fln)
+
+
+def _init_render_worker():
+    _EXE[0].detach()
+
+
+def _render(idx):
+    """
+    Renders _FIGURES[idx]. Returns a tuple of the form:
+        (idx, error message, or None if the figure was rendered)
+    """
+    fig = _FIGURES[idx]
+    kwargs = dict(fig.kwargs)
+    kwargs["exe"] = _EXE[0]
+    try:
+        fig.fnc(**kwargs)
+    except Exception:
+        return idx, traceback.format_exc()
+    return idx, None
+
+
+def run(figs, sync=False, processes=BUILD_PROCESSES):
+    """
+    Builds the figures in the list "figs" that are out of date. The inputs of
+    those figures are analyzed in a single executor.AnalysisExecutor first, so
+    that each log is analyzed only once, and then the figures are rendered by a
+    pool of "processes" processes (None means one per core). If "sync" is True,
+    then everything runs in this process. Returns the names of the figures
+    that failed.
+    """
+    exe = executor.AnalysisExecutor(sync)
+    states = {}
+    todo = []
+    for fig in figs:
+        if fig.odr not in states:
+            states[fig.odr] = _load_state(fig.odr)
+        inputs = fig.get_inputs()
+        fig_hash = fig.get_hash(inputs)
+        if (states[fig.odr].get(fig.name) == fig_hash and
+                path.exists(fig.output)):
+            print("Up to date: {}".format(fig.name))
+            profiling.count("build.skipped figures")
+            continue
+        todo.append((fig, inputs, fig_hash))
+    print("Building {} of {} figures".format(len(todo), len(figs)))
+
+    with profiling.stage("build.analyze"):
+        # Submit the jobs that compute the sequence graph data first, so that
+        # the other jobs for the same files can share them (see
+        # executor.AnalysisExecutor.analyze()).
+        futures = [exe.analyze(fln, params) for fln, params in sorted(
+            [inp for _, inputs, _ in todo for inp in inputs],
+            key=lambda inp: not inp[1]["seq"])]
+        for fut in futures:
+            fut.get()
+
+    _FIGURES[:] = [fig for fig, _, _ in todo]
+    _EXE[0] = exe
+    failed = []
+    with profiling.stage("build.render"):
+        if sync:
+            results = [_render(idx) for idx in xrange(len(todo))]
+        else:
+            pool = multiprocessing.Pool(processes, _init_render_worker)
+            results = profiling.pool_map(pool, _render, xrange(len(todo)))
+            # Clean up pool.
+            pool.close()
+            pool.join()
+    for idx, err in results:
+        fig, _, fig_hash = todo[idx]
+        state = states[fig.odr]
+        if err is None:
+            state[fig.name] = fig_hash
+            profiling.count("build.rendered figures")
+        else:
+            print("Failed to build: {}\n{}".format(fig.name, err))
+            state.pop(fig.name, None)
+            failed.append(fig.name)
+    for odr, state in states.items():
+        _save_state(odr, state)
+    exe.close()
+    return failed
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+#
+# Reports how closely the circuits in HSLog files follow a RunSchedule
+# schedule, without parsing the data packets. Usage:
+#     ./circuit_fidelity.py <log message size> <schedule> <logs...>
+# where <schedule> is the schedule given to click_common.setFixedSchedule(), or
+# "none" to compare each rack pair's circuits to their median day and week
+# lengths.
+
+import sys
+
+import parse_logs
+
+
+def main():
+    assert len(sys.argv) >= 4, \
+        ("Expected at least three arguments: log message size (bytes), "
+         "schedule, HSLog file(s)")
+    msg_len = int(sys.argv[1])
+    schedule = None if sys.argv[2] == "none" else sys.argv[2]
+    for fln in sys.argv[3:]:
+        print("Log: {}".format(fln))
+        timelines = parse_logs.get_circuit_timelines(fln, msg_len)
+        for sr_racks, (cir_starts, cir_ends) in sorted(timelines.items()):
+            print("Rack pair: {}".format(sr_racks))
+            parse_logs.print_schedule_fidelity(
+                parse_logs.get_schedule_fidelity(
+                    cir_starts, cir_ends, schedule, sr_racks))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ import numpy as np
 import rpyc
 
 import click_common
+import parse_logs
 from python_config import NUM_RACKS, HOSTS_PER_RACK, TIMESTAMP, SCRIPT, \
     EXPERIMENTS, PHYSICAL_NODES, RPYC_CONNECTIONS, RPYC_PORT, CIRCUIT_BW_Gbps, \
     PACKET_BW_Gbps, FQDN, DATA_NET, CONTROL_NET, DFSIOE, get_phost_from_host, \
@@ -308,7 +309,10 @@ def flowgrind(settings):
     if tcpdump:
         tcpdumps = tcpdump_start(click_common.FN_FORMAT)
     time.sleep(2)
-    runWriteFile(cmd, fn)
+    # Parse flowgrind's interval reports while it runs (see
+    # parse_logs.load_flowgrind_intervals()).
+    if runWriteFile(cmd, fn, parse_logs.FlowgrindIntervals()):
+        EXPERIMENTS.append(parse_logs.get_cache_path(fn, 'fg'))
     if tcpdump:
         tcpdump_finish(tcpdumps)
     save_counters(click_common.FN_FORMAT % ('flowgrind.counters'))
@@ -357,7 +361,11 @@ def save_counters(fn):
 ##
 # Running shell commands
 ##
-def run(cmd, fn):
+def run(cmd, fn, line_fn=None):
+    """
+    Runs "cmd" locally. If "line_fn" is not None, then it is called on each
+    line of output as the line is produced, and the output is not buffered.
+    """
     print("host: local , cmd: {}".format(cmd))
     def preexec():  # don't forward signals
         os.setpgrp()
@@ -371,7 +379,10 @@ def run(cmd, fn):
             break
         if not fn:
             sys.stdout.write(line)
-        out += line
+        if line_fn:
+            line_fn(line)
+        else:
+            out += line
     rc = p.poll()
     while rc is None:
         rc = p.poll()
@@ -382,18 +393,51 @@ def run(cmd, fn):
     return (rc, out)
 
 
-def runWriteFile(cmd, fn):
-    if fn:
-        EXPERIMENTS.append(fn)
+def runWriteFile(cmd, fn, parser=None):
+    """
+    Runs "cmd" locally and writes its output to the file "fn" as the output is
+    produced. If "parser" is not None, then each line of output is also passed
+    to parser.add_line(), and parser.save(fn) is called once the output file
+    is complete (see parse_logs.FlowgrindIntervals). A parser error does not
+    interrupt the output file; the parser is dropped instead. Returns whether
+    the parser's results were saved.
+    """
+    if not fn:
+        try:
+            run(cmd, fn)
+        except Exception, e:
+            print e
+        return False
+    EXPERIMENTS.append(fn)
+    f = open(fn, 'w')
+    # A list, so that write_line() can drop the parser.
+    parsers = [parser] if parser else []
+
+    def write_line(line):
+        f.write(line)
+        if parsers:
+            try:
+                parsers[0].add_line(line)
+            except Exception, e:
+                print("Warning: Failed to parse the output of \"{}\", "
+                      "so it will not be cached: {}".format(cmd, e))
+                del parsers[:]
+
     try:
-        out = run(cmd, fn)[1]
+        run(cmd, fn, write_line)
     except Exception, e:
         print e
-        out = str(e)
-    if fn:
-        f = open(fn, 'w')
-        f.write(out)
-        f.close()
+        f.write(str(e))
+    f.close()
+    if not parsers:
+        return False
+    try:
+        parsers[0].save(fn)
+    except Exception, e:
+        print("Warning: Failed to cache the output of \"{}\": {}".format(
+            cmd, e))
+        return False
+    return True
 
 
 ##
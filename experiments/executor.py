@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+#
+# A long-lived executor for parsing logs, shared by all of the graphs that a
+# graphing script generates. It keeps a single process pool for the whole run,
+# de-duplicates identical jobs (the same parser, file, and parameters), and
+# returns results as futures. Finished results are stored in a
+# result_cache.ResultCache, so each log is parsed at most once per run, and not
+# at all if a previous run already parsed it.
+
+import glob
+import multiprocessing
+from os import path
+
+import parse_logs
+import profiling
+import result_cache
+
+
+class _Done(object):
+    """ A future whose result is already known. """
+
+    def __init__(self, res):
+        self.res = res
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.res
+
+
+class _Pending(object):
+    """
+    A future for a job running in the pool. Wraps the job's AsyncResult and
+    merges the stage timers and counters that the job recorded into this
+    process's (see profiling.ProfiledTask) the first time that it is retrieved.
+    """
+
+    def __init__(self, async_res):
+        self.async_res = async_res
+        self.done = None
+
+    def ready(self):
+        return self.done is not None or self.async_res.ready()
+
+    def get(self):
+        if self.done is None:
+            res, stats = self.async_res.get()
+            if stats is not None:
+                profiling.merge_stats(stats)
+            self.done = _Done(res)
+        return self.done.get()
+
+
+def find_logs(edr, ptns):
+    """
+    Returns the files in the directory "edr" that match any of the glob
+    patterns "ptns".
+    """
+    # For each pattern, extract the matches. Then, flatten them into a single
+    # list.
+    return [fln for matches in
+            [glob.glob(path.join(edr, ptn)) for ptn in ptns]
+            for fln in matches]
+
+
+def get_analysis_params(msg_len=112, seq=False, dur=None, time_offset_s=0):
+    """
+    Returns the parameters of the parse_logs.analyze_hslog() jobs of the
+    graphing scripts (see AnalysisExecutor.analyze()). "dur" and
+    "time_offset_s" are the parameters of the sequence graph data, which is
+    only computed if "seq" is True.
+    """
+    if not seq:
+        # Normalize the unused parameters, so that all of the jobs that do not
+        # compute the sequence graph data for a file are the same.
+        dur = None
+        time_offset_s = 0
+    return {"seq": seq, "dur": dur, "time_offset_s": time_offset_s,
+            "msg_len": msg_len, "lat_rel_err": parse_logs.GRAPH_LAT_REL_ERR}
+
+
+def _run_job(job):
+    """
+    Runs a job in a pool worker and stores its result in the cache. "job" is a
+    tuple of the form:
+        (cache, key, function, filename, parameters)
+    """
+    cache, key, fnc, fln, params = job
+    res = fnc(fln, **params)
+    cache.put(key, res)
+    return res
+
+
+class AnalysisExecutor(object):
+    """
+    Runs parsers of the form fnc(filename, **parameters), where "fnc" is a
+    module-level function (so that it can be sent to the pool). The pool is
+    created when the first job that is not cached is submitted. Call close()
+    when done.
+    """
+
+    def __init__(self, sync=False, processes=None, cache=None):
+        """
+        sync: True and False mean that jobs will be executed in this process,
+              when they are submitted, and in a pool of "processes" processes
+              (None means one per core), respectively.
+        cache: The ResultCache in which to store results. None means the
+               shared one.
+        """
+        self.sync = sync
+        self.processes = processes
+        self.cache = result_cache.ResultCache() if cache is None else cache
+        self.pool = None
+        # Map of job key to future.
+        self.futures = {}
+        # Map of (filename, message length, latency error) to the future of
+        # the first analyze() job for those that computes the sequence graph
+        # data.
+        self.seq_futures = {}
+
+    def submit(self, fnc, fln, prepare=None, **params):
+        """
+        Returns a future (with ready() and get() methods, like an AsyncResult)
+        for the result of fnc(fln, **params). If the same job was submitted
+        before, then returns the same future. "prepare" is an optional function
+        to call in this process before starting a job that is not cached. It
+        takes the executor's pool (None in single-threaded mode), e.g., to
+        decode a large log using all of the pool's processes first (see
+        parse_logs.prepare_hslogs()).
+        """
+        key = result_cache.get_key(
+            fnc.__name__, parse_logs.RESULTS_VERSION, [fln], **params)
+        fut = self.futures.get(key)
+        if fut is not None:
+            profiling.count("executor.deduplicated jobs")
+            return fut
+
+        with profiling.stage("executor.cache_load"):
+            res = self.cache.get(key)
+        if res is not None:
+            profiling.count("executor.cached jobs")
+            fut = _Done(res)
+        else:
+            profiling.count("executor.parsed jobs")
+            if not self.sync and self.pool is None:
+                self.pool = multiprocessing.Pool(self.processes)
+            if prepare is not None:
+                prepare(self.pool)
+            job = (self.cache, key, fnc, fln, params)
+            if self.sync:
+                # Single-threaded mode.
+                fut = _Done(_run_job(job))
+            else:
+                # Multithreaded mode.
+                fut = _Pending(self.pool.apply_async(
+                    profiling.ProfiledTask(_run_job), (job,)))
+        self.futures[key] = fut
+        return fut
+
+    def analyze(self, fln, params):
+        """
+        Submits a parse_logs.analyze_hslog() job for the HSLog file "fln" with
+        the parameters "params" (see get_analysis_params()). If the job is not
+        cached, then the log is decoded using all of the pool's processes
+        first. A job that computes the sequence graph data also computes every
+        other metric, so a job that does not is served by a previous job for
+        the same file that does, if there is one. Therefore, submit the jobs
+        that compute the sequence graph data first.
+        """
+        seq_key = (fln, params["msg_len"], params["lat_rel_err"])
+        if not params["seq"]:
+            fut = self.seq_futures.get(seq_key)
+            if fut is not None:
+                profiling.count("executor.deduplicated jobs")
+                return fut
+        fut = self.submit(
+            parse_logs.analyze_hslog, fln,
+            prepare=lambda pool: parse_logs.prepare_hslogs(
+                [fln], params["msg_len"], pool),
+            **params)
+        if params["seq"]:
+            self.seq_futures.setdefault(seq_key, fut)
+        return fut
+
+    def detach(self):
+        """
+        Call in a process that was forked from the process that owns this
+        executor. The finished futures remain available, but later jobs run
+        synchronously in the calling process, since the pool belongs to the
+        parent.
+        """
+        self.pool = None
+        self.sync = True
+
+    def close(self):
+        """ Waits for all jobs to finish, then stops the pool. """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+#
+# Generates synthetic HSLog files (i.e., Click packet logs) and flowgrind logs
+# for benchmarking parse_logs.py without running experiments. Usage:
+#     ./hslog_gen.py <out file> <log message size> <size (MB)> \
+#         [strobe|fake_strobe]
+
+from os import path
+import sys
+# Directory containing this program.
+PROGDIR = path.dirname(path.realpath(__file__))
+# For python_config.
+sys.path.insert(0, path.join(PROGDIR, "..", "etc"))
+
+import numpy as np
+
+import parse_logs
+import python_config
+
+# The default schedule parameters, as in click_common.setConfig(). Durations
+# are in microseconds, under time dilation.
+GEN_NIGHT_LEN_US = python_config.RECONFIG_DELAY_us * python_config.TDF
+GEN_DAY_LEN_US = GEN_NIGHT_LEN_US * 9
+GEN_NUM_RACKS_FAKE = 8
+# The number of racks and hosts per rack between which to generate flows.
+GEN_NUM_RACKS = python_config.NUM_RACKS
+GEN_HOSTS_PER_RACK = python_config.HOSTS_PER_RACK
+# The number of flows. Flows are assigned to rack pairs round-robin, so every
+# rack pair has flows if there are enough flows.
+GEN_NUM_FLOWS = 16
+# The average number of packets per microsecond (without time dilation).
+GEN_PKTS_PER_US = 1.
+# The fraction of packets that are swapped with the next packet.
+GEN_REORDER = 0.01
+# The maximum VOQ length (packets) in 116-byte records.
+GEN_VOQ_MAX = 64
+# Packet payload sizes (bytes) and their probabilities.
+GEN_PKT_SIZES = [8948, 1448, 500, 0]
+GEN_PKT_SIZE_PROBS = [0.9, 0.04, 0.03, 0.03]
+# The number of records to generate at once.
+GEN_BLOCK_RECS = 2**20
+# The port on which flowgrind receivers listen.
+GEN_DPORT = python_config.FLOWGRIND_PORT
+
+
+def strobe_schedule(num_racks=GEN_NUM_RACKS, night_len_us=GEN_NIGHT_LEN_US,
+                    day_len_us=GEN_DAY_LEN_US):
+    """
+    Returns the RunSchedule schedule that click_common.setStrobeSchedule()
+    sets.
+    """
+    off_config = "/".join(["-1"] * num_racks)
+    configs = []
+    for i in xrange(num_racks - 1):
+        day_config = "/".join([str((i + 1 + j) % num_racks)
+                               for j in xrange(num_racks)])
+        configs.append("{} {} {} {}".format(
+            int(day_len_us), day_config, int(night_len_us), off_config))
+    return "{} {}".format((num_racks - 1) * 2, " ".join(configs))
+
+
+def fake_strobe_schedule(num_racks_fake=GEN_NUM_RACKS_FAKE,
+                         night_len_us=GEN_NIGHT_LEN_US,
+                         day_len_us=GEN_DAY_LEN_US):
+    """
+    Returns the RunSchedule schedule that click_common.setFakeStrobeSchedule()
+    sets.
+    """
+    num_parts = num_racks_fake - 1
+    day_len_us = int(day_len_us)
+    night_len_us = int(night_len_us)
+    return "{} {}{} 2/0/1 {} -1/-1/-1".format(
+        num_parts * 2,
+        "{} 1/2/0 {} -1/-1/-1 ".format(day_len_us, night_len_us) *
+        (num_parts - 1),
+        day_len_us, night_len_us)
+
+
+def _get_circuits(schedule, num_racks):
+    """
+    Returns the circuits of a RunSchedule schedule as a tuple of the form:
+        (config start times, schedule length, connected)
+    where the times are in seconds (under time dilation) and "connected" is a
+    boolean array indexed by [config, src rack, dst rack], using HSLog rack
+    numbers.
+    """
+    tokens = schedule.split()
+    durs = np.array(tokens[1::2], dtype=float) * 1e-6
+    num_racks = max(num_racks, len(tokens[2].split("/")))
+    num_racks += parse_logs.SCHEDULE_RACK_OFFSET
+    connected = np.zeros((len(durs), num_racks, num_racks), dtype=bool)
+    for cfg_idx, config in enumerate(tokens[2::2]):
+        for dst, src in enumerate(int(src) for src in config.split("/")):
+            if src >= 0:
+                connected[cfg_idx, src + parse_logs.SCHEDULE_RACK_OFFSET,
+                          dst + parse_logs.SCHEDULE_RACK_OFFSET] = True
+    return np.cumsum(durs) - durs, durs.sum(), connected
+
+
+def _get_circuit_recs(t0, t1, cfg_starts, sched_len, connected):
+    """
+    Returns the circuit start and end records between times t0 and t1 (seconds,
+    under time dilation) as arrays of the form:
+        (timestamps, types, src racks, dst racks)
+    """
+    cfgs, srcs, dsts = np.nonzero(connected)
+    # The start and end of every day of every rack pair during one repetition
+    # of the schedule.
+    starts = cfg_starts[cfgs]
+    ends = np.append(cfg_starts[1:], sched_len)[cfgs]
+    reps = np.arange(int(t0 // sched_len), int(t1 // sched_len) + 1)
+    tss = np.concatenate([(reps[:, np.newaxis] * sched_len +
+                           starts[np.newaxis, :]).ravel(),
+                          (reps[:, np.newaxis] * sched_len +
+                           ends[np.newaxis, :]).ravel()])
+    typs = np.repeat([1, 2], len(reps) * len(cfgs))
+    srcs = np.tile(srcs, 2 * len(reps))
+    dsts = np.tile(dsts, 2 * len(reps))
+    valid = (tss >= t0) & (tss < t1)
+    return tss[valid], typs[valid], srcs[valid], dsts[valid]
+
+
+def _set_be(data, offset, num_bytes, vals):
+    """
+    Stores "vals" as big-endian unsigned integers of length "num_bytes" in
+    each row of "data", starting at "offset".
+    """
+    vals = vals.astype(np.uint64)
+    for idx in xrange(num_bytes):
+        data[:, offset + idx] = (vals >> (8 * (num_bytes - 1 - idx))) & 0xFF
+
+
+def generate_hslog(fln, msg_len=112, size_mb=100, schedule=None,
+                   num_racks=GEN_NUM_RACKS, num_flows=GEN_NUM_FLOWS,
+                   pkts_per_us=GEN_PKTS_PER_US, reorder=GEN_REORDER,
+                   voq_max=GEN_VOQ_MAX, seed=0):
+    """
+    Writes an HSLog file of about "size_mb" MB with "msg_len"-byte records.
+    The file contains TCP data packets from "num_flows" flows between
+    "num_racks" racks and the circuit start and end records of "schedule" (a
+    RunSchedule schedule, by default fake_strobe_schedule()). A fraction
+    "reorder" of the packets are swapped with the next packet. Packets on a
+    rack pair with a circuit are marked as circuit packets. Returns the number
+    of records.
+    """
+    if schedule is None:
+        schedule = fake_strobe_schedule()
+    np.random.seed(seed)
+    dtype = parse_logs.get_hslog_dtype(msg_len)
+    cfg_starts, sched_len, connected = _get_circuits(schedule, num_racks)
+
+    # Assign flows to rack pairs round-robin.
+    pairs = [(src, dst) for src in xrange(1, num_racks + 1)
+             for dst in xrange(1, num_racks + 1) if src != dst]
+    flw_srcs = np.array([pairs[flw % len(pairs)][0]
+                         for flw in xrange(num_flows)])
+    flw_dsts = np.array([pairs[flw % len(pairs)][1]
+                         for flw in xrange(num_flows)])
+    flw_hosts = np.arange(num_flows) // len(pairs) % GEN_HOSTS_PER_RACK + 1
+    # The next sequence number of each flow.
+    flw_seqs = np.random.randint(0, 2**31, num_flows).astype(np.int64)
+
+    num_recs = int(size_mb * 2**20 // msg_len)
+    # The mean time between packets, in seconds under time dilation.
+    gap_s = 1e-6 / pkts_per_us * python_config.TDF
+    # The time of the last packet of the previous block.
+    prev_t = 0.
+    written = 0
+    with open(fln, "wb") as fil:
+        while written < num_recs:
+            num_pkts = min(GEN_BLOCK_RECS, num_recs - written)
+            pkt_tss = prev_t + np.cumsum(np.random.exponential(gap_s, num_pkts))
+            t = pkt_tss[-1]
+            flws = np.random.randint(0, num_flows, num_pkts)
+            plens = np.random.choice(GEN_PKT_SIZES, num_pkts,
+                                     p=GEN_PKT_SIZE_PROBS)
+            # Each packet's sequence number is its flow's next sequence number
+            # plus the bytes of the flow's earlier packets in this block.
+            order = np.argsort(flws, kind="mergesort")
+            cum_plens = np.cumsum(plens[order])
+            flw_bounds = np.searchsorted(flws[order], np.arange(num_flows))
+            offsets = cum_plens - plens[order]
+            offsets -= np.append([0], cum_plens)[flw_bounds][flws[order]]
+            seqs = np.empty(num_pkts, dtype=np.int64)
+            seqs[order] = flw_seqs[flws[order]] + offsets
+            flw_seqs += np.bincount(flws, weights=plens,
+                                    minlength=num_flows).astype(np.int64)
+            # Swap some packets with the next packet, without changing the
+            # timestamps.
+            swaps = np.flatnonzero(np.random.random(num_pkts - 1) < reorder)
+            keep = np.ones(len(swaps), dtype=bool)
+            keep[1:] = np.diff(swaps) > 1
+            swaps = swaps[keep]
+            perm = np.arange(num_pkts)
+            perm[swaps] = swaps + 1
+            perm[swaps + 1] = swaps
+            flws = flws[perm]
+            plens = plens[perm]
+            seqs = seqs[perm]
+
+            # Mark packets whose rack pair has a circuit as circuit packets.
+            srcs = flw_srcs[flws]
+            dsts = flw_dsts[flws]
+            cfgs = np.searchsorted(cfg_starts, pkt_tss % sched_len,
+                                   side="right") - 1
+            circ = connected[cfgs, srcs, dsts]
+
+            # Merge the packets with the circuit records in time order.
+            c_tss, c_typs, c_srcs, c_dsts = _get_circuit_recs(
+                prev_t, t, cfg_starts, sched_len, connected)
+            prev_t = t
+            recs = np.zeros(num_pkts + len(c_tss), dtype=dtype)
+            tss = np.concatenate([c_tss, pkt_tss])
+            rec_order = np.argsort(tss, kind="mergesort")
+            is_pkt = rec_order >= len(c_tss)
+            pkt_recs = np.flatnonzero(is_pkt)
+            circ_recs = np.flatnonzero(~is_pkt)
+            # Click writes timestamps in fixed-point notation.
+            recs["ts"] = np.char.mod("%.9f", tss[rec_order])
+            recs["type"][circ_recs] = c_typs[rec_order[circ_recs]]
+            recs["src"][circ_recs] = c_srcs[rec_order[circ_recs]]
+            recs["dst"][circ_recs] = c_dsts[rec_order[circ_recs]]
+            pkt_idxs = rec_order[pkt_recs] - len(c_tss)
+            recs["src"][pkt_recs] = srcs[pkt_idxs]
+            recs["dst"][pkt_recs] = dsts[pkt_idxs]
+            recs["lat"][pkt_recs] = np.random.randint(1, 500, num_pkts)
+            if "voq" in dtype.names:
+                recs["voq"][pkt_recs] = np.random.randint(0, voq_max + 1,
+                                                          num_pkts)
+
+            # IPv4 and TCP headers.
+            data = np.zeros((num_pkts, 64), dtype=np.uint8)
+            data[:, 0] = 0x45
+            data[:, 1] = circ[pkt_idxs]
+            _set_be(data, 2, 2, 40 + plens[pkt_idxs])
+            data[:, 8] = 64
+            data[:, 9] = 6
+            data[:, 12:14] = [10, 1]
+            data[:, 14] = srcs[pkt_idxs]
+            data[:, 15] = flw_hosts[flws[pkt_idxs]]
+            data[:, 16:18] = [10, 1]
+            data[:, 18] = dsts[pkt_idxs]
+            data[:, 19] = flw_hosts[flws[pkt_idxs]]
+            _set_be(data, 20, 2, 40000 + flws[pkt_idxs])
+            _set_be(data, 22, 2, np.full(num_pkts, GEN_DPORT))
+            _set_be(data, 24, 4, seqs[pkt_idxs] % 2**32)
+            data[:, 32] = 5 << 4
+            data[:, 33] = 0x10
+            recs["data"][pkt_recs] = data
+            recs.tofile(fil)
+            written += len(recs)
+    return written
+
+
+def generate_flowgrind_log(fln, num_flows=GEN_NUM_FLOWS,
+                           num_racks=GEN_NUM_RACKS, dur_s=2., sample_s=0.001,
+                           seed=0):
+    """
+    Writes a flowgrind log and its config file ("<log>.config.txt") containing
+    one interval ("S") line per flow per "sample_s" seconds, for "dur_s"
+    seconds. Returns the number of interval lines.
+    """
+    np.random.seed(seed)
+    pairs = [(src, dst) for src in xrange(1, num_racks + 1)
+             for dst in xrange(1, num_racks + 1) if src != dst]
+    with open(fln.split(".txt")[0] + ".config.txt", "w") as fil:
+        fil.write("-I -Ts={} -Ys=0 -i {} -n {} ".format(
+            dur_s, sample_s, num_flows))
+        for flw in xrange(num_flows):
+            src, dst = pairs[flw % len(pairs)]
+            host = flw // len(pairs) % GEN_HOSTS_PER_RACK + 1
+            fil.write("-F {} -Hs=10.1.{}.{},d=10.1.{}.{} ".format(
+                flw, src, host, dst, host))
+    begins = np.arange(int(round(dur_s / sample_s))) * sample_s
+    ids = np.repeat(np.arange(num_flows), len(begins))
+    begins = np.tile(begins, num_flows)
+    num_lines = len(ids)
+    rtts = np.random.uniform(0.1, 2, num_lines)
+    cols = np.column_stack([
+        ids, begins, begins + sample_s,
+        np.random.uniform(0, 10000. / num_flows, num_lines),
+        rtts, rtts * 1.1, rtts * 1.2,
+        np.random.randint(10, 1000, num_lines)])
+    with open(fln, "w") as fil:
+        fil.write("# ID begin end through transac min RTT avg RTT max RTT "
+                  "min IAT avg IAT max IAT cwnd ssth\n")
+        np.savetxt(fil, cols, fmt=("S %d %.6f %.6f %.6f 0 %.3f %.3f %.3f "
+                                   "0 0 0 %d INT_MAX"))
+    return num_lines
+
+
+def main():
+    assert len(sys.argv) in [4, 5], \
+        ("Expected three or four arguments: output file, log message size "
+         "(bytes), size (MB), [strobe|fake_strobe]")
+    schedule = fake_strobe_schedule()
+    if len(sys.argv) == 5:
+        assert sys.argv[4] in ["strobe", "fake_strobe"], \
+            "Unknown schedule type: {}".format(sys.argv[4])
+        if sys.argv[4] == "strobe":
+            schedule = strobe_schedule()
+    print("Wrote {} records".format(generate_hslog(
+        sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), schedule)))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,17 @@
 
 import collections
 import glob
+import mmap
+import multiprocessing
+import os
 from os import path
+import re
+import shutil
 import socket
-from struct import unpack
+from struct import pack, unpack
 import sys
+import tempfile
+import zipfile
 # Directory containing this program.
 PROGDIR = path.dirname(path.realpath(__file__))
 # For python_config.
@@ -13,155 +20,1205 @@ sys.path.insert(0, path.join(PROGDIR, "..", "etc"))
 
 import numpy as np
 
+import profiling
 import python_config
 
 PERCENTILES = [25, 50, 75, 99, 99.9, 99.99, 99.999, 100]
 RTT = python_config.CIRCUIT_LATENCY_s_TDF * 2
 # 1/1000 seconds.
 BIN_SIZE_MS = 1
-# The rack pair to examine when parsing sequence logs. Rack 1 to rack 2.
+# The default rack pair to examine when parsing sequence logs. Rack 1 to rack 2.
 # SR_RACKS = (1, 2)
 SR_RACKS = (2, 3)
+# The number of circuits to ignore at each end of a rack pair's circuits when
+# computing circuit statistics. The first and last circuits of an experiment
+# are often irregular.
+CIRCUIT_STATS_TRIM = 5
+# Racks in a RunSchedule schedule are numbered from 0, whereas the racks in
+# HSLog records are numbered from 1.
+SCHEDULE_RACK_OFFSET = 1
+# The version of the results of the parsers, which graphing scripts cache using
+# result_cache.py (e.g., analyze_hslog()) and which build.py uses to decide
+# whether figures are up to date. Increment when the results change.
+#
+# Version 2: parse_validation_log() assigns each window to exactly one bin.
+RESULTS_VERSION = 2
+# The relative error of the latency percentiles that the graphing scripts
+# compute using analyze_hslog(). None means that they are computed exactly.
+# Otherwise, they are computed in bounded memory (see LatencyHistogram).
+GRAPH_LAT_REL_ERR = None
+# HSLog record layouts, keyed by record length (bytes). Every record contains a
+# type (int), a timestamp (char[32]), a latency (int), a src (int), and a dst
+# (int), followed by the first 64 bytes of the packet (char[64]). 116-byte
+# records also contain the VOQ length (int) before the packet data. Only the
+# first 20 characters of the timestamp are meaningful.
+HSLOG_DTYPES = {
+    112: np.dtype([("type", "i4"), ("ts", "S20"), ("ts_pad", "V12"),
+                   ("lat", "i4"), ("src", "i4"), ("dst", "i4"),
+                   ("data", "u1", (64,))]),
+    116: np.dtype([("type", "i4"), ("ts", "S20"), ("ts_pad", "V12"),
+                   ("lat", "i4"), ("src", "i4"), ("dst", "i4"),
+                   ("voq", "i4"), ("data", "u1", (64,))]),
+}
 
 
-def parse_flowgrind_config(fln):
-    flows = collections.defaultdict(list)
+# Matches the flow ID and, optionally, the request size (bytes) of a flow's
+# configuration in a flowgrind config file, i.e., the text after one "-F".
+FG_CONFIG_FLOW_RE = re.compile(r"\s*(\d+)(?:.*?-Gs=q:C:(\d+))?")
+# Matches a request size (bytes) in a flowgrind config file.
+FG_CONFIG_SIZE_RE = re.compile(r"-Gs=q:C:(\d+)")
+# Matches the flow ID, endpoint (S or D), and rack of a flowgrind summary line.
+FG_SUMMARY_RE = re.compile(r"#\s*ID\s+(\d+)\s+([SD]):\s*\d+\.\d+\.(\d+)\.")
+# Match the duration (seconds) and throughput (Mb/s) of a flowgrind summary
+# line.
+FG_DURATION_RE = re.compile(r"duration = ([^/\s]+)/")
+FG_THROUGH_RE = re.compile(r"through = ([^/\s]+)/")
+# The version of the flowgrind flow cache format. Increment when it changes.
+FG_FLOWS_VERSION = 1
+# Matches the bytes and duration (ns) of an HDFS_WRITE clienttrace record in an
+# HDFS datanode log.
+HDFS_WRITE_RE = re.compile(
+    r"clienttrace[^\n]*?bytes: (\d+),[^\n]*?HDFS_WRITE[^\n]*?"
+    r"duration\(ns\): (\d+)")
+# The version of the HDFS log cache format. Increment when it changes.
+HDFS_CACHE_VERSION = 1
+# The number of processes to use to scan HDFS datanode logs. None means one per
+# core. Read when it is used, so it may be changed at runtime.
+HDFS_PROCESSES = None
+
+
+def _parse_flowgrind_config_sizes(config_fln):
+    """
+    Returns a dictionary mapping flow ID to request size (bytes) for a
+    flowgrind config file. Flows without their own request size use the
+    request size that precedes the first flow.
+    """
     sizes = {}
-    for l in open(fln.split(".txt")[0] + ".config.txt"):
-        l = l.split("-F")[1:]
-        for x in l:
-            hid = int(x.strip().split()[0])
-            byts = int(x.strip().split("-Gs=q:C:")[1].split()[0])
-            sizes[hid] = byts
-    for l in open(fln):
-        if "seed" in l:
-            hid = int(l[4:].strip().split()[0])
-            rack = int(l.split("/")[0].split()[-1].split(".")[2])
-            flows[hid].append(rack)
-            if l.split(":")[0][-1] == "S":
-                time = float(l.split("duration = ")[1].split("/")[0]) * 1000000
-                tp = float(l.split("through = ")[1].split("/")[0]) / 1000.
-            else:
-                flows[hid].append(time)
-                flows[hid].append(tp)
-                flows[hid].append(sizes[hid])
+    for line in open(config_fln):
+        clauses = line.split("-F")
+        default = FG_CONFIG_SIZE_RE.search(clauses[0])
+        for clause in clauses[1:]:
+            match = FG_CONFIG_FLOW_RE.match(clause)
+            size = match.group(2) or (default and default.group(1))
+            assert size, "No request size for flow {} in: {}".format(
+                match.group(1), config_fln)
+            sizes[int(match.group(1))] = int(size)
+    return sizes
 
-    for f in flows.keys():
-        if flows[f][3] == float("inf"):
-            del flows[f]
-    tps = [f[3] for f in flows.values()]
-    durs = [f[2] for f in flows.values()]
-    byts = [f[4] for f in flows.values()]
+
+def parse_flowgrind_flows(fln):
+    """
+    Parses a flowgrind output file and its config file in one pass each.
+    Returns a dictionary mapping each of the following names to an array
+    containing one entry per flow, sorted by flow ID:
+        id: flow ID
+        src_rack, dst_rack: rack of the flow's source and destination
+        size: request size (bytes)
+        dur_us: flow duration (us)
+        tput_Gbps: flow throughput (Gb/s)
+    The duration and throughput are from the source's summary line. The
+    results are cached next to the output file.
+    """
+    config_fln = fln.split(".txt")[0] + ".config.txt"
+    config_id = _get_src_id(config_fln)
+    cache = load_cache(fln, "flows", FG_FLOWS_VERSION)
+    if cache is not None and (cache["config_id"] == config_id).all():
+        return {name: cache[name] for name in [
+            "id", "src_rack", "dst_rack", "size", "dur_us", "tput_Gbps"]}
+
+    sizes = _parse_flowgrind_config_sizes(config_fln)
+    # Map of flow ID to (src rack, duration (us), throughput (Gb/s)), from the
+    # src's summary line.
+    srcs = {}
+    # Map of flow ID to dst rack, from the dst's summary line.
+    dsts = {}
+    for line in open(fln):
+        if "seed" not in line:
+            continue
+        match = FG_SUMMARY_RE.match(line)
+        hid = int(match.group(1))
+        rack = int(match.group(3))
+        if match.group(2) == "S":
+            srcs[hid] = (
+                rack,
+                float(FG_DURATION_RE.search(line).group(1)) * 1000000,
+                float(FG_THROUGH_RE.search(line).group(1)) / 1000.)
+        else:
+            dsts[hid] = rack
+    ids = sorted(set(srcs.keys()) & set(dsts.keys()))
+    src_racks, durs, tputs = zip(*[srcs[hid] for hid in ids]) if ids \
+        else ([], [], [])
+    flows = {
+        "id": np.array(ids, dtype=np.int64),
+        "src_rack": np.array(src_racks, dtype=np.int64),
+        "dst_rack": np.array([dsts[hid] for hid in ids], dtype=np.int64),
+        "size": np.array([sizes[hid] for hid in ids], dtype=np.int64),
+        "dur_us": np.array(durs, dtype=np.float64),
+        "tput_Gbps": np.array(tputs, dtype=np.float64),
+    }
+    save_cache(fln, "flows", FG_FLOWS_VERSION, config_id=config_id, **flows)
+    return flows
+
+
+def parse_flowgrind_config(fln):
+    """
+    Returns the throughputs (Gb/s), durations (us), and sizes (bytes) of the
+    flows in a flowgrind output file (see parse_flowgrind_flows()), excluding
+    flows with infinite throughput.
+    """
+    flows = parse_flowgrind_flows(fln)
+    valid = flows["tput_Gbps"] != float("inf")
+    tps = flows["tput_Gbps"][valid].tolist()
+    durs = flows["dur_us"][valid].tolist()
+    byts = flows["size"][valid].tolist()
 
     print(len(tps), len(durs), len(byts))
 
     return tps, durs, byts
 
 
-def msg_from_file(filename, chunksize):
-    with open(filename, "rb") as f:
-        while True:
-            chunk = f.read(chunksize)
-            if chunk:
-                yield chunk
+def get_hslog_dtype(msg_len):
+    """ Returns the NumPy dtype of an HSLog record of length "msg_len". """
+    if msg_len not in HSLOG_DTYPES:
+        raise Exception(
+            "Message length must be either 112 or 116, but is: {}".format(
+                msg_len))
+    return HSLOG_DTYPES[msg_len]
+
+
+def _get_be(data, offsets, num_bytes):
+    """
+    Extracts a big-endian unsigned integer of length "num_bytes" from each row
+    of "data" (an array of raw packet bytes), starting at "offsets" (either a
+    single offset or one offset per row).
+    """
+    rows = np.arange(len(data))
+    val = np.zeros(len(data), dtype=np.uint32)
+    for idx in xrange(num_bytes):
+        # Offsets past the end of the captured packet data are only possible
+        # for malformed headers. Clip them so that the lookup stays in bounds.
+        col = np.minimum(offsets + idx, data.shape[1] - 1)
+        val = (val << 8) | data[rows, col]
+    return val
+
+
+def _get_tcp(log, offset, num_bytes):
+    """
+    Extracts a big-endian field that starts "offset" bytes into the TCP header
+    of each record in "log". The field is 0 for non-TCP packets.
+    """
+    return np.where(log["proto"] == 6,
+                    _get_be(log.recs["data"], log["ihl"] + offset, num_bytes),
+                    0)
+
+
+# Functions that decode a column of an HSLog object, keyed by column name. Each
+# function takes an HSLog object and returns an array with one entry per
+# record.
+_HSLOG_COLS = {
+    "type": lambda log: np.asarray(log.recs["type"]),
+    # Timestamp in seconds, after removing the effects of time dilation.
+    "ts": lambda log: log.recs["ts"].astype(np.float64) / python_config.TDF,
+    "lat": lambda log: np.asarray(log.recs["lat"]),
+    "src": lambda log: np.asarray(log.recs["src"]),
+    "dst": lambda log: np.asarray(log.recs["dst"]),
+    "voq": lambda log: (np.asarray(log.recs["voq"])
+                        if "voq" in log.recs.dtype.names
+                        else np.zeros(len(log), dtype=np.int32)),
+    # IP header fields.
+    "ip_bytes": lambda log: _get_be(log.recs["data"], 2, 2),
+    "ihl": lambda log: (log.recs["data"][:, 0] & 0xF).astype(np.int64) * 4,
+    "proto": lambda log: np.asarray(log.recs["data"][:, 9]),
+    "sender": lambda log: _get_be(log.recs["data"], 12, 4),
+    "recv": lambda log: _get_be(log.recs["data"], 16, 4),
+    # The racks are the third octet of the sender and receiver IP addresses.
+    "sender_rack": lambda log: np.asarray(log.recs["data"][:, 14]),
+    "recv_rack": lambda log: np.asarray(log.recs["data"][:, 18]),
+    # The circuit bit is the lowest bit of the TOS field.
+    "circuit": lambda log: (log.recs["data"][:, 1] & 0x1).astype(bool),
+    # TCP header fields.
+    "sport": lambda log: _get_tcp(log, 0, 2).astype(np.uint16),
+    "dport": lambda log: _get_tcp(log, 2, 2).astype(np.uint16),
+    "seq": lambda log: _get_tcp(log, 4, 4).astype(np.uint32),
+    "thl": lambda log: (_get_tcp(log, 12, 1) >> 4).astype(np.int64) * 4,
+    # The number of data bytes in each packet.
+    "byts": lambda log: (log["ip_bytes"].astype(np.int64) - log["ihl"] -
+                         log["thl"]),
+}
+# HSLog scanning settings. These are read when they are used, so they may be
+# changed at runtime (e.g., "parse_logs.HSLOG_PROCESSES = 1").
+#
+# The number of records to decode at once when scanning an HSLog file.
+HSLOG_BLOCK_RECS = 2**20
+# The number of processes to use when scanning a single (uncached) HSLog file.
+# None means one per CPU. 1 disables splitting.
+HSLOG_PROCESSES = None
+# Only split an HSLog file if each range would contain at least this many
+# blocks of HSLOG_BLOCK_RECS records.
+HSLOG_RANGE_MIN_BLOCKS = 1
+
+# A flow's datapoint for one packet: timestamp (seconds), sequence number, data
+# bytes, and VOQ length.
+FLOW_DTYPE = np.dtype([("ts", "f8"), ("seq", "i8"), ("byts", "i8"),
+                       ("voq", "i4")])
+
+
+# The version of the columnar HSLog cache format. Increment this to invalidate
+# all existing caches.
+HSLOG_CACHE_VERSION = 2
+# Whether to convert each HSLog file into a columnar cache the first time that
+# it is parsed.
+HSLOG_CACHE = True
+# The columns stored in a columnar HSLog cache.
+HSLOG_CACHE_COLS = ["type", "ts", "lat", "src", "dst", "voq", "sender", "recv",
+                    "sender_rack", "recv_rack", "proto", "sport", "dport",
+                    "seq", "byts", "circuit"]
+# The version of the sparse HSLog index format. Increment when it changes.
+HSLOG_INDEX_VERSION = 1
+# The sparse HSLog index records the timestamp of every HSLOG_INDEX_STRIDE-th
+# record.
+HSLOG_INDEX_STRIDE = 4096
+# The columns of flowgrind's interval ("S") lines that are stored in flowgrind
+# caches, as tuples of the form (name, column index, dtype). The column index
+# does not count the leading "S".
+FLOWGRIND_COLS = [("id", 0, np.int64), ("begin", 1, np.float64),
+                  ("end", 2, np.float64), ("tput_mbps", 3, np.float64),
+                  ("rtt_min_ms", 5, np.float64), ("rtt_avg_ms", 6, np.float64),
+                  ("rtt_max_ms", 7, np.float64), ("cwnd", 11, np.int64)]
+# The number of interval lines that FlowgrindIntervals buffers as strings
+# before converting them into arrays.
+FLOWGRIND_BLOCK_ROWS = 2**16
+# The version of the flowgrind cache format. Increment when it changes.
+FLOWGRIND_CACHE_VERSION = 1
+
+
+def get_cache_path(fln, suffix):
+    """ Returns the path of the "suffix" cache file for the file "fln". """
+    return "{}.{}.npz".format(fln, suffix)
+
+
+def _get_src_id(fln):
+    """
+    Returns the size and modification time of "fln", which together determine
+    whether a cache of "fln" is stale.
+    """
+    stat = os.stat(fln)
+    return np.array([stat.st_size, stat.st_mtime], dtype=np.float64)
+
+
+def _load_npz_mmap(cache_fln):
+    """
+    Returns a dictionary mapping the name of each array in the .npz file
+    "cache_fln" to a read-only memory map of it. Arrays that cannot be
+    memory-mapped (compressed, empty, or zero-dimensional) are loaded instead.
+    """
+    arrays = {}
+    with np.load(cache_fln) as npz, zipfile.ZipFile(cache_fln) as zfl, \
+            open(cache_fln, "rb") as fil:
+        for info in zfl.infolist():
+            name = info.filename[:-len(".npy")]
+            # Skip the zip member's local header, which is 30 bytes followed by
+            # the member's name and an extra field.
+            fil.seek(info.header_offset + 26)
+            name_len, extra_len = unpack("<HH", fil.read(4))
+            fil.seek(info.header_offset + 30 + name_len + extra_len)
+            read_header = {
+                (1, 0): np.lib.format.read_array_header_1_0,
+                (2, 0): np.lib.format.read_array_header_2_0,
+            }[np.lib.format.read_magic(fil)]
+            shape, fortran, dtype = read_header(fil)
+            if (info.compress_type == zipfile.ZIP_STORED and shape and
+                    min(shape) > 0 and not dtype.hasobject):
+                arrays[name] = np.memmap(
+                    cache_fln, dtype=dtype, mode="r", offset=fil.tell(),
+                    shape=shape, order="F" if fortran else "C")
             else:
-                break
+                arrays[name] = npz[name]
+    return arrays
 
 
-def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
-    circuit_starts = collections.defaultdict(list)
-    circuit_ends = collections.defaultdict(list)
-    flows = collections.defaultdict(list)
-    seen = collections.defaultdict(list)
-    for msg in msg_from_file(fln, msg_len):
-        if msg_len == 112:
-            # type (int), timestamp (char[32]), latency (int), src (int),
-            # dst (int), data (char[64])
-            t, ts, _, src, dst, data = unpack("i32siii64s", msg)
-            voq = 0
-        elif msg_len == 116:
-            # type (int), timestamp (char[32]), latency (int), src (int),
-            # dst (int), VOQ length (int), data (char[64])
-            t, ts, _, src, dst, voq, data = unpack("i32siiii64s", msg)
+def load_cache(fln, suffix, version, memmap=False):
+    """
+    Returns the arrays in the "suffix" cache file for the file "fln" (as a
+    lazily-loaded NpzFile, or, if "memmap" is True, as a dictionary of memory
+    maps; see save_cache()), or None if the cache does not exist, was created
+    by a different version of the code, or is older than "fln".
+    """
+    cache_fln = get_cache_path(fln, suffix)
+    if not path.exists(cache_fln):
+        return None
+    try:
+        cache = _load_npz_mmap(cache_fln) if memmap else np.load(cache_fln)
+        if (cache["version"] == version and
+                (cache["src_id"] == _get_src_id(fln)).all()):
+            return cache
+    except (IOError, KeyError, ValueError) as exc:
+        print("Warning: Unable to read cache {}: {}".format(cache_fln, exc))
+        return None
+    print("Ignoring stale cache: {}".format(cache_fln))
+    return None
+
+
+def save_cache(fln, suffix, version, npy_flns=None, compress=True,
+               **arrays):
+    """
+    Stores "arrays" in a "suffix" cache file for the file "fln". The cache
+    records the version and the current size and modification time of "fln"
+    so that load_cache() can detect when it becomes stale. "npy_flns"
+    optionally maps array names to .npy files to store as well. These are
+    copied into the cache straight from disk, without being loaded into
+    memory. If "compress" is False, then the arrays are stored uncompressed so
+    that load_cache() can memory-map them.
+    """
+    cache_fln = get_cache_path(fln, suffix)
+    # Write to a temporary file first so that concurrent readers never see a
+    # partially-written cache.
+    tmp_fln = "{}.{}.tmp".format(cache_fln, os.getpid())
+    try:
+        with open(tmp_fln, "wb") as fil:
+            (np.savez_compressed if compress else np.savez)(
+                fil, version=version, src_id=_get_src_id(fln), **arrays)
+        if npy_flns:
+            # An .npz file is a zip archive of .npy files.
+            with zipfile.ZipFile(
+                    tmp_fln, "a",
+                    zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+                    allowZip64=True) as zfl:
+                for name, npy_fln in sorted(npy_flns.items()):
+                    zfl.write(npy_fln, "{}.npy".format(name))
+        os.rename(tmp_fln, cache_fln)
+    except (IOError, OSError) as exc:
+        print("Warning: Unable to write cache {}: {}".format(cache_fln, exc))
+        if path.exists(tmp_fln):
+            os.remove(tmp_fln)
+
+
+class HSLog(object):
+    """
+    An HSLog file. Records are memory-mapped and are not read from disk until
+    one of their columns is accessed, e.g., log["ts"]. Columns are decoded on
+    first access and then cached. To scan a large file without decoding all of
+    it at once, iterate over blocks().
+
+    If "cache" is provided (see open_hslog()), then columns are read from its
+    memory maps instead of being decoded.
+    """
+
+    def __init__(self, fln, msg_len=112, recs=None, cache=None):
+        self.fln = fln
+        self.msg_len = msg_len
+        self._recs = recs
+        self.cache = cache
+        self._cols = {}
+
+    @property
+    def recs(self):
+        if self._recs is None:
+            dtype = get_hslog_dtype(self.msg_len)
+            num_recs, extra = divmod(path.getsize(self.fln), dtype.itemsize)
+            if extra:
+                print("Warning: Ignoring {} trailing bytes in: {}".format(
+                    extra, self.fln))
+            if num_recs:
+                self._recs = np.memmap(
+                    self.fln, dtype=dtype, mode="r", shape=(num_recs,))
+            else:
+                # np.memmap() does not support empty files.
+                self._recs = np.zeros(0, dtype=dtype)
+        return self._recs
+
+    def __len__(self):
+        return len(self.recs)
+
+    def __getitem__(self, col):
+        if col not in self._cols:
+            if self.cache is not None and col in self.cache:
+                self._cols[col] = self.cache[col]
+            else:
+                self._cols[col] = _HSLOG_COLS[col](self)
+        return self._cols[col]
+
+    def blocks(self, block_recs=None):
+        """
+        Yields HSLog objects that are views of consecutive blocks of
+        "block_recs" records (None means HSLOG_BLOCK_RECS). Always yields at
+        least one (possibly empty) block.
+        """
+        if block_recs is None:
+            block_recs = HSLOG_BLOCK_RECS
+        for start in xrange(0, max(len(self), 1), block_recs):
+            yield self.view(start, start + block_recs)
+
+    def view(self, start, stop):
+        """
+        Returns an HSLog object that is a view of records [start, stop), which
+        shares this object's memory maps.
+        """
+        cache = (None if self.cache is None else
+                 {col: self.cache[col][start:stop] for col in HSLOG_CACHE_COLS
+                  if col in self.cache})
+        return HSLog(self.fln, self.msg_len, self.recs[start:stop], cache)
+
+    def select(self, cols, mask):
+        """
+        Returns a dictionary mapping each column in "cols" to its values for
+        the records selected by "mask".
+        """
+        return {col: self[col][mask] for col in cols}
+
+    def flow_index(self):
+        """
+        Returns the flow index (see index_flows()) stored in the cache, or None
+        if there is no cache or this is a view of part of the file.
+        """
+        if self.cache is None or "flow_order" not in self.cache:
+            return None
+        return tuple(self.cache[key]
+                     for key in ["flow_ids", "flow_order", "flow_bounds"])
+
+
+def concat_cols(blks):
+    """
+    Concatenates a list of dictionaries mapping column name to array (e.g., the
+    results of HSLog.select() on successive blocks).
+    """
+    return {col: np.concatenate([blk[col] for blk in blks])
+            for col in blks[0].keys()}
+
+
+def hslog_ranges(num_recs, num_ranges):
+    """
+    Splits "num_recs" records into at most "num_ranges" contiguous, nonempty
+    ranges of roughly equal size. Returns a list of (start, stop) record
+    indices. Since the ranges are in units of records, the corresponding byte
+    ranges in the file are record-aligned.
+    """
+    num_ranges = max(min(num_ranges, num_recs), 1)
+    bounds = [num_recs * i // num_ranges for i in xrange(num_ranges + 1)]
+    return zip(bounds[:-1], bounds[1:])
+
+
+class HSLogRangeReader(object):
+    """
+    Scans a range of records of an HSLog file, block by block. Used by
+    scan_hslog() to scan ranges in parallel. If "cached" is True, then the
+    range is read from the file's columnar cache.
+    """
+
+    def __init__(self, fln, msg_len, scan, merge, cached=False):
+        self.fln = fln
+        self.msg_len = msg_len
+        self.scan = scan
+        self.merge = merge
+        self.cached = cached
+
+    def __call__(self, rng):
+        """
+        "rng" is a (start, stop) pair of record indices. Returns the merged
+        partial result for those records.
+        """
+        start, stop = rng
+        # Memory maps cannot be sent to other processes, so open the cache
+        # again here.
+        log = HSLog(self.fln, self.msg_len, cache=(
+            _open_hslog_cache(self.fln, self.msg_len) if self.cached
+            else None)).view(start, stop)
+        return reduce(self.merge, (self.scan(blk) for blk in log.blocks()))
+
+
+@profiling.timed("scan")
+def scan_hslog(log, scan, merge, processes=None):
+    """
+    Applies "scan" to each block of an HSLog object and combines the partial
+    results, in log order, using "merge", which must be associative. Files
+    (or their caches) with more than HSLOG_RANGE_MIN_BLOCKS blocks per process
+    are split into record-aligned ranges that are scanned by a pool of "processes"
+    processes (None means HSLOG_PROCESSES). "scan" and "merge" must be
+    module-level functions so that they can be sent to the pool.
+    """
+    profiling.count("records decoded", len(log))
+    profiling.count("bytes read", len(log) * log.msg_len if log.cache is None
+                    else path.getsize(get_cache_path(log.fln, "cols")))
+    num_ranges = _get_num_ranges(log, processes)
+    if num_ranges > 1:
+        print("Scanning {} in {} ranges".format(log.fln, num_ranges))
+        return reduce(merge, _map_ranges(
+            HSLogRangeReader(log.fln, log.msg_len, scan, merge,
+                             log.cache is not None),
+            hslog_ranges(len(log), num_ranges)))
+    return reduce(merge, (scan(blk) for blk in log.blocks()))
+
+
+def _get_num_ranges(log, processes):
+    """
+    Returns the number of ranges into which to split an HSLog object so that
+    they can be processed in parallel by up to "processes" processes (None
+    means HSLOG_PROCESSES). Returns 1 if the log should be processed serially.
+    """
+    if processes is None:
+        processes = HSLOG_PROCESSES
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    # Daemonic processes (e.g., pool workers that are each parsing a different
+    # file) cannot start pools of their own, so they always scan serially.
+    if processes <= 1 or multiprocessing.current_process().daemon:
+        return 1
+    return max(min(len(log) // (HSLOG_RANGE_MIN_BLOCKS * HSLOG_BLOCK_RECS),
+                   processes), 1)
+
+
+def _map_ranges(fnc, rngs, pool=None):
+    """
+    Applies "fnc" to each range in "rngs" using "pool", or, if it is None, a
+    new pool with one process per range.
+    """
+    if pool is not None:
+        return pool.map(fnc, rngs)
+    pool = multiprocessing.Pool(len(rngs))
+    res = pool.map(fnc, rngs)
+    # Clean up pool.
+    pool.close()
+    pool.join()
+    return res
+
+
+def index_flows(pkts):
+    """
+    Groups data packets by flow. A flow is identified by its sender, receiver,
+    protocol, source port, and destination port. "pkts" is a dictionary of
+    columns for the data packets. Returns a tuple of: a structured array of the
+    unique flows, the indices of the packets sorted by flow (keeping each flow's
+    packets in the order in which they were logged), and the bounds of each
+    flow's packets within that ordering.
+    """
+    flw_ids = np.rec.fromarrays(
+        [pkts[col] for col in ["sender", "recv", "proto", "sport", "dport"]],
+        names=["sender", "recv", "proto", "sport", "dport"])
+    uniq_ids, flw_idxs = np.unique(flw_ids, return_inverse=True)
+    order = np.argsort(flw_idxs, kind="mergesort")
+    bounds = np.searchsorted(flw_idxs[order], np.arange(len(uniq_ids) + 1))
+    return np.asarray(uniq_ids), order, bounds
+
+
+def _create_npy(fln, dtype, num):
+    """
+    Creates an .npy file for "num" values of type "dtype", without writing the
+    values. Returns a tuple of the form (filename, dtype, offset of the
+    values), which identifies the file for _read_npy() and _write_npy().
+    """
+    npy = np.lib.format.open_memmap(fln, mode="w+", dtype=dtype, shape=(num,))
+    offset = npy.offset
+    del npy
+    return fln, np.dtype(dtype), offset
+
+
+def _read_npy(npy, start, stop):
+    """
+    Reads values [start, stop) of an .npy file from _create_npy(). Unlike
+    memory-mapping the file, this does not keep the pages that were read in
+    memory.
+    """
+    fln, dtype, offset = npy
+    with open(fln, "rb") as fil:
+        fil.seek(offset + start * dtype.itemsize)
+        return np.fromfile(fil, dtype=dtype, count=stop - start)
+
+
+def _write_npy(npy, start, vals):
+    """
+    Writes "vals" to an .npy file from _create_npy(), starting at index
+    "start".
+    """
+    fln, dtype, offset = npy
+    with open(fln, "r+b") as fil:
+        fil.seek(offset + start * dtype.itemsize)
+        np.asarray(vals, dtype=dtype).tofile(fil)
+
+
+class HSLogColumnWriter(object):
+    """
+    Decodes a range of records of an HSLog file, block by block, and writes
+    the columns in HSLOG_CACHE_COLS into .npy files that hold those columns
+    for the whole file. Used by cache_hslog() to build the columns of a cache
+    in parallel.
+    """
+
+    def __init__(self, fln, msg_len, npys):
+        """
+        npys: A dictionary mapping each column to its .npy file (see
+              _create_npy()).
+        """
+        self.fln = fln
+        self.msg_len = msg_len
+        self.npys = npys
+        # Workers of a long-lived pool may have been started before
+        # HSLOG_BLOCK_RECS was changed.
+        self.block_recs = HSLOG_BLOCK_RECS
+
+    def __call__(self, rng):
+        """ "rng" is a (start, stop) pair of record indices. """
+        start, stop = rng
+        dtype = get_hslog_dtype(self.msg_len)
+        with open(self.fln, "rb") as fil:
+            for blk_start in xrange(start, stop, self.block_recs):
+                blk_stop = min(blk_start + self.block_recs, stop)
+                # Read each block instead of memory-mapping the file, so that
+                # the blocks that were already written are not kept in memory.
+                fil.seek(blk_start * dtype.itemsize)
+                blk = HSLog(self.fln, self.msg_len, np.fromfile(
+                    fil, dtype=dtype, count=blk_stop - blk_start))
+                for col, npy in self.npys.items():
+                    _write_npy(npy, blk_start, blk[col])
+
+
+def _read_flow_ids(npys, start, stop):
+    """
+    Returns the flow IDs (see index_flows()) of the data packets among records
+    [start, stop) of the columns in the .npy files "npys" (see
+    HSLogColumnWriter).
+    """
+    cols = {col: _read_npy(npys[col], start, stop)
+            for col in ["type", "sender", "recv", "proto", "sport", "dport"]}
+    pkts = (cols["type"] != 1) & (cols["type"] != 2)
+    return np.asarray(np.rec.fromarrays(
+        [cols[col][pkts] for col in ["sender", "recv", "proto", "sport",
+                                     "dport"]],
+        names=["sender", "recv", "proto", "sport", "dport"]))
+
+
+def _index_flows_blocks(npys, num_recs, order_fln):
+    """
+    Equivalent to index_flows() for the data packets in the .npy files "npys"
+    (see HSLogColumnWriter), but reads one block of HSLOG_BLOCK_RECS records
+    at a time. The order of the packets is written to the .npy file
+    "order_fln" instead of being returned. Returns a tuple of the form:
+        (unique flows, bounds of each flow's packets within the order)
+    """
+    rngs = [(start, min(start + HSLOG_BLOCK_RECS, num_recs))
+            for start in xrange(0, max(num_recs, 1), HSLOG_BLOCK_RECS)]
+    # First, find the unique flows.
+    uniq_ids = None
+    for start, stop in rngs:
+        blk_ids = np.unique(_read_flow_ids(npys, start, stop))
+        uniq_ids = (blk_ids if uniq_ids is None
+                    else np.unique(np.concatenate([uniq_ids, blk_ids])))
+    # Then, count the packets in each flow.
+    counts = np.zeros(len(uniq_ids), dtype=np.int64)
+    for start, stop in rngs:
+        counts += np.bincount(
+            np.searchsorted(uniq_ids, _read_flow_ids(npys, start, stop)),
+            minlength=len(uniq_ids))
+    bounds = np.r_[0, np.cumsum(counts)]
+    # Finally, write each block's packets, grouped by flow, after the packets
+    # from previous blocks in the same flow. "nexts" is the next free position
+    # of each flow.
+    order = _create_npy(order_fln, np.int64, bounds[-1])
+    nexts = bounds[:-1].copy()
+    num_pkts = 0
+    for start, stop in rngs:
+        flw_idxs = np.searchsorted(uniq_ids,
+                                   _read_flow_ids(npys, start, stop))
+        blk_order = np.argsort(flw_idxs, kind="mergesort") + num_pkts
+        blk_bounds = np.searchsorted(flw_idxs[blk_order - num_pkts],
+                                     np.arange(len(uniq_ids) + 1))
+        for flw in np.flatnonzero(np.diff(blk_bounds)):
+            _write_npy(order, nexts[flw],
+                       blk_order[blk_bounds[flw]:blk_bounds[flw + 1]])
+        nexts += np.diff(blk_bounds)
+        num_pkts += len(flw_idxs)
+    return uniq_ids, bounds
+
+
+@profiling.timed("cache")
+def cache_hslog(fln, msg_len=112, processes=None, pool=None):
+    """
+    Converts an HSLog file into a columnar cache stored next to it. The cache
+    contains the columns in HSLOG_CACHE_COLS and a per-flow index of the data
+    packets (see index_flows()). The columns are written to temporary .npy
+    files one block at a time (by up to "processes" processes; see
+    scan_hslog()) and then copied into the cache, so memory usage does not
+    grow with the size of the file. The cache is uncompressed so that its
+    columns can be memory-mapped and scanned block by block as well. "pool" is
+    an optional multiprocessing.Pool in which to decode the ranges (e.g., an
+    executor's), instead of a new one.
+    """
+    print("Caching: {}".format(fln))
+    log = HSLog(fln, msg_len)
+    tmp_dir = tempfile.mkdtemp(
+        prefix="{}.".format(path.basename(fln)),
+        dir=path.dirname(path.abspath(get_cache_path(fln, "cols"))))
+    try:
+        # Create the column files, using the first record to find each
+        # column's dtype.
+        first = HSLog(fln, msg_len, log.recs[:1])
+        npys = {col: _create_npy(path.join(tmp_dir, "{}.npy".format(col)),
+                                 first[col].dtype, len(log))
+                for col in HSLOG_CACHE_COLS}
+        writer = HSLogColumnWriter(fln, msg_len, npys)
+        num_ranges = _get_num_ranges(log, processes)
+        rngs = hslog_ranges(len(log), num_ranges)
+        if num_ranges > 1:
+            print("Caching {} in {} ranges".format(fln, num_ranges))
+            _map_ranges(writer, rngs, pool)
         else:
-            raise Exception(
-                "Message length must be either 112 or 116, but is: {}".format(
-                    msg_len))
-
-        ip_bytes = unpack("!H", data[2:4])[0]
-
-        sender = socket.inet_ntoa(data[12:16])
-        recv = socket.inet_ntoa(data[16:20])
-        proto = ord(data[9])
-        ihl = (ord(data[0]) & 0xF) * 4
-        sport = 0
-        dport = 0
-        seq = 0
-        thl = 0
-        if proto == 6:  # TCP
-            sport = unpack("!H", data[ihl:ihl+2])[0]
-            dport = unpack("!H", data[ihl+2:ihl+4])[0]
-            seq = unpack("!I", data[ihl+4:ihl+8])[0]
-            thl = (ord(data[ihl+12]) >> 4) * 4
-        byts = ip_bytes - ihl - thl
-        ts = float(ts[:20].strip('\x00')) / python_config.TDF
-
-        if t == 1 or t == 2:
-            # Start or end of a circuit.
-            sr_racks = (src, dst)
-            if t == 1:
-                # Circuit start.
-                circuit_starts[sr_racks].append(ts)
-            elif t == 2:
-                # Circuit end.
-                if not circuit_starts[sr_racks]:
-                    # If we do not have any circuit starts yet, then skip this
-                    # circuit end.
-                    continue
-                circuit_ends[sr_racks].append(ts)
+            for rng in rngs:
+                writer(rng)
+
+        order_fln = path.join(tmp_dir, "flow_order.npy")
+        flw_ids, flw_bounds = _index_flows_blocks(npys, len(log), order_fln)
+        npy_flns = {col: npy[0] for col, npy in npys.items()}
+        npy_flns["flow_order"] = order_fln
+        save_cache(fln, "cols", HSLOG_CACHE_VERSION, npy_flns=npy_flns,
+                   compress=False,
+                   msg_len=msg_len, flow_ids=flw_ids, flow_bounds=flw_bounds)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _open_hslog_cache(fln, msg_len=112):
+    """
+    Returns an HSLog file's columnar cache (as a dictionary of memory maps),
+    or None if it does not exist or is stale.
+    """
+    cache = load_cache(fln, "cols", HSLOG_CACHE_VERSION, memmap=True)
+    if cache is not None and cache["msg_len"] != msg_len:
+        print("Ignoring cache with different message length: {}".format(fln))
+        return None
+    return cache
+
+
+def _load_hslog_cache(fln, msg_len=112, pool=None):
+    """
+    Returns an HSLog file's columnar cache, creating it first (see
+    cache_hslog()) if HSLOG_CACHE is True, or None.
+    """
+    cache = _open_hslog_cache(fln, msg_len)
+    if cache is None and HSLOG_CACHE:
+        cache_hslog(fln, msg_len, pool=pool)
+        cache = _open_hslog_cache(fln, msg_len)
+    return cache
+
+
+def open_hslog(fln, msg_len=112):
+    """
+    Opens an HSLog file. Uses the file's columnar cache if one exists, creating
+    it first if HSLOG_CACHE is True.
+    """
+    return HSLog(fln, msg_len, cache=_load_hslog_cache(fln, msg_len))
+
+
+def prepare_hslogs(flns, msg_len=112, pool=None):
+    """
+    Creates the columnar caches for HSLog files that do not have one, if
+    HSLOG_CACHE is True. Call this before parsing files in a pool: here, each
+    file can be split across all of the cores, whereas pool workers must scan
+    their files serially (see scan_hslog()). If "pool" is not None, then the
+    files are split across its processes (see cache_hslog()).
+    """
+    if HSLOG_CACHE:
+        for fln in flns:
+            _load_hslog_cache(fln, msg_len, pool)
+
+
+@profiling.timed("index")
+def index_hslog(fln, msg_len=112, stride=HSLOG_INDEX_STRIDE):
+    """
+    Builds a sparse index of an HSLog file and stores it next to the file. The
+    index contains the timestamp of every "stride"-th record, as well as the
+    positions, types, racks, and timestamps of all circuit start and end
+    records. Only the record types are read in full.
+    """
+    print("Indexing: {}".format(fln))
+    recs = HSLog(fln, msg_len).recs
+    circ_recs = [np.zeros(0, dtype=np.int64)]
+    for start in xrange(0, len(recs), HSLOG_BLOCK_RECS):
+        typs = recs["type"][start:start + HSLOG_BLOCK_RECS]
+        circ_recs.append(start + np.flatnonzero((typs == 1) | (typs == 2)))
+    circ_recs = np.concatenate(circ_recs)
+    # Decode only the sampled records and the circuit records.
+    samples = HSLog(fln, msg_len, recs[::stride])
+    circs = HSLog(fln, msg_len, recs[circ_recs])
+    save_cache(fln, "idx", HSLOG_INDEX_VERSION, msg_len=msg_len,
+               stride=stride, num_recs=len(recs), ts=samples["ts"],
+               circ_recs=circ_recs, circ_type=circs["type"],
+               circ_src=circs["src"], circ_dst=circs["dst"],
+               circ_ts=circs["ts"])
+
+
+def load_hslog_index(fln, msg_len=112):
+    """
+    Returns the sparse index of an HSLog file (see index_hslog()), building it
+    first if necessary.
+    """
+    idx = load_cache(fln, "idx", HSLOG_INDEX_VERSION)
+    if idx is None or idx["msg_len"] != msg_len:
+        index_hslog(fln, msg_len)
+        idx = load_cache(fln, "idx", HSLOG_INDEX_VERSION)
+    return idx
+
+
+def read_hslog_time(fln, t0, t1, msg_len=112):
+    """
+    Returns an HSLog object containing only the records of an HSLog file whose
+    timestamps (in seconds, see the "ts" column) are in [t0, t1]. Uses the
+    sparse index to read only the blocks of records that can contain such
+    timestamps, which assumes that the log is in time order.
+    """
+    idx = load_hslog_index(fln, msg_len)
+    stride = int(idx["stride"])
+    samples = idx["ts"]
+    # Start at the last sampled record that is earlier than t0 and stop at the
+    # first sampled record that is later than t1.
+    start = stride * max(np.searchsorted(samples, t0, side="left") - 1, 0)
+    stop = min(stride * np.searchsorted(samples, t1, side="right"),
+               int(idx["num_recs"]))
+    log = HSLog(fln, msg_len, HSLog(fln, msg_len).recs[start:stop])
+    mask = (log["ts"] >= t0) & (log["ts"] <= t1)
+    return HSLog(fln, msg_len, log.recs[mask])
+
+
+def read_hslog_circuits(fln, i, j, msg_len=112, sr_racks=SR_RACKS):
+    """
+    Returns an HSLog object containing the records of an HSLog file from the
+    start of circuit "i" to the end of circuit "j" (inclusive) of the rack pair
+    "sr_racks". Circuit ends before the first circuit start are skipped, as in
+    get_seq_data(). Uses the sparse index to seek directly to the records.
+    """
+    idx = load_hslog_index(fln, msg_len)
+    pair = (idx["circ_src"] == sr_racks[0]) & (idx["circ_dst"] == sr_racks[1])
+    starts = idx["circ_recs"][pair & (idx["circ_type"] == 1)]
+    ends = idx["circ_recs"][pair & (idx["circ_type"] == 2)]
+    assert len(starts), "No circuits for rack pair: {}".format(sr_racks)
+    ends = ends[ends > starts[0]]
+    assert 0 <= i <= j < min(len(starts), len(ends)), \
+        "Invalid circuit range [{}, {}] for {} circuits".format(
+            i, j, min(len(starts), len(ends)))
+    return HSLog(fln, msg_len,
+                 HSLog(fln, msg_len).recs[starts[i]:ends[j] + 1])
+
+
+def get_circuit_timelines(fln, msg_len=112):
+    """
+    Extracts the circuit timeline of every rack pair in an HSLog file from its
+    sparse index (see index_hslog()), without decoding any data packets.
+    Circuit ends before a rack pair's first circuit start are skipped and
+    unmatched circuit starts or ends are discarded, as in get_seq_data().
+    Returns a dictionary mapping (src, dst) rack pair to a tuple of the form:
+        (circuit starts, circuit ends)
+    where both are NumPy arrays of timestamps (seconds).
+    """
+    idx = load_hslog_index(fln, msg_len)
+    typs = idx["circ_type"]
+    srcs = idx["circ_src"]
+    dsts = idx["circ_dst"]
+    tss = idx["circ_ts"]
+    circuit_starts = {}
+    circuit_ends = {}
+    for sr_racks in set(zip(srcs[typs == 1].tolist(),
+                            dsts[typs == 1].tolist())):
+        pair = (srcs == sr_racks[0]) & (dsts == sr_racks[1])
+        starts = np.flatnonzero(pair & (typs == 1))
+        ends = np.flatnonzero(pair & (typs == 2))
+        circuit_starts[sr_racks] = tss[starts]
+        circuit_ends[sr_racks] = tss[ends[ends > starts[0]]]
+    _validate_circuits(circuit_starts, circuit_ends)
+    return {sr_racks: (circuit_starts[sr_racks], circuit_ends[sr_racks])
+            for sr_racks in circuit_starts}
+
+
+def parse_schedule(schedule, sr_racks=SR_RACKS, tdf=python_config.TDF):
+    """
+    Parses a RunSchedule schedule (see click_common.setFixedSchedule()) of the
+    form:
+        "<num configs> <duration (us)> <config> <duration (us)> <config> ..."
+    where each config lists the src rack of every dst rack (-1 for none).
+    Returns a tuple of the form:
+        (day starts, day ends, schedule length)
+    describing when the rack pair "sr_racks" has a circuit during one
+    repetition of the schedule, in seconds since the start of the schedule.
+    Durations are divided by "tdf", like the timestamps in HSLog files.
+    """
+    tokens = schedule.split()
+    num_configs = int(tokens[0])
+    assert len(tokens) == 1 + 2 * num_configs, \
+        "Malformed schedule: {}".format(schedule)
+    durs = np.array(tokens[1::2], dtype=float) * 1e-6 / tdf
+    src, dst = [rack - SCHEDULE_RACK_OFFSET for rack in sr_racks]
+    days = np.array([int(config.split("/")[dst]) == src
+                     for config in tokens[2::2]])
+    offsets = np.concatenate(([0.], np.cumsum(durs)))
+    return offsets[:-1][days], offsets[1:][days], offsets[-1]
+
+
+def _summarize(vals):
+    """
+    Returns a tuple of the form:
+        (mean, standard deviation, percentiles)
+    of an array, where the percentiles are an array corresponding to
+    PERCENTILES.
+    """
+    return np.mean(vals), np.std(vals), np.percentile(vals, PERCENTILES)
+
+
+def get_schedule_fidelity(cir_starts, cir_ends, schedule=None,
+                          sr_racks=SR_RACKS, tdf=python_config.TDF):
+    """
+    Compares the validated circuit start and end times (seconds) of the rack
+    pair "sr_racks" (see get_circuit_timelines()) to a RunSchedule schedule
+    (see parse_schedule()). If "schedule" is None, then the rack pair is
+    expected to have one circuit per week, with the median day and week
+    lengths. Returns a dictionary containing:
+        num_circuits: the number of circuits
+        day_len_us, night_len_us: summaries (see _summarize()) of the circuit
+            lengths and of the gaps between consecutive circuits
+        day_err_us, night_err_us: summaries of the differences between the
+            measured and expected day and night lengths
+        jitter_us: percentiles (see PERCENTILES) of the absolute differences
+            between the measured and expected times between consecutive
+            circuit starts
+        drift_us: an array of the offsets of each circuit start from an ideal
+            schedule that begins at the first circuit start
+        drift_ppm: the rate at which the circuit starts drift from the ideal
+            schedule, in parts per million
+    All times are in microseconds.
+    """
+    cir_starts = np.asarray(cir_starts)
+    cir_ends = np.asarray(cir_ends)
+    num_circuits = len(cir_starts)
+    assert num_circuits >= 2, \
+        "Need at least two circuits, but found: {}".format(num_circuits)
+    day_lens = cir_ends - cir_starts
+    night_lens = cir_starts[1:] - cir_ends[:-1]
+    periods = np.diff(cir_starts)
+    if schedule is None:
+        exp_starts = np.zeros(1)
+        exp_ends = np.array([np.median(day_lens)])
+        sched_len = np.median(periods)
+    else:
+        exp_starts, exp_ends, sched_len = parse_schedule(
+            schedule, sr_racks, tdf)
+        assert len(exp_starts), \
+            "Rack pair {} has no circuits in schedule: {}".format(
+                sr_racks, schedule)
+    num_days = len(exp_starts)
+    exp_day_lens = exp_ends - exp_starts
+    # The expected time from the start of each day to the start of the next,
+    # wrapping around to the next repetition of the schedule.
+    exp_periods = np.diff(np.append(exp_starts, exp_starts[0] + sched_len))
+
+    # Match circuit i to day (i + phase) % num_days of the schedule, choosing
+    # the phase that best matches the times between circuit starts.
+    days = (np.arange(num_days)[:, np.newaxis] +
+            np.arange(num_circuits)[np.newaxis, :]) % num_days
+    errs = np.abs(periods - exp_periods[days[:, :-1]]).sum(axis=1)
+    days = days[np.argmin(errs)]
+    exp_periods = exp_periods[days[:-1]]
+
+    # The ideal circuit starts, if there were no jitter and no drift.
+    ideal_starts = cir_starts[0] + np.concatenate(([0.],
+                                                   np.cumsum(exp_periods)))
+    drift = cir_starts - ideal_starts
+    drift_rate = np.polyfit(cir_starts - cir_starts[0], drift, 1)[0]
+    return {
+        "num_circuits": num_circuits,
+        "day_len_us": _summarize(day_lens * 1e6),
+        "night_len_us": _summarize(night_lens * 1e6),
+        "day_err_us": _summarize((day_lens - exp_day_lens[days]) * 1e6),
+        "night_err_us": _summarize(
+            (night_lens - (exp_periods - exp_day_lens[days[:-1]])) * 1e6),
+        "jitter_us": np.percentile(np.abs(periods - exp_periods) * 1e6,
+                                   PERCENTILES),
+        "drift_us": drift * 1e6,
+        "drift_ppm": drift_rate * 1e6,
+    }
+
+
+def print_schedule_fidelity(report):
+    """
+    Prints a report returned by get_schedule_fidelity().
+    """
+    print("Circuits: {}".format(report["num_circuits"]))
+    for key in ["day_len_us", "night_len_us", "day_err_us", "night_err_us"]:
+        avg, std, prcs = report[key]
+        print("{} avg: {}, std dev: {}".format(key, avg, std))
+        for prc, val in zip(PERCENTILES, prcs):
+            print("    {}: {}".format(prc, val))
+    print("jitter_us:")
+    for prc, val in zip(PERCENTILES, report["jitter_us"]):
+        print("    {}: {}".format(prc, val))
+    print("drift_us final: {}, max: {}, rate (ppm): {}".format(
+        report["drift_us"][-1], np.abs(report["drift_us"]).max(),
+        report["drift_ppm"]))
+
+
+def ip_to_str(ip):
+    """ Converts an IP address from an integer to a dotted string. """
+    return socket.inet_ntoa(pack("!I", ip))
+
+
+def clean_flow(tss, seqs, byts, voqs):
+    """
+    Reorders a flow's packets, given as parallel lists of timestamps, sequence
+    numbers, data bytes, and VOQ lengths. Returns a list of datapoints of the
+    form (ts, seq, byts, voq).
+
+    A packet whose sequence number is within 1 of the end of the last datapoint
+    is in order. Otherwise, it is held back until an in-order packet ends where
+    it begins, at which point it takes that packet's place (keeping the
+    in-order packet's timestamp). Held back packets are stored in a dict keyed
+    by sequence number, so each packet is examined a constant number of times.
+    """
+    # The datapoints for this flow.
+    out = []
+    # Unmatched (i.e., out of order) datapoints for this flow. Maps sequence
+    # number to a deque of (arrival index, seq, byts, voq), in arrival order.
+    seen = {}
+    for idx, (ts, seq, byt, voq) in enumerate(zip(tss, seqs, byts, voqs)):
+        if not out:
+            # First timestamp for this flow.
+            out.append((ts, seq, byt, voq))
             continue
+        # Extract previous datapoint.
+        _, last_seq, last_bytes, _ = out[-1]
+
+        # Check whether the current sequence number equals the last sequence
+        # number plus the number of data bytes in the last packet (i.e., check
+        # that this actually is the next packet, in case the log messages are
+        # out of order).
+        if abs(last_seq + last_bytes - seq) < 2:
+            # Yes, it is the next packet. Repeatedly look for an unmatched
+            # packet that came immediately after the current packet. If
+            # several match (within 1 byte), pick the one that arrived first.
+            while True:
+                nxt = seq + byt
+                best = None
+                for key in (nxt - 1, nxt, nxt + 1):
+                    cands = seen.get(key)
+                    if cands and (best is None or
+                                  cands[0][0] < seen[best][0][0]):
+                        best = key
+                if best is None:
+                    break
+                # Change the current seq, byts, and voq.
+                _, seq, byt, voq = seen[best].popleft()
+                if not seen[best]:
+                    del seen[best]
+            out.append((ts, seq, byt, voq))
+        else:
+            # No, it is not the next packet. Save it for later.
+            seen.setdefault(seq, collections.deque()).append(
+                (idx, seq, byt, voq))
+    return out
+
+
+def _scan_seq_log(blk, pkts=True):
+    """
+    Scan function for _read_seq_log(). Returns a tuple of the form:
+        ([circuit columns], [data packet columns])
+    If "pkts" is False, then the list of data packet columns is empty.
+    """
+    circuits = (blk["type"] == 1) | (blk["type"] == 2)
+    return ([blk.select(["type", "src", "dst", "ts"], circuits)],
+            [blk.select(["sender", "recv", "proto", "sport", "dport", "ts",
+                         "seq", "byts", "voq"], ~circuits)] if pkts else [])
+
+
+def _merge_seq_logs(a, b):
+    """
+    Merge function for _read_seq_log(). Concatenates partial results.
+    """
+    return a[0] + b[0], a[1] + b[1]
+
+
+def _read_seq_log(fln, msg_len=112):
+    """
+    Scans an HSLog file once. Returns a tuple of the form:
+        (circuit starts, circuit ends, data packets, flow index)
+    where the circuit starts and ends are dictionaries mapping (src, dst) rack
+    pair to a list of timestamps, the data packets are a dictionary of columns,
+    and the flow index is the output of index_flows() for those packets.
+    """
+    # Scan the log once, separating the circuit start/end records from the data
+    # packets.
+    log = open_hslog(fln, msg_len)
+    return _get_seq_log(
+        log, *scan_hslog(log, _scan_seq_log, _merge_seq_logs))
+
+
+def _get_seq_log(log, circ_blks, pkt_blks):
+    """
+    Combines the partial results of _scan_seq_log() for the HSLog object "log".
+    Returns the same tuple as _read_seq_log().
+    """
+    circuit_starts, circuit_ends = _get_circuits(circ_blks)
+    pkts = concat_cols(pkt_blks)
+    del circ_blks, pkt_blks
+    return (circuit_starts, circuit_ends, pkts,
+            log.flow_index() or index_flows(pkts))
+
 
-        flow = (sender, recv, proto, sport, dport)
+def _get_circuits(circ_blks):
+    """
+    Extracts the circuit starts and ends from the circuit columns of
+    _scan_seq_log(). Returns a tuple of the form:
+        (circuit starts, circuit ends)
+    (see _read_seq_log()).
+    """
+    circuit_starts = collections.defaultdict(list)
+    circuit_ends = collections.defaultdict(list)
+    circs = concat_cols(circ_blks)
+
+    # Extract the circuit starts and ends. This must be done after merging,
+    # since whether a circuit end is skipped depends on the earlier records.
+    for t, src, dst, ts in zip(*[circs[col].tolist()
+                                 for col in ["type", "src", "dst", "ts"]]):
+        sr_racks = (src, dst)
+        if t == 1:
+            # Circuit start.
+            circuit_starts[sr_racks].append(ts)
+        elif t == 2:
+            # Circuit end.
+            if not circuit_starts[sr_racks]:
+                # If we do not have any circuit starts yet, then skip this
+                # circuit end.
+                continue
+            circuit_ends[sr_racks].append(ts)
+    return circuit_starts, circuit_ends
+
+
+@profiling.timed("clean")
+def _get_flows(pkts, flw_index, clean=True):
+    """
+    Groups data packets by flow, optionally cleaning each flow. Returns a
+    dictionary mapping flow to an array of datapoints (see FLOW_DTYPE).
+    """
+    flows = {}
+    uniq_ids, order, bounds = flw_index
+    for flw_idx, (sender, recv, proto, sport, dport) in enumerate(
+            uniq_ids.tolist()):
+        flow = (ip_to_str(sender), ip_to_str(recv), proto, sport, dport)
+        idxs = order[bounds[flw_idx]:bounds[flw_idx + 1]]
+        # Store each flow's datapoints compactly, as a structured array.
         if clean:
-            if flows[flow]:
-                # Extract previous datapoint.
-                _, last_seq, last_bytes, _ = flows[flow][-1]
-
-                # Check whether the current sequence number equals the last sequence
-                # number plus the number of data bytes in the last packet (i.e.,
-                # check that this actually is the next packet, in case the log
-                # messages are out of order).
-                if abs(last_seq + last_bytes - seq) < 2:
-                    # Yes, it is the next packet.
-                    updated = True
-                    while updated:
-                        updated = False
-                        # Look over unmatched packets until we find one that...?
-                        for prev_seen in seen[flow]:
-                            _, prev_seq, prev_bytes, prev_voq = prev_seen
-                            # Check if this earlier packet actually came immediately
-                            # before the current packet.
-                            if abs(seq + byts - prev_seq) < 2:
-                                # Change the current seq, byts, and voq. Does
-                                # this have something to do with packet
-                                # reordering?
-                                seq = prev_seq
-                                byts = prev_bytes
-                                voq = prev_voq
-                                seen[flow].remove(prev_seen)
-                                updated = True
-                                break
-                    flows[flow].append((ts, seq, byts, voq))
-                else:
-                    # No, it is not the next packet. Save it for later.
-                    seen[flow].append((ts, seq, byts, voq))
-            else:
-                # First timestamp for this flow.
-                flows[flow].append((ts, seq, byts, voq))
+            flows[flow] = np.array(
+                clean_flow(*[pkts[col][idxs].tolist()
+                             for col in ["ts", "seq", "byts", "voq"]]),
+                dtype=FLOW_DTYPE)
         else:
             # Do not perform flow cleaning. Record all packets.
-            flows[flow].append((ts, seq, byts, voq))
+            flw = np.empty(len(idxs), dtype=FLOW_DTYPE)
+            for col in FLOW_DTYPE.names:
+                flw[col] = pkts[col][idxs]
+            flows[flow] = flw
+    profiling.count("flows", len(flows))
+    return flows
 
+
+def _validate_circuits(circuit_starts, circuit_ends):
+    """
+    Validates the circuit starts and ends of every rack pair, discarding
+    unmatched circuit starts or ends in place.
+    """
     # Validate the circuit starts and ends.
     for sr_racks in circuit_starts.keys():
         num_starts = len(circuit_starts[sr_racks])
@@ -189,7 +1246,16 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
         assert (diffs > 0).all(), \
             ("Not all circuits have positive duration (i.e., there are "
              "mismatched starts and ends)!")
-    print("Circuit starts/ends: {}".format(len(circuit_starts[SR_RACKS])))
+
+
+def _get_circuit_stats(cir_starts, cir_ends):
+    """
+    Computes the average circuit bounds of one rack pair, relative to the end
+    of the previous circuit. "cir_starts" and "cir_ends" are the rack pair's
+    validated circuit start and end times. Returns a tuple of the form:
+        (starts, ends, nxt_starts, nxt_ends, nxt_nxt_starts, nxt_nxt_ends)
+    """
+    print("Circuit starts/ends: {}".format(len(cir_starts)))
 
     # Calculate stats about the days and weeks.
     starts = []
@@ -200,18 +1266,18 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
     nxt_nxt_ends = []
     day_lens = []
     week_lens = []
-    for i in xrange(1, len(circuit_starts[SR_RACKS]) - 2):
+    for i in xrange(1, len(cir_starts) - 2):
         # Use the end of the previous circuit as the relative starting point.
-        prev_end = circuit_ends[SR_RACKS][i-1]
+        prev_end = cir_ends[i-1]
 
-        cur_start = circuit_starts[SR_RACKS][i]
-        cur_end = circuit_ends[SR_RACKS][i]
+        cur_start = cir_starts[i]
+        cur_end = cir_ends[i]
 
-        nxt_start = circuit_starts[SR_RACKS][i + 1]
-        nxt_end = circuit_ends[SR_RACKS][i + 1]
+        nxt_start = cir_starts[i + 1]
+        nxt_end = cir_ends[i + 1]
 
-        nxt_nxt_start = circuit_starts[SR_RACKS][i + 2]
-        nxt_nxt_end = circuit_ends[SR_RACKS][i + 2]
+        nxt_nxt_start = cir_starts[i + 2]
+        nxt_nxt_end = cir_ends[i + 2]
 
         starts.append((cur_start - prev_end) * 1e6)
         ends.append((cur_end - prev_end) * 1e6)
@@ -225,15 +1291,17 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
         day_lens.append((cur_end - cur_start) * 1e6)
         week_lens.append((nxt_start - cur_start) * 1e6)
     # Compute average start/end times and day/week lengths. Remove the first and
-    # last five datapoints.
-    starts_avg = np.average(starts[5:-5])
-    ends_avg = np.average(ends[5:-5])
-    nxt_starts_avg = np.average(nxt_starts[5:-5])
-    nxt_ends_avg = np.average(nxt_ends[5:-5])
-    nxt_nxt_starts_avg = np.average(nxt_nxt_starts[5:-5])
-    nxt_nxt_ends_avg = np.average(nxt_nxt_ends[5:-5])
-    day_lens = day_lens[5:-5]
-    week_lens = week_lens[5:-5]
+    # last few datapoints (see CIRCUIT_STATS_TRIM). See get_schedule_fidelity()
+    # for a more thorough analysis of the circuit timing.
+    trim = slice(CIRCUIT_STATS_TRIM, -CIRCUIT_STATS_TRIM)
+    starts_avg = np.average(starts[trim])
+    ends_avg = np.average(ends[trim])
+    nxt_starts_avg = np.average(nxt_starts[trim])
+    nxt_ends_avg = np.average(nxt_ends[trim])
+    nxt_nxt_starts_avg = np.average(nxt_nxt_starts[trim])
+    nxt_nxt_ends_avg = np.average(nxt_nxt_ends[trim])
+    day_lens = day_lens[trim]
+    week_lens = week_lens[trim]
     print("day avg: {}, std dev: {}".format(
         np.average(day_lens), np.std(day_lens)))
     print("week avg: {}, std dev: {}".format(
@@ -243,34 +1311,47 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
            "nxt_nxt_ends avg: {}").format(
                starts_avg, ends_avg, nxt_starts_avg, nxt_ends_avg,
                nxt_nxt_starts_avg, nxt_nxt_ends_avg))
+    return (starts_avg, ends_avg, nxt_starts_avg, nxt_ends_avg,
+            nxt_nxt_starts_avg, nxt_nxt_ends_avg)
 
+
+@profiling.timed("chunk")
+def _get_flow_chunks(flows, cir_starts, cir_ends, dur, time_offset_s):
+    """
+    Splits each flow into chunks of three circuits of one rack pair, whose
+    validated circuit start and end times are "cir_starts" and "cir_ends".
+    Returns a dictionary mapping flow to a tuple of the form:
+        (average interpolated seqs, original chunks)
+    """
     print("Found {} flows".format(len(flows)))
     results = {}
     for f in flows.keys():
-        if "10.1.3." in f[0]:
-            # Skip the reverse flows (i.e., skip the ACKs, since we only care
-            # about the data packets).
-            print("Skipping flow: {}".format(f))
-            continue
-        else:
-            print("Parsing flow: {}".format(f))
+        print("Parsing flow: {}".format(f))
 
         # Interpolated and uninterpolated (i.e., original) chunks for this flow.
-        seqs_interp = []
-        # voqs_interp = []
+        # Row i of seqs_interp is the interpolated seqs for the i-th chunk in
+        # chunks_orig.
+        seqs_interp = np.empty(
+            (len(xrange(1, len(cir_starts) - 2, 3)), dur))
         chunks_orig = []
-        # The idx of the last datapoint in the previous chunk.
-        last_idx = 0
         # The number of chunks with no data (i.e., bad chunks).
         bad_chunks = 0
-        first_ts = flows[f][0][0]
-        last_ts = flows[f][-1][0]
-        for circuit_idx in xrange(1, len(circuit_starts[SR_RACKS]) - 2, 3):
+        flw_tss = flows[f]["ts"]
+        flw_seqs = flows[f]["seq"]
+        flw_voqs = flows[f]["voq"]
+        first_ts = flw_tss[0]
+        last_ts = flw_tss[-1]
+        # The running maximum of the timestamps. The log is written in time
+        # order, so this is normally identical to the timestamps themselves, but
+        # it keeps np.searchsorted() correct if a few log messages are out of
+        # order.
+        flw_max_tss = np.maximum.accumulate(flw_tss)
+        for circuit_idx in xrange(1, len(cir_starts) - 2, 3):
             chunk_idx = (circuit_idx - 1) / 3
-            prev_end = circuit_ends[SR_RACKS][circuit_idx - 1]
-            cur_start = circuit_starts[SR_RACKS][circuit_idx]
-            cur_end = circuit_ends[SR_RACKS][circuit_idx]
-            nxt_nxt_end = circuit_ends[SR_RACKS][circuit_idx + 2]
+            prev_end = cir_ends[circuit_idx - 1]
+            cur_start = cir_starts[circuit_idx]
+            cur_end = cir_ends[circuit_idx]
+            nxt_nxt_end = cir_ends[circuit_idx + 2]
 
             # We skip the current chunk if the end of the current circuit is
             # earlier than the first timestamp, or the start of the current
@@ -278,62 +1359,51 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
             # two circuits after the current circuit.
             if not ((cur_end < first_ts) or
                     (cur_start > last_ts) or
-                    (circuit_idx + 1 >= len(circuit_ends[SR_RACKS])) or
-                    (circuit_idx + 2 >= len(circuit_ends[SR_RACKS]))):
-                # A list of pairs where the first element is a relative
-                # timestamp and the second element is a relative sequence
-                # number.
-                out = []
-                # The first (absolute) sequence number in this flow.
-                first_seq = -1
-                for idx in xrange(last_idx, len(flows[f])):
-                    ts, seq, _, voq = flows[f][idx]
-                    if ts > nxt_nxt_end + time_offset_s:
-                        # The timestamp is too late, so we drop this
-                        # datapoint. We are done with the current chunk.
-                        break
-                    elif ts >= prev_end + time_offset_s:
-                        # The timestamp is in the valid range.
-                        rel_ts = (ts - prev_end - time_offset_s) * 1e6
-                        if first_seq == -1:
-                            first_seq = seq
-                            # print("First seq num in circuit {}: {}".format(
-                            #     i, first_seq))
-                            # print("rel_ts: {}".format(rel_ts))
-                        rel_seq = seq - first_seq
-                        if out and rel_ts == out[-1][0]:
-                            # Do not add this result if there already exists a
-                            # value for this timestamp.
-                            print(("Warning: Dropping datapoint ({}, {}) "
-                                   "because we already have data for that "
-                                   "timestamp!").format(
-                                       rel_ts, rel_seq))
-                            continue
-                        out.append((rel_ts, rel_seq, voq))
-                    else:
-                        # The timestamp is too early, so we drop this
-                        # datapoint. We are before the current chunk.
-                        pass
-
-                    if ts < cur_end + time_offset_s:
-                        # The timestamp is the latest timestamp we have seen, so
-                        # record its idx so that we avoid doing duplicate work.
-                        last_idx = idx
-                if not out:
+                    (circuit_idx + 1 >= len(cir_ends)) or
+                    (circuit_idx + 2 >= len(cir_ends))):
+                # The chunk contains the datapoints before the first timestamp
+                # that is too late, excluding those whose timestamps are too
+                # early.
+                lo = prev_end + time_offset_s
+                hi = nxt_nxt_end + time_offset_s
+                start = np.searchsorted(flw_max_tss, lo, side="left")
+                stop = np.searchsorted(flw_max_tss, hi, side="right")
+                valid = flw_tss[start:stop] >= lo
+                tss = flw_tss[start:stop][valid]
+                seqs = flw_seqs[start:stop][valid]
+                voqs = flw_voqs[start:stop][valid]
+                # Relative timestamps, and sequence numbers relative to the
+                # first (absolute) sequence number in this chunk.
+                rel_tss = (tss - prev_end - time_offset_s) * 1e6
+                rel_seqs = seqs - seqs[:1]
+                # Do not add a datapoint if there already exists a value for
+                # its timestamp (i.e., if the previous datapoint has the same
+                # timestamp).
+                dups = np.zeros(len(rel_tss), dtype=bool)
+                dups[1:] = rel_tss[1:] == rel_tss[:-1]
+                for rel_ts, rel_seq in zip(rel_tss[dups].tolist(),
+                                           rel_seqs[dups].tolist()):
+                    print(("Warning: Dropping datapoint ({}, {}) because we "
+                           "already have data for that timestamp!").format(
+                               rel_ts, rel_seq))
+                rel_tss = rel_tss[~dups]
+                rel_seqs = rel_seqs[~dups]
+                voqs = voqs[~dups]
+                if not len(rel_tss):
                     # No data for this chunk.
                     bad_chunks += 1
-                    out = [(0, 0, 0), (dur, 0, 0)]
-                wraparound = False
-                for _, seq, _ in out:
-                    if seq < -1e8 or seq > 1e8:
-                        wraparound = True
-                if wraparound:
+                    rel_tss = np.array([0, dur], dtype=float)
+                    rel_seqs = np.zeros(2, dtype=np.int64)
+                    voqs = np.zeros(2, dtype=np.int32)
+                if (np.abs(rel_seqs) > 1e8).any():
                     print("Warning: Wraparound detected. Dropping results!")
                 else:
                     # This is valid data, so we will store it. Sort the data so
                     # that it can be used by numpy.interp().
-                    out = sorted(out, key=lambda val: val[0])
-                    seq_xs, seq_ys, voq_ys = zip(*out)
+                    order = np.argsort(rel_tss, kind="mergesort")
+                    seq_xs = rel_tss[order]
+                    seq_ys = rel_seqs[order]
+                    voq_ys = voqs[order]
                     diffs = np.diff(seq_xs) > 0
                     if not np.all(diffs):
                         print("diffs: {}".format(diffs))
@@ -341,33 +1411,44 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
                             "\n".join([
                                 ("    seq x: {}, seq y: {}, voq y: "
                                  "{}").format(sx, sy, vy)
-                                for sx, sy, vy in out])))
+                                for sx, sy, vy in zip(
+                                    seq_xs.tolist(), seq_ys.tolist(),
+                                    voq_ys.tolist())])))
                         raise Exception(
                             "numpy.interp() requires x values to be increasing")
                     # Interpolate based on the data that we have.
-                    seqs_interp.append(np.interp(xrange(dur), seq_xs, seq_ys))
+                    seqs_interp[len(chunks_orig)] = np.interp(
+                        np.arange(dur), seq_xs, seq_ys)
                     # Undo the artificial left-shift, since the VOQ lengths are
                     # measured precisely.
-                    voq_xs = [sx + time_offset_s * 1e6 for sx in seq_xs]
+                    voq_xs = seq_xs + time_offset_s * 1e6
                     # Also record the original (uninterpolated) chunk data.
                     chunks_orig.append(
                         (seq_xs, seq_ys, voq_xs, voq_ys, chunk_idx))
 
-        print("Chunks for this flow: {}".format(len(seqs_interp)))
+        print("Chunks for this flow: {}".format(len(chunks_orig)))
         print("Bad chunks for this flow: {}".format(bad_chunks))
-        if seqs_interp:
+        if chunks_orig:
             # If there is data for this flow...
-            print("Timestamps for this flow: {}".format(len(seqs_interp[0])))
-            # First, convert the results into a list of lists, where each
-            # sublist corresponds to one timestep and each entry in each sublist
-            # corresponds to a sequence number at that timestep. Then, average
-            # the list of sequence numbers at each timestep, creating the final
-            # results for this flow.
-            results[f] = ([np.average(seq_ys) for seq_ys in zip(*seqs_interp)],
+            print("Timestamps for this flow: {}".format(dur))
+            # Average the sequence numbers at each timestep across chunks,
+            # creating the final results for this flow.
+            results[f] = (seqs_interp[:len(chunks_orig)].mean(axis=0),
                           chunks_orig)
+        profiling.count("chunks", len(chunks_orig))
+    return results
 
+
+@profiling.timed("interpolate")
+def _aggregate_chunks(results, num_circuits, dur):
+    """
+    Averages the per-flow results from _get_flow_chunks() across flows and
+    chunks. "num_circuits" is the number of circuits of the rack pair. Returns a
+    tuple of the form:
+        ((results_seqs, results_voqs), chunks_origs)
+    """
     # Reorganize from flows -> chunks to chunks -> flows.
-    num_chunks = (len(circuit_starts[SR_RACKS]) - 1) // 3
+    num_chunks = (num_circuits - 1) // 3
     # List where each entry is a represents a chunk and is a dictionary mapping
     # flow to a list of all the sets of datapoints for that flow and that
     # chunk. Each flow entry list should have onle a single set of datapoints.
@@ -385,9 +1466,9 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
     # To create aggregate VOQ results, first merge datapoints across flows and
     # interpolate. Then, average across chunks.
     #
-    # List of chunks, where each entry is the interpolated VOQ line for that
-    # chunk.
-    results_voqs = []
+    # Row i is the interpolated VOQ line for the i-th chunk with results.
+    voqs_interp = np.empty((num_chunks, dur))
+    num_voqs = 0
     for chunk_idx, chunk_flws in enumerate(results_by_chunk):
         chunk_combined = []
         # Loop over all flows in this chunk, adding their datapoints to a
@@ -409,34 +1490,42 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
                 assert chunk_idx == target_chunk_idx, \
                     ("Inconsistency in chunk_idx. Should be: {}, but is: "
                      "{}").format(target_chunk_idx, chunk_idx)
-                chunk_combined.extend(zip(voq_xs, voq_ys))
+                chunk_combined.append((voq_xs, voq_ys))
         if not chunk_combined:
             print("No results for chunk: {}".format(chunk_idx))
         else:
-            # Sort the combined list of chunks in preparation for interpolation.
-            chunk_combined = sorted(chunk_combined, key=lambda val: val[0])
-            # Separate the xs and voqs into separate lists.
-            voq_xs, voq_ys = zip(*chunk_combined)
+            # Merge the flows' datapoints, then sort them (stably) in
+            # preparation for interpolation.
+            voq_xs, voq_ys = [
+                np.concatenate(col) for col in zip(*chunk_combined)]
+            order = np.argsort(voq_xs, kind="mergesort")
+            voq_xs = voq_xs[order]
+            voq_ys = voq_ys[order]
             # Interpolate and record the results for this chunk. Note that the
             # voq_xs have been rescaled to remove the timing offset. We can
             # discard the voq_xs after this because the np.interp() takes the
             # correct voq_xs and solves for the voq_ys at all other timestamps.
             # I.e., the interpolated results are based on the correct voq_xs, so
             # they are correct as well.
-            results_voqs.append(np.interp(xrange(dur), voq_xs, voq_ys))
-    # Convert from a list where each item is a chunk to a list where each item
-    # is a timestamp.
-    results_voqs = zip(*results_voqs)
+            voqs_interp[num_voqs] = np.interp(np.arange(dur), voq_xs, voq_ys)
+            num_voqs += 1
     # Compute the average VOQ len at each timestamp.
-    results_voqs = [np.average(voq) for voq in results_voqs]
-
-    # First, turn a list of lists of results for each flow into a list of lists
-    # of results for all flows at one timestep. Then, average the results of all
-    # flows at each timestep. So, the output is finally: For each timestep, the
-    # average sequence number of all flows.
-    results_seqs = [np.average(r)
-                    for r in zip(*[seq_ys for seq_ys, _ in results.values()])]
-    # Extract the chunk results.
+    results_voqs = (voqs_interp[:num_voqs].mean(axis=0) if num_voqs
+                    else np.array([]))
+
+    # Average the results of all flows at each timestep. So, the output is
+    # finally: For each timestep, the average sequence number of all flows.
+    results_seqs = (
+        np.vstack([seq_ys for seq_ys, _ in results.values()]).mean(axis=0)
+        if results else np.array([]))
+    return (results_seqs, results_voqs), _get_chunks_origs(results)
+
+
+def _get_chunks_origs(results):
+    """
+    Extracts the original chunks for each flow from the results of
+    _get_flow_chunks().
+    """
     chunks_origs = {
         flw: chunks_orig for flw, (_, chunks_orig) in results.items()}
     print("Flows for which we have results:\n{}".format(
@@ -444,111 +1533,513 @@ def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True):
             "    {}: {} chunks".format(
                 flw, len(chunks_orig))
             for flw, chunks_orig in chunks_origs.items()])))
-    return ((results_seqs, results_voqs),
-            (starts_avg, ends_avg, nxt_starts_avg, nxt_ends_avg,
-             nxt_nxt_starts_avg, nxt_nxt_ends_avg),
-            chunks_origs)
+    return chunks_origs
 
 
-def parse_packet_log(fln, msg_len=112):
-    print("Parsing: {}".format(fln))
-    # Mapping from (sender, receiver) to combined, circuit, and packet
-    # latencies, respectively.
-    lats = []
-    lats_c = []
-    lats_p = []
-    # Mapping from (sender, receiver) to total, circuit, and packet bytes,
-    # respectively.
-    byts = collections.defaultdict(int)
-    byts_c = collections.defaultdict(int)
-    byts_p = collections.defaultdict(int)
-    # Mapping from (sender, receiver) to when traffic from the sender to the
-    # receiver started and ended, respectively.
-    flw_starts = {}
-    flw_ends = {}
-
-    # bytes_in_rtt = collections.defaultdict(lambda: collections.defaultdict(int))
-    for msg in msg_from_file(fln, msg_len):
-        if msg_len == 112:
-            # type (int), timestamp (char[32]), latency (int), src (int),
-            # dst (int), data (char[64])
-            typ, ts, lat, _, _, data = unpack("i32siii64s", msg)
-        elif msg_len == 116:
-            # type (int), timestamp (char[32]), latency (int), src (int),
-            # dst (int), VOQ length (int), data (char[64])
-            typ, ts, lat, _, _, _, data = unpack("i32siiii64s", msg)
-        else:
-            raise Exception(
-                "Message length must be either 112 or 116, but is: {}".format(
-                    msg_len))
-
-        ip_bytes = unpack("!H", data[2:4])[0]
-        sender = int(socket.inet_ntoa(data[12:16]).split(".")[2])
-        recv = int(socket.inet_ntoa(data[16:20]).split(".")[2])
-        sr_racks = (sender, recv)
-        proto = ord(data[9])
-        ihl = (ord(data[0]) & 0xF) * 4
-        thl = 0
-        if proto == 6:  # TCP
-            thl = (ord(data[ihl+12]) >> 4) * 4
-        data_byts = ip_bytes - ihl - thl
-        ts_s_tdf = float(ts[:20].strip("\x00"))
-        ts_s = ts_s_tdf / python_config.TDF
-        circuit = ord(data[1]) & 0x1
-        lat = float(lat)
-
-        # A circuit is starting or ending.
-        if typ == 1 or typ == 2:
-            continue
+def get_flow_racks(flow):
+    """
+    Returns the (sender, receiver) rack pair of a flow, which is a tuple of the
+    form (sender IP, receiver IP, protocol, source port, destination port).
+    """
+    return tuple(int(ip.split(".")[2]) for ip in flow[:2])
 
-        if data_byts < 100:
-            continue
-        elif data_byts > 1000:
-            lats.append(lat)
-            if circuit:
-                lats_c.append(lat)
+
+def get_seq_data_all(fln, dur, time_offset_s, msg_len=112, clean=True,
+                     raw_chunks=False, pairs=None):
+    """
+    Parses an HSLog file into sequence graph data for every rack pair that has
+    circuits, or for the rack pairs in "pairs", scanning the log only once. The
+    flows of a rack pair are the flows from its src rack to its dst rack.
+    Returns a dictionary mapping (src, dst) rack pair to a tuple of the form:
+        ((average seqs, average VOQ lengths), circuit bounds, chunks)
+    (see get_seq_data()). If "raw_chunks" is True, then the chunks are computed
+    without flow cleaning, regardless of "clean".
+    """
+    circuit_starts, circuit_ends, pkts, flw_index = _read_seq_log(
+        fln, msg_len)
+    _validate_circuits(circuit_starts, circuit_ends)
+    return _get_seq_results(circuit_starts, circuit_ends, pkts, flw_index, dur,
+                            time_offset_s, clean, raw_chunks, pairs)
+
+
+def _get_seq_results(circuit_starts, circuit_ends, pkts, flw_index, dur,
+                     time_offset_s, clean=True, raw_chunks=False, pairs=None):
+    """
+    Computes the results of get_seq_data_all() from the output of
+    _read_seq_log(), after validating the circuits.
+    """
+    if pairs is None:
+        pairs = sorted(circuit_starts.keys())
+    flows = _get_flows(pkts, flw_index, clean)
+    # The flows from which to compute the chunks.
+    chunk_flows = (_get_flows(pkts, flw_index, clean=False)
+                   if raw_chunks and clean else flows)
+    del pkts, flw_index
+
+    results = {}
+    for sr_racks in pairs:
+        print("Rack pair: {}".format(sr_racks))
+        cir_starts = circuit_starts[sr_racks]
+        cir_ends = circuit_ends[sr_racks]
+        bounds = _get_circuit_stats(cir_starts, cir_ends)
+        pair_flows = {f: flw for f, flw in flows.items()
+                      if get_flow_racks(f) == sr_racks}
+        seqs_voqs, chunks_origs = _aggregate_chunks(
+            _get_flow_chunks(pair_flows, cir_starts, cir_ends, dur,
+                             time_offset_s),
+            len(cir_starts), dur)
+        if chunk_flows is not flows:
+            # These chunks do not need to be aggregated.
+            chunks_origs = _get_chunks_origs(_get_flow_chunks(
+                {f: flw for f, flw in chunk_flows.items()
+                 if get_flow_racks(f) == sr_racks},
+                cir_starts, cir_ends, dur, time_offset_s))
+        results[sr_racks] = (seqs_voqs, bounds, chunks_origs)
+    return results
+
+
+def get_seq_data(fln, dur, time_offset_s, msg_len=112, clean=True,
+                 sr_racks=SR_RACKS):
+    """
+    Parses an HSLog file into sequence graph data for the rack pair "sr_racks".
+    Returns a tuple of the form:
+        ((average seqs, average VOQ lengths), circuit bounds, chunks)
+    where the averages are NumPy arrays of length dur and chunks maps each flow
+    to a list of chunks of the form (seq_xs, seq_ys, voq_xs, voq_ys, chunk_idx),
+    the first four of which are NumPy arrays.
+    """
+    return get_seq_data_all(fln, dur, time_offset_s, msg_len, clean,
+                            pairs=[sr_racks])[sr_racks]
+
+
+def get_seq_data_clean_raw(fln, dur, time_offset_s, msg_len=112,
+                           sr_racks=SR_RACKS):
+    """
+    Equivalent to calling get_seq_data() with clean=True and with clean=False,
+    but scans the log only once. Returns a tuple of the form:
+        (cleaned results, circuit bounds, uncleaned chunks)
+    """
+    return get_seq_data_all(fln, dur, time_offset_s, msg_len, clean=True,
+                            raw_chunks=True, pairs=[sr_racks])[sr_racks]
+
+
+class LatencyHistogram(object):
+    """
+    A bounded-memory, mergeable histogram of latencies. Buckets are spaced
+    logarithmically, such that every value greater than "min_val" is within a
+    relative error of "rel_err" of its bucket's representative value. Values
+    less than or equal to "min_val" share a single bucket, represented by
+    "min_val". Percentiles are therefore accurate to within "rel_err" (and the
+    0th and 100th percentiles are exact). Histograms are merged with "+".
+    """
+
+    def __init__(self, rel_err=0.01, min_val=1.):
+        assert 0 < rel_err < 1, \
+            "The relative error must be in (0, 1), but is: {}".format(rel_err)
+        self.rel_err = rel_err
+        self.min_val = float(min_val)
+        # Bucket i > 0 contains values in (min_val * gamma**(i - 1),
+        # min_val * gamma**i].
+        self.gamma = (1 + rel_err) / (1 - rel_err)
+        self.counts = np.zeros(1, dtype=np.int64)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def __add__(self, other):
+        assert ((self.rel_err, self.min_val) ==
+                (other.rel_err, other.min_val)), \
+            "Cannot merge histograms with different relative errors or minimums"
+        merged = LatencyHistogram(self.rel_err, self.min_val)
+        merged._add_counts(self.counts)
+        merged._add_counts(other.counts)
+        merged.min = min(self.min, other.min)
+        merged.max = max(self.max, other.max)
+        return merged
+
+    def _add_counts(self, counts):
+        if len(counts) > len(self.counts):
+            self.counts = np.concatenate(
+                [self.counts,
+                 np.zeros(len(counts) - len(self.counts), dtype=np.int64)])
+        self.counts[:len(counts)] += counts
+
+    def add(self, vals):
+        """
+        Adds an array of values to the histogram.
+        """
+        vals = np.asarray(vals, dtype=np.float64)
+        if not len(vals):
+            return
+        idxs = np.zeros(len(vals), dtype=np.int64)
+        big = vals > self.min_val
+        idxs[big] = np.ceil(
+            np.log(vals[big] / self.min_val) / np.log(self.gamma))
+        self._add_counts(np.bincount(idxs))
+        self.min = min(self.min, vals.min())
+        self.max = max(self.max, vals.max())
+
+    def percentile(self, prc):
+        """
+        Returns the approximate "prc"-th percentile, interpolating between
+        order statistics in the same way as np.percentile().
+        """
+        num = len(self)
+        assert num, "Cannot compute a percentile of an empty histogram"
+        # The representative value of each bucket, clipped to the range of the
+        # values that were actually added.
+        vals = (2 * self.min_val * self.gamma**np.arange(len(self.counts)) /
+                (1 + self.gamma))
+        vals[0] = self.min_val
+        vals = np.clip(vals, self.min, self.max)
+        # Find the buckets containing the order statistics on either side of
+        # the rank, i.e., the first buckets whose cumulative counts exceed them.
+        rank = prc / 100. * (num - 1)
+        ranks = np.array([np.floor(rank), np.ceil(rank)])
+        stats = vals[np.searchsorted(np.cumsum(self.counts), ranks,
+                                     side="right")]
+        # The smallest and largest order statistics are known exactly.
+        stats[ranks == 0] = self.min
+        stats[ranks == num - 1] = self.max
+        lo_val, hi_val = stats
+        return lo_val + (hi_val - lo_val) * (rank - np.floor(rank))
+
+
+class PacketLogScan(object):
+    """
+    Scan function for parse_packet_log(). If "lat_rel_err" is None, then
+    latencies are kept exactly. Otherwise, they are recorded in
+    LatencyHistograms with that relative error.
+    """
+
+    def __init__(self, lat_rel_err=None):
+        self.lat_rel_err = lat_rel_err
+
+    def __call__(self, blk):
+        """
+        Returns a dictionary of partial results for a block.
+        """
+        # "lats", "lats_c", and "lats_p": Lists of arrays (or
+        # LatencyHistograms) of combined, circuit, and packet latencies,
+        # respectively.
+        # "byts", "byts_c", and "byts_p": N x N matrices of total, circuit, and
+        # packet bytes, respectively, indexed by [sender rack, receiver rack].
+        # "flw_starts" and "flw_ends": N x N matrices of when traffic from the
+        # sender rack to the receiver rack started and ended, respectively, or
+        # NaN if there was none.
+        partial = {}
+        # Skip circuit start and end records, as well as packets that carry
+        # fewer than 100 data bytes.
+        valid = ((blk["type"] != 1) & (blk["type"] != 2) &
+                 (blk["byts"] >= 100))
+        data_byts = blk["byts"][valid]
+        circuit = blk["circuit"][valid]
+        ts_s = blk["ts"][valid]
+
+        # Only record latency for large packets.
+        lat = blk["lat"][valid].astype(np.float64)
+        big = data_byts > 1000
+        for key, mask in [("lats", big), ("lats_c", big & circuit),
+                          ("lats_p", big & ~circuit)]:
+            if self.lat_rel_err is None:
+                partial[key] = [lat[mask]]
             else:
-                lats_p.append(lat)
+                partial[key] = LatencyHistogram(self.lat_rel_err)
+                partial[key].add(lat[mask])
+
+        # Encode each packet's (sender rack, receiver rack) as an index into a
+        # flattened N x N matrix.
+        senders = blk["sender_rack"][valid].astype(np.int64)
+        recvs = blk["recv_rack"][valid].astype(np.int64)
+        num_racks = max(senders.max(), recvs.max()) + 1 if len(senders) else 0
+        sr_codes = senders * num_racks + recvs
+        for key, mask in [("byts", slice(None)), ("byts_c", circuit),
+                          ("byts_p", ~circuit)]:
+            partial[key] = np.bincount(
+                sr_codes[mask], weights=data_byts[mask],
+                minlength=num_racks**2).astype(np.int64).reshape(
+                    (num_racks, num_racks))
+        # The first and last packets of each rack pair.
+        sr_codes_uniq, firsts = np.unique(sr_codes, return_index=True)
+        _, lasts = np.unique(sr_codes[::-1], return_index=True)
+        lasts = len(sr_codes) - 1 - lasts
+        for key, idxs in [("flw_starts", firsts), ("flw_ends", lasts)]:
+            partial[key] = np.full((num_racks, num_racks), np.nan)
+            partial[key].flat[sr_codes_uniq] = ts_s[idxs]
+        return partial
+
+
+def _pad_racks(mat, num_racks, fill):
+    """
+    Pads a square matrix indexed by [sender rack, receiver rack] to
+    "num_racks" racks.
+    """
+    padded = np.full((num_racks, num_racks), fill, dtype=mat.dtype)
+    padded[:len(mat), :len(mat)] = mat
+    return padded
 
-        byts[sr_racks] += data_byts
-        if circuit:
-            byts_c[sr_racks] += data_byts
-        else:
-            byts_p[sr_racks] += data_byts
 
-        if sr_racks not in flw_starts:
-            # If we have not seen this rack pair before, then this is the start
-            # of traffic between this rack pair.
-            flw_starts[sr_racks] = ts_s
-        # This is, by definition, the latest packet from this rack pair that we
-        # have seen so far.
-        flw_ends[sr_racks] = ts_s
+def _merge_packet_logs(a, b):
+    """
+    Merge function for parse_packet_log(). "a" must come before "b" in the log.
+    """
+    merged = {key: a[key] + b[key] for key in ["lats", "lats_c", "lats_p"]}
+    num_racks = max(len(a["byts"]), len(b["byts"]))
+    for key in ["byts", "byts_c", "byts_p"]:
+        merged[key] = (_pad_racks(a[key], num_racks, 0) +
+                       _pad_racks(b[key], num_racks, 0))
+    # Traffic between a rack pair starts with its first packet in "a", if any,
+    # and ends with its last packet in "b", if any.
+    starts_a, starts_b, ends_a, ends_b = [
+        _pad_racks(mat, num_racks, np.nan) for mat in [
+            a["flw_starts"], b["flw_starts"], a["flw_ends"], b["flw_ends"]]]
+    merged["flw_starts"] = np.where(np.isnan(starts_a), starts_b, starts_a)
+    merged["flw_ends"] = np.where(np.isnan(ends_b), ends_a, ends_b)
+    return merged
+
+
+@profiling.timed("percentiles")
+def get_lat_percentiles(lats):
+    """
+    Returns a list of (percentile, latency) pairs for PERCENTILES. "lats" is
+    either an array of latencies or a LatencyHistogram.
+    """
+    if isinstance(lats, LatencyHistogram):
+        return [(prc, lats.percentile(prc)) for prc in PERCENTILES]
+    return [(prc, np.percentile(lats, prc)) for prc in PERCENTILES]
+
+
+def get_lat_hists(fln, msg_len=112, lat_rel_err=0.01):
+    """
+    Returns the combined, circuit, and packet latencies of an HSLog file as
+    LatencyHistograms with relative error "lat_rel_err". The histograms of
+    multiple files can be merged with "+".
+    """
+    results = scan_hslog(open_hslog(fln, msg_len), PacketLogScan(lat_rel_err),
+                         _merge_packet_logs)
+    return results["lats"], results["lats_c"], results["lats_p"]
+
+
+def parse_packet_log(fln, msg_len=112, lat_rel_err=None):
+    """
+    Parses an HSLog file into latency percentiles and per-rack pair throughput
+    matrices, which are indexed by [sender rack, receiver rack] (e.g.,
+    tpts_Gbps[SR_RACKS]). If "lat_rel_err" is None, then the latency
+    percentiles are exact. Otherwise, they are computed in bounded memory using
+    LatencyHistograms with that relative error.
+    """
+    print("Parsing: {}".format(fln))
+    return _get_packet_results(
+        scan_hslog(open_hslog(fln, msg_len), PacketLogScan(lat_rel_err),
+                   _merge_packet_logs),
+        lat_rel_err)
+
+
+def _get_packet_results(results, lat_rel_err=None):
+    """
+    Computes the results of parse_packet_log() from the merged partial results
+    of PacketLogScan.
+    """
+    byts = results["byts"]
+    byts_c = results["byts_c"]
+    byts_p = results["byts_p"]
+    flw_starts = results["flw_starts"]
+    flw_ends = results["flw_ends"]
+    lats, lats_c, lats_p = [
+        results[key] if lat_rel_err is not None
+        else np.concatenate(results[key])
+        for key in ["lats", "lats_c", "lats_p"]]
 
     # Overall latency.
-    lats = [(prc, np.percentile(lats, prc)) for prc in PERCENTILES]
+    lats = get_lat_percentiles(lats)
     # Circuit network latency.
-    if lats_c:
-        lats_c = [(prc, np.percentile(lats_c, prc)) for prc in PERCENTILES]
+    if len(lats_c):
+        lats_c = get_lat_percentiles(lats_c)
     else:
         lats_c = [(prc, 0) for prc in PERCENTILES]
     # Packet network latency.
-    lats_p = [(prc, np.percentile(lats_p, prc)) for prc in PERCENTILES]
-
-    # Mapping from (sender, receiver) to total, circuit, and packet throughput,
-    # respectively, in Gbps.
-    tpts_Gbps = {}
-    tpts_Gbps_c = {}
-    tpts_Gbps_p = {}
-    for sr_racks, flw_start in flw_starts.items():
-        total_time = float(flw_ends[sr_racks] - flw_start)
-        tpts_Gbps[sr_racks] = (byts[sr_racks] / total_time) * 8 / 1.e9
-        tpts_Gbps_c[sr_racks] = (byts_c[sr_racks] / total_time) * 8 / 1.e9
-        tpts_Gbps_p[sr_racks] = (byts_p[sr_racks] / total_time) * 8 / 1.e9
+    lats_p = get_lat_percentiles(lats_p)
+
+    # N x N matrices of total, circuit, and packet throughput, respectively, in
+    # Gbps, indexed by [sender rack, receiver rack]. Rack pairs without traffic
+    # are NaN.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total_time = flw_ends - flw_starts
+        tpts_Gbps = (byts / total_time) * 8 / 1.e9
+        tpts_Gbps_c = (byts_c / total_time) * 8 / 1.e9
+        tpts_Gbps_p = (byts_p / total_time) * 8 / 1.e9
 
     return (lats, lats_c, lats_p), (tpts_Gbps, tpts_Gbps_c, tpts_Gbps_p), \
-        sum(byts_c.values()), sum(byts_p.values())
+        byts_c.sum(), byts_p.sum()
+
+
+class AnalysisScan(object):
+    """
+    Scan function for analyze_hslog(). Combines _scan_seq_log() and
+    PacketLogScan, so that both see each block while its columns are decoded.
+    If "seq" is False, then the data packets are not collected for the
+    sequence graph data.
+    """
+
+    def __init__(self, lat_rel_err=None, seq=False):
+        self.pkt_scan = PacketLogScan(lat_rel_err)
+        self.seq = seq
+
+    def __call__(self, blk):
+        return _scan_seq_log(blk, self.seq), self.pkt_scan(blk)
 
 
+def _merge_analyses(a, b):
+    """
+    Merge function for analyze_hslog(). "a" must come before "b" in the log.
+    """
+    return _merge_seq_logs(a[0], b[0]), _merge_packet_logs(a[1], b[1])
+
+
+def analyze_hslog(fln, dur=None, time_offset_s=0, msg_len=112,
+                  lat_rel_err=None, seq=False):
+    """
+    Computes every metric of an HSLog file that the graphing scripts use,
+    scanning the log only once. The sequence graph data, which is by far the
+    most expensive to compute, is only computed if "seq" is True. Returns a
+    dictionary containing:
+        "seq": The sequence graph data for every rack pair that has circuits, as
+               returned by get_seq_data_all() with raw_chunks=True, or None if
+               "seq" is False or the circuits are invalid.
+        "lats": The combined, circuit, and packet latency percentiles (see
+                parse_packet_log()).
+        "tpts_Gbps": The total, circuit, and packet throughput matrices (see
+                     parse_packet_log()).
+        "byts_c" and "byts_p": The total circuit and packet bytes.
+        "circuit_bounds": A dictionary mapping each rack pair that has circuits
+                          to its average circuit bounds (see
+                          _get_circuit_stats()), or None if the circuits are
+                          invalid.
+        "circuit_error": None, or a message describing why the circuits are
+                         invalid (e.g., because of mismatched circuit starts
+                         and ends). The packet metrics are still valid.
+    """
+    assert not seq or dur is not None, \
+        "Computing the sequence graph data requires a duration!"
+    print("Analyzing: {}".format(fln))
+    log = open_hslog(fln, msg_len)
+    (circ_blks, pkt_blks), pkt_results = scan_hslog(
+        log, AnalysisScan(lat_rel_err, seq), _merge_analyses)
+    results = dict(zip(
+        ["lats", "tpts_Gbps", "byts_c", "byts_p"],
+        _get_packet_results(pkt_results, lat_rel_err)))
+    results["seq"] = None
+    results["circuit_bounds"] = None
+    results["circuit_error"] = None
+
+    circuit_starts, circuit_ends = _get_circuits(circ_blks)
+    del circ_blks
+    try:
+        _validate_circuits(circuit_starts, circuit_ends)
+    except AssertionError as exc:
+        # Only the metrics that depend on the circuits are invalid.
+        print("Warning: Invalid circuits in {}: {}".format(fln, exc))
+        results["circuit_error"] = str(exc)
+        return results
+
+    if seq:
+        pkts = concat_cols(pkt_blks)
+        del pkt_blks
+        results["seq"] = _get_seq_results(
+            circuit_starts, circuit_ends, pkts,
+            log.flow_index() or index_flows(pkts), dur, time_offset_s,
+            raw_chunks=True)
+        results["circuit_bounds"] = {
+            sr_racks: bounds
+            for sr_racks, (_, bounds, _) in results["seq"].items()}
+    else:
+        results["circuit_bounds"] = {}
+        for sr_racks in sorted(circuit_starts.keys()):
+            print("Rack pair: {}".format(sr_racks))
+            results["circuit_bounds"][sr_racks] = _get_circuit_stats(
+                circuit_starts[sr_racks], circuit_ends[sr_racks])
+    return results
+
+
+class FlowgrindIntervals(object):
+    """
+    Parses the interval ("S") lines of flowgrind's output into the columns in
+    FLOWGRIND_COLS. Lines can be added one at a time as flowgrind produces
+    them (see common.runWriteFile()), and are converted into arrays in blocks
+    of FLOWGRIND_BLOCK_ROWS lines.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.blks = []
+
+    def add_line(self, line):
+        # Ignore comment lines, empty lines, and "D" lines.
+        if line[:1] == "S":
+            splits = line[1:].split()
+            self.rows.append([splits[idx] for _, idx, _ in FLOWGRIND_COLS])
+            if len(self.rows) >= FLOWGRIND_BLOCK_ROWS:
+                self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self.blks.append(np.array(self.rows, dtype=np.float64))
+            self.rows = []
+
+    def get_cols(self):
+        """
+        Returns a dictionary mapping column name to an array containing that
+        column of every interval. The intervals are grouped by flow and each
+        flow's intervals are in the order in which they were added. The
+        dictionary also contains the ID of each flow ("flow_ids") and the
+        bounds of each flow's intervals ("flow_bounds"), such that the
+        intervals of flow "flow_ids[i]" are in the range
+        [flow_bounds[i], flow_bounds[i + 1]).
+        """
+        self._flush()
+        rows = (np.concatenate(self.blks) if self.blks else
+                np.zeros((0, len(FLOWGRIND_COLS))))
+        self.blks = [rows]
+        order = np.argsort(rows[:, 0], kind="mergesort")
+        cols = {name: rows[order, col_idx].astype(dtype)
+                for col_idx, (name, _, dtype) in enumerate(FLOWGRIND_COLS)}
+        ids = cols["id"]
+        starts = np.flatnonzero(np.diff(ids)) + 1
+        bounds = np.concatenate(([0], starts, [len(ids)])).astype(np.int64)
+        cols["flow_ids"] = ids[bounds[:-1]] if len(ids) else ids
+        cols["flow_bounds"] = bounds
+        return cols
+
+    def save(self, fln):
+        """
+        Stores the columns in a cache next to the flowgrind output file "fln",
+        which must be complete.
+        """
+        save_cache(fln, "fg", FLOWGRIND_CACHE_VERSION, **self.get_cols())
+
+
+def load_flowgrind_intervals(fln):
+    """
+    Returns the columns of the interval lines of a flowgrind output file (see
+    FlowgrindIntervals.get_cols()). Reads the cache next to the file, which is
+    written while flowgrind runs, or creates it if necessary.
+    """
+    cache = load_cache(fln, "fg", FLOWGRIND_CACHE_VERSION)
+    if cache is not None:
+        return {name: cache[name] for name in cache.files
+                if name not in ["version", "src_id"]}
+    print("Caching: {}".format(fln))
+    intervals = FlowgrindIntervals()
+    with open(fln) as f:
+        for line in f:
+            intervals.add_line(line)
+    intervals.save(fln)
+    return intervals.get_cols()
+
+
+@profiling.timed("validation")
 def parse_validation_log(fln, dur_ms=1300, bin_size_ms=1):
     print("Parsing: {}".format(fln))
     # Map of flow ID to pair (src rack, dst rack).
@@ -565,77 +2056,70 @@ def parse_validation_log(fln, dur_ms=1300, bin_size_ms=1):
                 r = int(flow_cnf.split(",d=10.1.")[1].split(".")[0])
                 id_to_sr[idx] = (s, r)
 
-    # Map of pair (src rack, dst rack) to a map of window *start* timestamp to
-    # the number of bytes sent during the window beginning with this timestamp.
-    sr_to_tstamps = collections.defaultdict(
-        lambda: collections.defaultdict(int))
-    # Map of emulated src idx (i.e., flow idx) to a map of window *end*
-    # timestamp to the src's CWND at the timestamp (i.e., at the time that the
-    # window ended).
-    flow_to_cwnds = collections.defaultdict(
-        lambda: collections.defaultdict(int))
-    with open(fln) as f:
-        for line in f:
-            # Ignore comment lines, empty lines, and "D" lines.
-            if line[0] == "S":
-                line = line[1:].strip()
-                splits = line.split()
-                # Flow ID.
-                idx = int(splits[0])
-                # Start timestamp for this window.
-                ts_s_start = float(splits[1])
-                # End timestamp for this window.
-                ts_s_end = float(splits[2])
-                # Throughput for this window.
-                cur_tput_mbps = float(splits[3])
-                # Bits sent during this window. Mb/s -> b. Do not divide by TDF.
-                cur_b = cur_tput_mbps * 1e6  * (ts_s_end - ts_s_start)
-                # Record the bytes sent during this window.
-                sr_to_tstamps[id_to_sr[idx]][ts_s_start] += cur_b
-                # CWND at the end of this window.
-                cwnd = int(splits[11])
-                # Record this flow's cwnd at the end of this window.
-                flow_to_cwnds[idx][ts_s_end] = cwnd
-    # For each (src, dst) rack pair, transform the mapping from timestamp to
-    # bytes into a list of sorted pairs of (timestamp, bytes).
-    sr_to_tstamps = {sr: sorted(tstamps.items())
-                     for sr, tstamps in sr_to_tstamps.items()}
-    # For each flow, transform the mapping from timestamp to cwnd into a list of
-    # sorted pairs of (timestamp, cwnd).
-    flow_to_cwnds = {flw: sorted(cwnds.items())
-                     for flw, cwnds in flow_to_cwnds.items()}
+    # The columns of the "S" lines: flow ID, window start and end timestamps,
+    # throughput, and CWND at the end of the window.
+    intervals = load_flowgrind_intervals(fln)
+    ids = intervals["id"]
+    ts_s_starts = intervals["begin"]
+    ts_s_ends = intervals["end"]
+    tputs_mbps = intervals["tput_mbps"]
+    cwnds = intervals["cwnd"]
+    # Bits sent during each window. Mb/s -> b. Do not divide by TDF.
+    bits = tputs_mbps * 1e6 * (ts_s_ends - ts_s_starts)
+
+    # Assign each window to a (src rack, dst rack) pair and to the bin that
+    # contains its *start* timestamp. E.g., for a bin size of 1 ms, bin 1 holds
+    # the windows that start between 1 ms and 2 ms.
+    srs = sorted(set(id_to_sr[idx] for idx in set(ids.tolist())))
+    sr_idxs = np.zeros(max(id_to_sr.keys()) + 1, dtype=np.int64)
+    for idx, sr in id_to_sr.items():
+        if sr in srs:
+            sr_idxs[idx] = srs.index(sr)
+    num_bins = len(xrange(0, dur_ms, bin_size_ms))
+    # Each bin ends exactly where the next one starts, so every window lands in
+    # exactly one bin.
+    edges_s = np.arange(num_bins + 1) * bin_size_ms / 1e3
+    bins = np.digitize(ts_s_starts, edges_s) - 1
+    valid = (bins >= 0) & (bins < num_bins)
+    # Sum up the bits sent during each bin of each pair, and convert them into
+    # the throughput during the bin.
+    bin_bits = np.bincount(
+        sr_idxs[ids[valid]] * num_bins + bins[valid], weights=bits[valid],
+        minlength=len(srs) * num_bins).reshape(len(srs), num_bins)
+    bin_gbps = bin_bits / (bin_size_ms / 1e3) / 1e9
 
     # Map of pair (src rack, dst rack) to list of throughputs in Gb/s. Each
     # throughput corresponds to the throughput during one bin.
-    sr_to_tputs = collections.defaultdict(list)
-    for sr, tstamps in sr_to_tstamps.items():
-        for win_start_ms in xrange(0, dur_ms, bin_size_ms):
-            win_start_s = win_start_ms / 1e3
-            win_end_s = win_start_s + (bin_size_ms / 1e3)
-            # Find all the logs (i.e., numbers of bytes during some window) for
-            # the current bin...
-            cur_samples = [b for ts_s, b in tstamps
-                           # E.g., for i = 1 and BIN_SIZE_MS = 1, if timestamp
-                           # is between 1 ms and 2 ms.
-                           if win_start_s <= ts_s < win_end_s]
-            # ...and sum them up to calculate the total number of bytes sent in
-            # this bin (e.g., if the bin size is 1, then this is the total
-            # amount of bytes sent in 1 ms).
-            cur_b = sum(cur_samples)
-            gbps = cur_b * (1 / BIN_SIZE_MS) * 1e3 / 1e9
-            sr_to_tputs[sr].append((win_start_ms / 1e3, gbps))
+    win_starts_s = edges_s[:-1].tolist()
+    sr_to_tputs = {sr: zip(win_starts_s, bin_gbps[sr_idx].tolist())
+                   for sr_idx, sr in enumerate(srs)}
+
+    # Map of flow ID to a list of sorted pairs of (window *end* timestamp, CWND
+    # at that timestamp). If a flow has several windows that end at the same
+    # time, then keep the last one.
+    order = np.lexsort((np.arange(len(ids)), ts_s_ends, ids))
+    ids = ids[order]
+    ts_s_ends = ts_s_ends[order]
+    last = np.ones(len(ids), dtype=bool)
+    last[:-1] = (ids[1:] != ids[:-1]) | (ts_s_ends[1:] != ts_s_ends[:-1])
+    ids = ids[last]
+    flw_bounds = np.flatnonzero(np.diff(ids)) + 1
+    flow_to_cwnds = {
+        int(flw_ids[0]): zip(flw_ts.tolist(), flw_cwnds.tolist())
+        for flw_ids, flw_ts, flw_cwnds in zip(
+            np.split(ids, flw_bounds),
+            np.split(ts_s_ends[last], flw_bounds),
+            np.split(cwnds[order][last], flw_bounds))
+        if len(flw_ids)}
 
     means = {}
     stdevs = {}
     for sr, tputs in sr_to_tputs.items():
-        # Jump over data from before the flows started.
-        start_idx = 0
-        for _, tput in tputs:
-            if round(tput) > 0:
-                break
-            start_idx += 1
         # Extract the tputs from of list of pairs of (window start time, tput).
-        _, tputs = zip(*tputs[start_idx:])
+        tputs = np.array([tput for _, tput in tputs])
+        # Jump over data from before the flows started, i.e., the bins whose
+        # throughputs round to 0.
+        tputs = tputs[np.argmax(tputs >= 0.5):]
         means[sr] = np.mean(tputs)
         stdevs[sr] = np.std(tputs)
 
@@ -655,26 +2139,71 @@ def parse_validation_log(fln, dur_ms=1300, bin_size_ms=1):
     return sr_to_tputs, flow_to_cwnds
 
 
-def parse_hdfs_logs(folder):
-    data = []
-    durations = []
+def scan_hdfs_log(log):
+    """
+    Extracts the HDFS_WRITE clienttrace records of an HDFS datanode log, which
+    is memory-mapped and scanned with one regular expression. Returns a tuple
+    of the form:
+        (bytes, durations (ns))
+    where both are NumPy arrays with one entry per record. The results are
+    cached next to the log, so each log is only scanned once.
+    """
+    cache = load_cache(log, "hdfs", HDFS_CACHE_VERSION)
+    if cache is not None:
+        return cache["byts"], cache["durs_ns"]
+    byts = []
+    durs_ns = []
+    if path.getsize(log):
+        with open(log, "rb") as fil:
+            buf = mmap.mmap(fil.fileno(), 0, access=mmap.ACCESS_READ)
+            for match in HDFS_WRITE_RE.finditer(buf):
+                byts.append(int(match.group(1)))
+                durs_ns.append(float(match.group(2)))
+            buf.close()
+    byts = np.array(byts, dtype=np.int64)
+    durs_ns = np.array(durs_ns, dtype=np.float64)
+    save_cache(log, "hdfs", HDFS_CACHE_VERSION, byts=byts, durs_ns=durs_ns)
+    return byts, durs_ns
 
+
+def get_hdfs_writes(folder, processes=None):
+    """
+    Returns the HDFS_WRITE clienttrace records of all of the datanode logs in
+    an HDFS experiment folder (see scan_hdfs_log()). Logs that are not cached
+    yet are scanned by a pool of "processes" processes (None means
+    HDFS_PROCESSES).
+    """
     fln = folder + "/*-logs/hadoop*-datanode*.log"
     print(fln)
-    logs = glob.glob(fln)
+    logs = sorted(glob.glob(fln))
+    if processes is None:
+        processes = HDFS_PROCESSES
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    # Daemonic processes cannot start pools of their own (see scan_hslog()).
+    if processes > 1 and not multiprocessing.current_process().daemon:
+        new_logs = [log for log in logs
+                    if load_cache(log, "hdfs", HDFS_CACHE_VERSION) is None]
+        if len(new_logs) > 1:
+            pool = multiprocessing.Pool(min(len(new_logs), processes))
+            pool.map(scan_hdfs_log, new_logs)
+            # Clean up pool.
+            pool.close()
+            pool.join()
+    results = [scan_hdfs_log(log) for log in logs]
+    if not results:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    return tuple(np.concatenate(cols) for cols in zip(*results))
 
-    for log in logs:
-        for line in open(log):
-            if "clienttrace" in line and "HDFS_WRITE" in line:
-                byts = int(line.split("bytes: ")[1].split()[0][:-1])
-                if byts > 1024 * 1024 * 99:
-                    duration = ((float(line.split(
-                        "duration(ns): ")[1].split()[0]) * 1e-6) /
-                                python_config.TDF)
-                    data.append((byts / 1024. / 1024., duration))
 
-    durations = sorted(zip(*data)[1])
-    return durations
+def parse_hdfs_logs(folder):
+    """
+    Returns the sorted durations (ms) of the HDFS writes in an HDFS experiment
+    folder that are larger than 99 MB.
+    """
+    byts, durs_ns = get_hdfs_writes(folder)
+    durs_ms = durs_ns[byts > 1024 * 1024 * 99] * 1e-6 / python_config.TDF
+    return np.sort(durs_ms).tolist()
 
 
 def parse_hdfs_throughput(folder):
@@ -689,3 +2218,18 @@ def parse_hdfs_throughput(folder):
                 # divide by number of replicas
                 return (float(line.split("mb/sec:")[1]) *
                         num_files * 8 / 1024.) * python_config.TDF / 2.
+
+
+def main():
+    assert len(sys.argv) >= 3, \
+        ("Expected at least two arguments: log message size (bytes), HSLog "
+         "file(s)")
+    msg_len = int(sys.argv[1])
+    # Convert each HSLog file into a columnar cache and build its sparse index.
+    for fln in sys.argv[2:]:
+        cache_hslog(fln, msg_len)
+        index_hslog(fln, msg_len)
+
+
+if __name__ == "__main__":
+    main()
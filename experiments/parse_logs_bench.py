@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#
+# Benchmarks the parsers in parse_logs.py on synthetic logs (see hslog_gen.py)
+# and records the results, so that parser performance can be tracked over
+# time. Usage:
+#     ./parse_logs_bench.py <trace dir> <size (MB)...>
+# Traces are generated in <trace dir> the first time that they are needed. Each
+# result is appended to <trace dir>/bench_history.txt, one JSON object per
+# line, and is compared to the previous result of the same benchmark.
+
+import json
+import multiprocessing
+import os
+from os import path
+import resource
+import socket
+import subprocess
+import sys
+import time
+# Directory containing this program.
+PROGDIR = path.dirname(path.realpath(__file__))
+# For python_config.
+sys.path.insert(0, path.join(PROGDIR, "..", "etc"))
+
+import hslog_gen
+import parse_logs
+import python_config
+
+# The file in the trace dir to which to append results.
+BENCH_HISTORY = "bench_history.txt"
+# The log message sizes to benchmark.
+BENCH_MSG_LENS = [112, 116]
+# The length of a flowgrind log in seconds, per MB of HSLog file.
+BENCH_FLOWGRIND_S_PER_MB = 0.1
+
+
+def _get_traces(edr, size_mb, msg_len):
+    """
+    Returns the paths of the HSLog file and flowgrind log of size "size_mb",
+    generating them if necessary.
+    """
+    hslog = path.join(edr, "bench-{}MB-{}-click.txt".format(size_mb, msg_len))
+    if not path.exists(hslog):
+        print("Generating: {}".format(hslog))
+        hslog_gen.generate_hslog(hslog, msg_len, size_mb)
+    fg_log = path.join(edr, "bench-{}MB-flowgrind.txt".format(size_mb))
+    if not path.exists(fg_log):
+        print("Generating: {}".format(fg_log))
+        hslog_gen.generate_flowgrind_log(
+            fg_log, dur_s=size_mb * BENCH_FLOWGRIND_S_PER_MB)
+    return hslog, fg_log
+
+
+def _remove_caches(fln):
+    """ Removes the caches of a log (see parse_logs.get_cache_path()). """
+    for suffix in ["cols", "idx", "fg"]:
+        cache_fln = parse_logs.get_cache_path(fln, suffix)
+        if path.exists(cache_fln):
+            os.remove(cache_fln)
+
+
+def _get_seq_data(fln, msg_len):
+    # Chunks span three circuits of the rack pair, i.e., three weeks.
+    week_us = sum(int(dur) for dur in
+                  hslog_gen.fake_strobe_schedule().split()[1::2])
+    parse_logs.get_seq_data(fln, int(week_us * 3 / python_config.TDF), 0,
+                            msg_len)
+
+
+# Benchmarks, as tuples of the form:
+#     (name, log type, use caches, function)
+# where the log type is "hslog" or "flowgrind" and the function takes a log
+# and a log message size. The benchmarks run in order, so the uncached
+# benchmarks of a log build the caches that later benchmarks use.
+BENCHMARKS = [
+    ("get_seq_data", "hslog", False, _get_seq_data),
+    ("parse_packet_log", "hslog", False,
+     lambda fln, msg_len: parse_logs.parse_packet_log(fln, msg_len)),
+    ("cache_hslog", "hslog", True,
+     lambda fln, msg_len: parse_logs.cache_hslog(fln, msg_len)),
+    ("get_seq_data_cached", "hslog", True, _get_seq_data),
+    ("parse_packet_log_cached", "hslog", True,
+     lambda fln, msg_len: parse_logs.parse_packet_log(fln, msg_len)),
+    ("parse_validation_log", "flowgrind", True,
+     lambda fln, msg_len: parse_logs.parse_validation_log(fln)),
+    ("parse_validation_log_cached", "flowgrind", True,
+     lambda fln, msg_len: parse_logs.parse_validation_log(fln)),
+]
+
+
+def _run_child(queue, bench_idx, fln, msg_len, use_caches):
+    """
+    Runs one benchmark in a child process, so that its peak memory usage is
+    measured separately, and puts (seconds, peak RSS (MB)) in "queue".
+    """
+    parse_logs.HSLOG_CACHE = use_caches
+    # Discard the benchmark's output.
+    sys.stdout = open(os.devnull, "w")
+    start = time.time()
+    BENCHMARKS[bench_idx][3](fln, msg_len)
+    secs = time.time() - start
+    # On Linux, ru_maxrss is in KB.
+    queue.put((secs, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss /
+               1024.))
+
+
+def run_benchmark(bench_idx, fln, msg_len):
+    """
+    Runs a benchmark (an index into BENCHMARKS) on a log. Returns a tuple of the
+    form:
+        (seconds, peak RSS (MB))
+    """
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+        target=_run_child,
+        args=(queue, bench_idx, fln, msg_len, BENCHMARKS[bench_idx][2]))
+    proc.start()
+    proc.join()
+    assert proc.exitcode == 0, \
+        "Benchmark {} failed on: {}".format(BENCHMARKS[bench_idx][0], fln)
+    return queue.get()
+
+
+def _get_num_recs(fln, log_type, msg_len):
+    """ Returns the number of records (or interval lines) in a log. """
+    if log_type == "hslog":
+        return path.getsize(fln) // msg_len
+    return len(parse_logs.load_flowgrind_intervals(fln)["id"])
+
+
+def _get_commit():
+    """ Returns the current git commit, or None if it is unknown. """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROGDIR,
+            stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_history(history_fln):
+    """
+    Returns a dictionary mapping (benchmark, size (MB), log message size) to the
+    latest result for that benchmark in the history file.
+    """
+    latest = {}
+    if path.exists(history_fln):
+        for line in open(history_fln):
+            res = json.loads(line)
+            latest[(res["bench"], res["size_mb"], res["msg_len"])] = res
+    return latest
+
+
+def main():
+    assert len(sys.argv) >= 3, \
+        "Expected at least two arguments: trace dir, size(s) (MB)"
+    edr = sys.argv[1]
+    if not path.isdir(edr):
+        os.makedirs(edr)
+    history_fln = path.join(edr, BENCH_HISTORY)
+    latest = _load_history(history_fln)
+    commit = _get_commit()
+    host = socket.gethostname()
+
+    for size_mb in [int(size) for size in sys.argv[2:]]:
+        for msg_len in BENCH_MSG_LENS:
+            hslog, fg_log = _get_traces(edr, size_mb, msg_len)
+            _remove_caches(hslog)
+            _remove_caches(fg_log)
+            for bench_idx, (name, log_type, _, _) in enumerate(BENCHMARKS):
+                if log_type == "flowgrind" and msg_len != BENCH_MSG_LENS[0]:
+                    # The flowgrind benchmarks do not depend on msg_len.
+                    continue
+                fln = hslog if log_type == "hslog" else fg_log
+                secs, rss_mb = run_benchmark(bench_idx, fln, msg_len)
+                num_recs = _get_num_recs(fln, log_type, msg_len)
+                res = {"bench": name, "size_mb": size_mb, "msg_len": msg_len,
+                       "recs": num_recs, "secs": secs,
+                       "recs_per_s": num_recs / secs, "peak_rss_mb": rss_mb,
+                       "commit": commit, "host": host, "time": time.time()}
+                prev = latest.get((name, size_mb, msg_len))
+                change = ("" if prev is None else
+                          " ({:.2f}x vs. {})".format(
+                              prev["secs"] / secs, prev["commit"]))
+                print(("{:>28} {:>6} MB {}: {:8.2f} s, {:12.0f} records/s, "
+                       "{:8.1f} MB peak RSS{}").format(
+                           name, size_mb, msg_len, secs, num_recs / secs,
+                           rss_mb, change))
+                with open(history_fln, "a") as fil:
+                    fil.write(json.dumps(res) + "\n")
+
+
+if __name__ == "__main__":
+    main()
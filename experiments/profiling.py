@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+#
+# Lightweight stage timers and counters for the log parsers and graphing
+# scripts. Profiling is disabled by default, in which case the timers and
+# counters do nothing. Use enable() (e.g., via the --profile flag of the
+# graphing scripts) to turn it on, and print_summary() to report the results.
+
+import collections
+import contextlib
+import cProfile
+import functools
+import os
+from os import path
+import resource
+import time
+
+# Whether to record stage timers and counters. Set by enable().
+ENABLED = False
+# The directory in which to store a cProfile dump for each pool task, or None
+# to not run cProfile. Set by enable().
+CPROFILE_DIR = None
+
+# Map of stage name to [number of calls, total seconds].
+_STAGES = collections.defaultdict(lambda: [0, 0.])
+# Map of counter name to value.
+_COUNTERS = collections.defaultdict(int)
+# The number of pool tasks that this process has run, used to name cProfile
+# dumps.
+_NUM_TASKS = [0]
+
+
+def enable(cprofile_dir=None):
+    """
+    Enables stage timers and counters. If "cprofile_dir" is not None, then each
+    pool task (see pool_map()) also stores a cProfile dump in that directory.
+    Must be called before creating any pools.
+    """
+    global ENABLED, CPROFILE_DIR
+    ENABLED = True
+    CPROFILE_DIR = cprofile_dir
+    if cprofile_dir is not None and not path.isdir(cprofile_dir):
+        os.makedirs(cprofile_dir)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Context manager that adds the time spent in its body to the stage "name".
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        stats = _STAGES[name]
+        stats[0] += 1
+        stats[1] += time.time() - start
+
+
+def timed(name):
+    """
+    Decorator that adds the time spent in each call of a function to the stage
+    "name".
+    """
+    def decorator(fnc):
+        @functools.wraps(fnc)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fnc(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, val=1):
+    """ Adds "val" to the counter "name". """
+    if ENABLED:
+        _COUNTERS[name] += val
+
+
+def get_stats():
+    """
+    Returns the stage timers and counters of this process as a tuple of the
+    form:
+        ({stage: [calls, seconds]}, {counter: value})
+    """
+    return dict(_STAGES), dict(_COUNTERS)
+
+
+def merge_stats(stats):
+    """ Adds stage timers and counters from get_stats() to this process's. """
+    stages, counters = stats
+    for name, (calls, secs) in stages.items():
+        _STAGES[name][0] += calls
+        _STAGES[name][1] += secs
+    for name, val in counters.items():
+        _COUNTERS[name] += val
+
+
+def _reset():
+    _STAGES.clear()
+    _COUNTERS.clear()
+
+
+class ProfiledTask(object):
+    """
+    Wraps a function that runs in a pool worker. Returns the function's result
+    along with the stage timers and counters that it recorded (or None if
+    profiling is disabled), and optionally stores a cProfile dump.
+    """
+
+    def __init__(self, fnc):
+        self.fnc = fnc
+
+    def __call__(self, args):
+        if not ENABLED:
+            return self.fnc(args), None
+        # Pool workers are reused, so only report this task's stats.
+        _reset()
+        if CPROFILE_DIR is None:
+            res = self.fnc(args)
+        else:
+            prf = cProfile.Profile()
+            res = prf.runcall(self.fnc, args)
+            prf.dump_stats(path.join(CPROFILE_DIR, "{}-{}.prof".format(
+                os.getpid(), _NUM_TASKS[0])))
+            _NUM_TASKS[0] += 1
+        return res, get_stats()
+
+
+def pool_map(pool, fnc, args):
+    """
+    Equivalent to pool.map(fnc, args), but merges the stage timers and counters
+    recorded by the workers into this process's.
+    """
+    results = pool.map(ProfiledTask(fnc), args)
+    for _, stats in results:
+        if stats is not None:
+            merge_stats(stats)
+    return [res for res, _ in results]
+
+
+def print_summary():
+    """
+    Prints the stage timers, counters, and peak memory usage. Times recorded
+    by pool workers are summed across workers, so they can exceed the wall
+    clock time.
+    """
+    if not ENABLED:
+        return
+    print("Profile:")
+    print("  {:<32} {:>8} {:>12}".format("stage", "calls", "seconds"))
+    for name, (calls, secs) in sorted(_STAGES.items(),
+                                      key=lambda item: -item[1][1]):
+        print("  {:<32} {:>8} {:>12.3f}".format(name, calls, secs))
+    for name, val in sorted(_COUNTERS.items()):
+        print("  {:<32} {:>21}".format(name, val))
+    # On Linux, ru_maxrss is in KB.
+    print("  {:<32} {:>18.1f} MB".format(
+        "peak RSS", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.))
+    print("  {:<32} {:>18.1f} MB".format(
+        "peak RSS (workers)",
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.))
+    if CPROFILE_DIR is not None:
+        print("  cProfile dumps: {}".format(CPROFILE_DIR))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#
+# A content-addressed cache of analysis results that is shared by the graphing
+# scripts. Each result is stored in its own file, named by a hash of the
+# identities of the input files that it was computed from, the version of the
+# parser that computed it, and its parameters. Therefore, a result is reused by
+# every script that asks for the same analysis of the same files, and goes
+# stale as soon as any of those change. Entries are loaded individually, only
+# when requested, and the least recently used entries are evicted once the
+# cache exceeds a maximum size.
+
+import cPickle
+import hashlib
+import os
+from os import path
+
+# The default directory in which to store results.
+RESULT_CACHE_DIR = path.join(path.expanduser("~"), ".cache", "etalon",
+                             "results")
+# The default maximum total size of the cached results, in MB.
+RESULT_CACHE_MAX_MB = 4096
+# The extension of the files that store results.
+RESULT_EXT = ".pkl"
+
+
+def get_file_id(fln):
+    """
+    Returns the identity of a file: its absolute path, size, and modification
+    time. A file with the same identity is assumed to have the same contents.
+    """
+    stat = os.stat(fln)
+    return path.realpath(fln), stat.st_size, stat.st_mtime
+
+
+def get_key(name, version, flns, **params):
+    """
+    Returns the key of the result of the analysis "name" (at version "version")
+    of the files "flns" with the parameters "params". Parameters must have
+    deterministic reprs (e.g., numbers, strings, and tuples).
+    """
+    sha = hashlib.sha1()
+    sha.update(repr((name, version)))
+    for fln in flns:
+        sha.update(repr(get_file_id(fln)))
+    sha.update(repr(sorted(params.items())))
+    return sha.hexdigest()
+
+
+class ResultCache(object):
+    """
+    A directory of results, keyed by get_key(). Writes are atomic, so the cache
+    may be used by several processes at once.
+    """
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR,
+                 max_mb=RESULT_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_byts = max_mb * 2**20
+        if not path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # Another process may have created it first.
+                assert path.isdir(cache_dir), \
+                    "Unable to create cache dir: {}".format(cache_dir)
+
+    def _get_path(self, key):
+        return path.join(self.cache_dir, key + RESULT_EXT)
+
+    def get(self, key):
+        """ Returns the result stored under "key", or None if there is none. """
+        fln = self._get_path(key)
+        try:
+            with open(fln, "rb") as fil:
+                res = cPickle.load(fil)
+        except IOError:
+            return None
+        except (EOFError, cPickle.UnpicklingError, ValueError) as exc:
+            print("Warning: Unable to read cached result {}: {}".format(
+                fln, exc))
+            return None
+        # Record the access, which determines the eviction order.
+        try:
+            os.utime(fln, None)
+        except OSError:
+            # The entry was evicted by another process.
+            pass
+        return res
+
+    def put(self, key, res):
+        """
+        Stores "res" under "key", then evicts the least recently used entries
+        until the cache fits within its maximum size.
+        """
+        fln = self._get_path(key)
+        # Write to a temporary file first so that concurrent readers never see
+        # a partially-written result.
+        tmp_fln = "{}.{}.tmp".format(fln, os.getpid())
+        try:
+            with open(tmp_fln, "wb") as fil:
+                cPickle.dump(res, fil, protocol=2)
+            os.rename(tmp_fln, fln)
+        except (IOError, OSError) as exc:
+            print("Warning: Unable to write cached result {}: {}".format(
+                fln, exc))
+            if path.exists(tmp_fln):
+                os.remove(tmp_fln)
+            return
+        self.evict(keep=fln)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries, other than the file "keep",
+        until the cache fits within its maximum size.
+        """
+        entries = []
+        for entry in os.listdir(self.cache_dir):
+            if not entry.endswith(RESULT_EXT):
+                continue
+            fln = path.join(self.cache_dir, entry)
+            try:
+                stat = os.stat(fln)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fln))
+        total_byts = sum(size for _, size, _ in entries)
+        # Oldest first.
+        for _, size, fln in sorted(entries):
+            if total_byts <= self.max_byts:
+                break
+            if fln == keep:
+                continue
+            try:
+                os.remove(fln)
+                print("Evicted cached result: {}".format(fln))
+            except OSError:
+                pass
+            total_byts -= size